@@ -1,27 +1,49 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, has_app_context, has_request_context, abort
 import uuid
-from flask_session import Session
 from functools import wraps
 from datetime import timedelta
-from flask_bcrypt import Bcrypt
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from PIL import Image
 from io import BytesIO
 from flask import send_from_directory
 import sqlite3
 import os
+import numpy as np
 from datetime import datetime
+from opencv_face_recognition import (extract_face_features_opencv, compare_faces_opencv_batch,
+                                     get_face_features_from_db_opencv)
+from face_index import get_face_index, unindex_child
+from enrollment_queue import enqueue_enrollment
+from migrations import ensure_schema
+from role_cache import role_cache
+from password_hashing import hasher, HashingBusy, hash_stats
+from probe_cache import probe_cache_stats
+from sessions import init_session
+from photo_ingest import normalize_photo, remove_derivatives, resize_photo, canonical_path
+from upload_stream import StreamingRequest, upload_buffer, upload_digest, save_upload
+import db
+import metrics
+import profiling
+import upload_serving
+from db import get_db, db_connection
 
 app = Flask(__name__)
+app.request_class = StreamingRequest  # Uploads are spooled and hashed as they stream in
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production-' + str(uuid.uuid4()))
-app.config['SESSION_TYPE'] = 'filesystem'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)  # Extended session timeout
-Session(app)
-bcrypt = Bcrypt(app)
+init_session(app)  # SQLite sessions by default, see CHILDSAFE_SESSION_BACKEND
+db.init_app(app)
+metrics.init_app(app)  # Per-request timings, JSON request log and /metrics
+metrics.metrics.register_collector('probe_cache', probe_cache_stats)
+metrics.metrics.register_collector('password_hashing', hash_stats)
+metrics.metrics.register_collector('role_cache', role_cache.stats)
+app.config['PROFILING'] = profiling.PROFILING_ENABLED
+profiling.init_app(app)  # Saves a cProfile dump of slow requests when enabled
+upload_serving.init_app(app)  # X-Sendfile/X-Accel-Redirect hand-off, see CHILDSAFE_SENDFILE
 
 #Database configuration and folder
-app.config['DATABASE'] = 'child_registry.db'
+app.config['DATABASE'] = db.DATABASE
 UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
@@ -29,6 +51,10 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Face search settings
+SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', 70))
+SEARCH_CANDIDATES = 5
+
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -38,63 +64,59 @@ def create_upload_folder():
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
 
-def create_face_encodings_column():
-    """Add face_encoding column to children table if it doesn't exist."""
+def create_database_schema():
+    """Apply any pending schema migrations (a single version check when current)."""
     try:
-        conn = sqlite3.connect('child_registry.db')
-        cursor = conn.cursor()
-        
-        # Check if face_encoding column exists
-        cursor.execute("PRAGMA table_info(children)")
-        columns = cursor.fetchall()
-        column_names = [column[1] for column in columns]
-        
-        if 'face_encoding' not in column_names:
-            cursor.execute('ALTER TABLE children ADD COLUMN face_encoding TEXT')
-            conn.commit()
-        
-        conn.close()
+        with db_connection() as conn:
+            ensure_schema(conn)
     except Exception as e:
-        print(f"Error creating face_encoding column: {str(e)}")
+        print(f"Error migrating database schema: {str(e)}")
 
 # Initialize upload folder and database
 create_upload_folder()
-create_face_encodings_column()
+create_database_schema()
 
 # Dummy database functions and authentication functions
 
 def add_user(username, password, is_admin=False):
-    password_hash = generate_password_hash(password)
-    conn = sqlite3.connect('child_registry.db')
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)',
-                   (username, password_hash, is_admin))
-    conn.commit()
-    conn.close()
+    password_hash = hasher.hash(password)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)',
+                       (username, password_hash, is_admin))
+        conn.commit()
+
+def set_user_admin(user_id, admin):
+    # Bumping role_version makes every worker and session re-read this user's role
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE users SET is_admin = ?, role_version = role_version + 1 WHERE id = ?',
+                       (1 if admin else 0, user_id))
+        conn.commit()
+    _forget_role_versions()
 
 def promote_user_to_admin(user_id):
-    conn = sqlite3.connect('child_registry.db')
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    set_user_admin(user_id, True)
 
 def demote_admin_to_user(user_id):
-    conn = sqlite3.connect('child_registry.db')
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET is_admin = 0 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    set_user_admin(user_id, False)
 
 def authenticate(username, password):
-    conn = sqlite3.connect('child_registry.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT password_hash FROM users WHERE username = ?', (username,))
-    user_data = cursor.fetchone()
-    conn.close()
-    if user_data and check_password_hash(user_data[0], password):
-        return True
-    return False
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT password_hash FROM users WHERE username = ?', (username,))
+        user_data = cursor.fetchone()
+    if not user_data:
+        return False
+    # Raises HashingBusy when too many logins are being checked at once
+    matched, new_hash = hasher.verify_and_update(user_data[0], password)
+    if new_hash:
+        # Upgrade hashes made with an older cost or scheme
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE users SET password_hash = ? WHERE username = ?', (new_hash, username))
+            conn.commit()
+    return matched
 
 # User Authentication
 def login_required(f):
@@ -109,62 +131,155 @@ def login_required(f):
 
     return wrap
 
+def _role_version(username):
+    """User's role_version (None if there is no such user), read once per request."""
+    versions = g.setdefault('role_versions', {}) if has_app_context() else {}
+    if username not in versions:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT role_version FROM users WHERE username = ?', (username,))
+            user_data = cursor.fetchone()
+        versions[username] = user_data[0] if user_data else None
+    return versions[username]
+
+def _forget_role_versions():
+    if has_app_context():
+        g.pop('role_versions', None)
+
+def _session_role(username, version):
+    """Role remembered in the session, if it is for this user at this role_version."""
+    if not has_request_context():
+        return None
+    cached = session.get('role_cache')
+    if cached and cached['username'] == username and cached.get('version') == version:
+        return cached['is_admin']
+    return None
+
+def _remember_session_role(username, admin, version):
+    """Keep the logged-in user's role in the session payload."""
+    if has_request_context() and session.get('username') == username:
+        cached = session.get('role_cache')
+        if cached != {'username': username, 'is_admin': admin, 'version': version}:
+            session['role_cache'] = {'username': username, 'is_admin': admin, 'version': version}
+
 def is_admin(username):
-    conn = sqlite3.connect('child_registry.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT is_admin FROM users WHERE username = ?', (username,))
-    user_data = cursor.fetchone()
-    conn.close()
-    if user_data and user_data[0] == 1:
-        return True
-    return False
+    # Session payload first, then this worker's cache, then the database;
+    # all three are only trusted at the user's current role_version
+    version = _role_version(username)
+    if version is None:
+        return False
+    admin = _session_role(username, version)
+    if admin is not None:
+        return admin
+    admin = role_cache.get(username, version)
+    if admin is None:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT is_admin, role_version FROM users WHERE username = ?', (username,))
+            user_data = cursor.fetchone()
+        if not user_data:
+            return False
+        admin, version = user_data[0] == 1, user_data[1]
+        role_cache.put(username, admin, version)
+    _remember_session_role(username, admin, version)
+    return admin
 
 def retrieve_child_info(huduma_number):
-    conn = sqlite3.connect('child_registry.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM children WHERE huduma_number = ?', (huduma_number,))
-    child = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM children WHERE huduma_number = ?', (huduma_number,))
+        child = cursor.fetchone()
     return child
 
+def child_row_to_dict(child):
+    """Map a children table row to the fields used by the templates."""
+    return {
+        'first_name': child[1],
+        'last_name': child[2],
+        'huduma_number': child[3],
+        'date_of_birth': child[4],
+        'gender': child[5],
+        'mother_first_name': child[6],
+        'mother_last_name': child[7],
+        'father_first_name': child[8],
+        'father_last_name': child[9],
+        'mother_contact': child[10],
+        'father_contact': child[11],
+        'county': child[12],
+        'sub_county': child[13],
+        'ward': child[14],
+        'picture_filename': child[15],
+        'encoding_status': child[17],
+    }
+
+def save_child_photo(photo):
+    """Save an uploaded child photo under a unique, timestamped name, plus its canonical image."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = secure_filename(photo.filename)
+    name, ext = os.path.splitext(filename)
+    photo_name = f"{name}_{timestamp}{ext}"
+    save_upload(photo, os.path.join(app.config['UPLOAD_FOLDER'], photo_name))
+    normalize_photo(app.config['UPLOAD_FOLDER'], photo_name)
+    return photo_name
+
+def remove_child_photo(photo_name):
+    """Delete a saved photo and its derivatives."""
+    photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_name)
+    if os.path.exists(photo_path):
+        os.remove(photo_path)
+    remove_derivatives(app.config['UPLOAD_FOLDER'], photo_name)
+
 def reset_user_password(username, new_password):
-    password_hash = generate_password_hash(new_password)
-    conn = sqlite3.connect('child_registry.db')
+    password_hash = hasher.hash(new_password)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE users SET password_hash = ? WHERE username = ?', (password_hash, username))
+        conn.commit()
+
+# Check if there's no admin
+with db_connection() as conn:
     cursor = conn.cursor()
-    cursor.execute('UPDATE users SET password_hash = ? WHERE username = ?', (password_hash, username))
-    conn.commit()
-    conn.close()
-
-# Connect to the database and create users table if not exists
-conn = sqlite3.connect('child_registry.db')
-cursor = conn.cursor()
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        is_admin INTEGER NOT NULL DEFAULT 0
-    )
-''')
-conn.commit()
-
-# Check if there's no admin, create one
-cursor.execute('SELECT COUNT(*) FROM users WHERE is_admin = 1')
-admin_count = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(*) FROM users WHERE is_admin = 1')
+    admin_count = cursor.fetchone()[0]
+
+# Create one if there isn't
 if admin_count == 0:
     default_admin_username = 'admin'
     default_admin_password = 'admin_password'  # You should set a strong password here
     add_user(default_admin_username, default_admin_password, is_admin=True)
 
-conn.close()
-
 @app.route('/')
 def landing_page():
     return render_template('modern_landing.html')
 
+def send_photo(path):
+    """Send a file from the upload folder with caching headers, or 404."""
+    if not path or not os.path.isfile(path):
+        abort(404)
+    return upload_serving.send_upload(path, app.config['UPLOAD_FOLDER'])
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Uploaded photo, or with ?w= a rendition of it at one of the allowed widths."""
+    upload_folder = app.config['UPLOAD_FOLDER']
+    path = safe_join(upload_folder, filename)
+    if not path or not os.path.isfile(path):
+        abort(404)
+    width = upload_serving.pick_width(request.args.get('w', type=int))
+    if width:
+        path = resize_photo(upload_folder, filename, width) or path
+    return send_photo(path)
+
+@app.route('/uploads/canonical/<filename>')
+def uploaded_canonical(filename):
+    """Canonical image of an uploaded photo, created on first use for older uploads."""
+    upload_folder = app.config['UPLOAD_FOLDER']
+    filename = secure_filename(filename)
+    path = canonical_path(upload_folder, filename)
+    if not os.path.exists(path):
+        if not os.path.exists(os.path.join(upload_folder, filename)) or not normalize_photo(upload_folder, filename):
+            return send_photo(safe_join(upload_folder, filename))
+    return send_photo(path)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -176,11 +291,9 @@ def register():
             return render_template('register.html', error='Username and password are required.')
         
         # Check if username already exists
-        conn = sqlite3.connect('child_registry.db')
-        cursor = conn.cursor()
+        cursor = get_db().cursor()
         cursor.execute('SELECT username FROM users WHERE username = ?', (username,))
         existing_user = cursor.fetchone()
-        conn.close()
         
         if existing_user:
             return render_template('register.html', error='Username already exists. Please choose a different username.')
@@ -198,11 +311,14 @@ def register():
 def delete_child():
     if 'username' in session and is_admin(session['username']):
         huduma_number = request.form.get('huduma_number')
-        conn = sqlite3.connect('child_registry.db')
+        conn = get_db()
         cursor = conn.cursor()
+        cursor.execute('SELECT id FROM children WHERE huduma_number = ?', (huduma_number,))
+        child = cursor.fetchone()
         cursor.execute('DELETE FROM children WHERE huduma_number = ?', (huduma_number,))
         conn.commit()
-        conn.close()
+        if child:
+            unindex_child(child[0])
         flash('Child deleted successfully.', 'success')
         return redirect(url_for('admin_dashboard'))
     else:
@@ -227,10 +343,16 @@ def login():
             if is_admin(username):  # Check if the user is not an admin
                 return render_template('login.html', error='Invalid credentials for user role.')
 
+        try:
+            authenticated = authenticate(username, password)
+        except HashingBusy:
+            return render_template('login.html', error='Too many sign-ins right now. Please try again in a moment.'), 503
+
         # Authentication successful, proceed to dashboard based on the role
-        if authenticate(username, password):
+        if authenticated:
             session['username'] = username
             session['role'] = role  # Set the role in the session
+            _remember_session_role(username, role == 'admin', _role_version(username))  # Verified by is_admin above
             if role == 'admin':
                 return redirect(url_for('admin_dashboard'))
             else:
@@ -251,11 +373,15 @@ def reset_password():
             flash('Username and new password are required.', 'error')
             return redirect(url_for('reset_password'))
 
-        if authenticate(username, new_password):
-            flash('New password must be different from the old one.', 'error')
-            return redirect(url_for('reset_password'))
+        try:
+            if authenticate(username, new_password):
+                flash('New password must be different from the old one.', 'error')
+                return redirect(url_for('reset_password'))
 
-        reset_user_password(username, new_password)
+            reset_user_password(username, new_password)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return redirect(url_for('reset_password'))
         flash('Password reset successfully. Please log in with your new password.', 'success')
         return redirect(url_for('login'))
 
@@ -307,11 +433,9 @@ def user_dashboard():
 def update_child():
     if request.method == 'POST':
         huduma_number = request.form.get('huduma_number')
-        conn = sqlite3.connect('child_registry.db')
-        cursor = conn.cursor()
+        cursor = get_db().cursor()
         cursor.execute("SELECT * FROM children WHERE huduma_number = ?", (huduma_number,))
         child = cursor.fetchone()
-        conn.close()
         if child:
             return render_template('update_child.html', child=child)
         else:
@@ -330,7 +454,7 @@ def update_child_submit():
         'gender': request.form.get('gender'),
         # Include other fields as needed
     }
-    conn = sqlite3.connect('child_registry.db')
+    conn = get_db()
     cursor = conn.cursor()
     # Update child's information in the database
     cursor.execute("""
@@ -339,7 +463,21 @@ def update_child_submit():
         WHERE huduma_number=?
     """, (updated_info['first_name'], updated_info['last_name'], updated_info['dob'], updated_info['gender'], huduma_number))
     conn.commit()
-    conn.close()
+
+    # A new photo replaces the child's face encoding
+    photo = request.files.get('photo')
+    if photo and photo.filename != '' and allowed_file(photo.filename):
+        cursor.execute("SELECT id, picture FROM children WHERE huduma_number = ?", (huduma_number,))
+        child = cursor.fetchone()
+        if child:
+            old_photo_name = child[1]
+            photo_name = save_child_photo(photo)
+            cursor.execute("UPDATE children SET picture = ? WHERE id = ?", (photo_name, child[0]))
+            # Commits the new picture along with the job
+            enqueue_enrollment(conn, child[0], os.path.join(app.config['UPLOAD_FOLDER'], photo_name))
+            # The replaced photo and its canonical image and renditions are no longer referenced
+            if old_photo_name and old_photo_name != photo_name:
+                remove_child_photo(old_photo_name)
     flash('Child information updated successfully.', 'success')
     return redirect(url_for('user_dashboard'))
 
@@ -358,30 +496,15 @@ def retrieve_child_information():
         # Construct the file path for the child photo
         picture_filename = child[15]  # Assuming the picture filename is stored in the 16th column
         if picture_filename:
-            picture_path = os.path.join(app.config['UPLOAD_FOLDER'], picture_filename)
+            picture_path = url_for('uploaded_canonical', filename=picture_filename)
         else:
             # If no photo is available, use a placeholder image or display a message
             picture_path = None  # Set to None or provide a default image path
 
         # Render the child information page with the retrieved data
-        return render_template('child_information.html', child={
-            'first_name': child[1],
-            'last_name': child[2],
-            'huduma_number': child[3],
-            'date_of_birth': child[4],
-            'gender': child[5],
-            'mother_first_name': child[6],
-            'mother_last_name': child[7],
-            'father_first_name': child[8],
-            'father_last_name': child[9],
-            'mother_contact': child[10],
-            'father_contact': child[11],
-            'county': child[12],
-            'sub_county': child[13],
-            'ward': child[14],
-            'picture_filename': child[15],
-            'picture_path': picture_path  # Pass the picture_path variable to the template
-        })
+        child_info = child_row_to_dict(child)
+        child_info['picture_path'] = picture_path  # Pass the picture_path variable to the template
+        return render_template('child_information.html', child=child_info)
     else:
         flash('Child not found', 'danger')
         return redirect(url_for('admin_dashboard'))
@@ -409,9 +532,42 @@ def search_lost_child():
         flash("Please upload a valid image file (PNG, JPG, JPEG, GIF).", 'danger')
         return redirect(url_for('admin_dashboard' if role == 'admin' else 'user_dashboard'))
     
-    # For now, without face recognition, we'll just show a message
-    flash("Photo uploaded successfully! Face recognition feature requires additional setup. Please check the README for installation instructions.", 'info')
-    flash("For now, you can manually search for children using the 'Retrieve Child Information' feature.", 'info')
+    # Decode straight from the spooled upload, reusing the hash taken while it streamed in
+    with upload_buffer(lost_child_photo) as photo_data:
+        probe = extract_face_features_opencv(photo_data, digest=upload_digest(lost_child_photo))
+    if probe is None:
+        flash("No face could be detected in the uploaded photo. Please try a clearer, front-facing photo.", 'danger')
+        return redirect(url_for('admin_dashboard' if role == 'admin' else 'user_dashboard'))
+
+    # Shortlist candidates from the in-memory index, then score only those
+    conn = get_db()
+    candidates = get_face_index(conn).search(probe, k=SEARCH_CANDIDATES)
+
+    best_child_id = None
+    best_similarity = 0
+    # Score every shortlisted candidate in one batched comparison
+    stored = [(child_id, get_face_features_from_db_opencv(child_id, conn)) for child_id, _ in candidates]
+    stored = [(child_id, features) for child_id, features in stored
+              if features is not None and len(features) == len(probe)]
+    if stored:
+        scores = compare_faces_opencv_batch(probe, np.stack([features for _, features in stored]))
+        if scores is not None:
+            best = int(np.argmax(scores))
+            best_child_id, best_similarity = stored[best][0], float(scores[best])
+
+    child = None
+    if best_child_id is not None and best_similarity >= SIMILARITY_THRESHOLD:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM children WHERE id = ?', (best_child_id,))
+        child = cursor.fetchone()
+
+    if child:
+        child_info = child_row_to_dict(child)
+        child_info['similarity'] = best_similarity
+        return render_template('match_details.html', child=child_info)
+
+    flash("No matching child was found in the registry.", 'info')
+    flash("You can also search manually using the 'Retrieve Child Information' feature.", 'info')
     
     # Redirect to the appropriate dashboard based on user role
     return redirect(url_for('admin_dashboard' if role == 'admin' else 'user_dashboard'))
@@ -453,22 +609,15 @@ def register_child():
         if 'photo' in request.files:
             photo = request.files['photo']
             if photo.filename != '' and allowed_file(photo.filename):
-                # Generate unique filename with timestamp
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = secure_filename(photo.filename)
-                name, ext = os.path.splitext(filename)
-                photo_name = f"{name}_{timestamp}{ext}"
-                
-                # Save the file locally
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_name)
-                photo.save(photo_path)
+                # Save the file locally under a unique, timestamped name
+                photo_name = save_child_photo(photo)
             elif photo.filename != '':
                 flash('Invalid file type. Please upload PNG, JPG, JPEG, or GIF files only.', 'error')
                 return render_template('child_registration.html')
 
         try:
             # Insert child data into the database
-            conn = sqlite3.connect('child_registry.db')
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO children (first_name, last_name, huduma_number, dob, gender,
@@ -482,23 +631,22 @@ def register_child():
             
             child_id = cursor.lastrowid
             conn.commit()
-            conn.close()
+            
+            # Encoding runs in the enrollment workers, off the request path
+            if photo_name:
+                enqueue_enrollment(conn, child_id, os.path.join(app.config['UPLOAD_FOLDER'], photo_name))
             
             flash('Child registered successfully!', 'success')
             
         except sqlite3.IntegrityError:
             flash('A child with this Huduma number already exists.', 'error')
             if photo_name:
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_name)
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
+                remove_child_photo(photo_name)
             return render_template('child_registration.html')
         except Exception as e:
             flash(f'An error occurred during registration: {str(e)}', 'error')
             if photo_name:
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_name)
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
+                remove_child_photo(photo_name)
             return render_template('child_registration.html')
 
         if is_admin(session['username']):
@@ -508,9 +656,44 @@ def register_child():
 
     return render_template('child_registration.html')
 
+@app.route('/admin/profiles', methods=['GET', 'POST'])
+def admin_profiles():
+    if not app.config['PROFILING']:
+        abort(404)
+    if 'username' not in session or not is_admin(session['username']):
+        flash('You are not authorized to perform this action.', 'error')
+        return redirect(url_for('login'))
+
+    if request.method == 'POST':
+        try:
+            seconds = float(request.form.get('seconds', 10))
+        except ValueError:
+            seconds = 10
+        name = profiling.start_sampling(seconds)
+        if name:
+            flash(f'Sampling this worker for {seconds:g} seconds; the result will be saved as {name}.', 'success')
+        else:
+            flash('A sampling run is already in progress.', 'warning')
+        return redirect(url_for('admin_profiles'))
+
+    return render_template('profiles.html', profiles=profiling.store.list(),
+                           threshold=profiling.SLOW_REQUEST_SECONDS, max_seconds=profiling.MAX_SAMPLE_SECONDS)
+
+@app.route('/admin/profiles/<name>')
+def download_profile(name):
+    if not app.config['PROFILING']:
+        abort(404)
+    if 'username' not in session or not is_admin(session['username']):
+        flash('You are not authorized to perform this action.', 'error')
+        return redirect(url_for('login'))
+    if not profiling.store.contains(name):
+        abort(404)
+    return send_from_directory(os.path.abspath(profiling.store.directory), name, as_attachment=True)
+
 @app.route('/logout')
 def logout():
     session.pop('username', None)
+    session.pop('role_cache', None)
     return redirect(url_for('landing_page'))
 
 if __name__ == '__main__':
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark: batched vs scalar OpenCV face comparison
+Scores one probe against N registered encodings both ways and reports throughput
+"""
+
+import argparse
+import time
+import numpy as np
+from opencv_face_recognition import compare_faces_opencv, compare_faces_opencv_batch
+
+# Length of the vectors produced by extract_face_features_opencv
+FEATURE_LENGTH = 256 + 256 + 64 * 64 + 32 * 32 + 32 * 32
+
+def make_encodings(n, dim, seed=0):
+    """Random non-negative, L2-normalised encodings like the OpenCV features."""
+    rng = np.random.default_rng(seed)
+    encodings = rng.random((n, dim)).astype(np.float32)
+    encodings /= np.linalg.norm(encodings, axis=1, keepdims=True)
+    return encodings
+
+def time_call(func, repeat):
+    """Best wall-clock time of func over repeat runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--candidates', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--dim', type=int, default=FEATURE_LENGTH)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print("🏁 compare_faces_opencv: scalar loop vs batch")
+    print(f"Feature length: {args.dim}")
+    print(f"{'N':>8} {'scalar/s':>12} {'batch/s':>12} {'speedup':>9} {'max diff':>10}")
+
+    for n in args.candidates:
+        encodings = make_encodings(n + 1, args.dim)
+        probe, candidates = encodings[0], encodings[1:]
+
+        scalar_scores = []
+        scalar_time = time_call(lambda: scalar_scores.__setitem__(
+            slice(None), [compare_faces_opencv(probe, c) for c in candidates]), args.repeat)
+        batch_scores = None
+        batch_time = time_call(lambda: compare_faces_opencv_batch(probe, candidates), args.repeat)
+        batch_scores = compare_faces_opencv_batch(probe, candidates)
+
+        max_diff = np.abs(np.array(scalar_scores) - batch_scores).max()
+        print(f"{n:>8} {n / scalar_time:>12,.0f} {n / batch_time:>12,.0f} "
+              f"{scalar_time / batch_time:>8.1f}x {max_diff:>10.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark: temp-file round-trip vs in-memory decode for uploaded photos
+Measures the per-request I/O the DeepFace path saved by passing ndarrays,
+separately from the time saved by reduced-resolution JPEG decoding
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+from image_io import load_image
+from test_face_matching import create_test_face_image
+
+def make_upload(size, quality=90):
+    """JPEG bytes of a synthetic face photo, like a search upload."""
+    image = cv2.resize(create_test_face_image(), (size, size))
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+def temp_file_round_trip(data):
+    """The old path: write bytes to a temp file, let the reader decode it, unlink."""
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
+    temp_file.write(data)
+    temp_file.close()
+    try:
+        return cv2.imread(temp_file.name)
+    finally:
+        os.unlink(temp_file.name)
+
+def in_memory(data):
+    """The new path without downscaling: decode the bytes in memory at full resolution."""
+    return load_image(data, target_size=None)
+
+def in_memory_reduced(data):
+    """The new path as search uploads use it: in memory, at reduced resolution."""
+    return load_image(data)
+
+def time_call(func, data, repeat):
+    """Mean wall-clock time of func(data) over repeat runs, after one warm-up."""
+    func(data)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(data)
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[640, 1600, 4000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--verify', action='store_true',
+                        help="Count two images per request, as verify_faces_deepface decodes")
+    args = parser.parse_args()
+
+    images_per_request = 2 if args.verify else 1
+    print("🏁 DeepFace input path: temp file vs in-memory decode")
+    print("   I/O saved compares full-resolution decodes; downscale saved is the reduced decode on top")
+    print(f"{'size':>6} {'bytes':>10} {'temp file ms':>13} {'in-memory ms':>13} {'I/O saved':>10} "
+          f"{'reduced ms':>11} {'downscale saved':>16}")
+
+    for size in args.sizes:
+        data = make_upload(size)
+        old = time_call(temp_file_round_trip, data, args.repeat) * images_per_request
+        new = time_call(in_memory, data, args.repeat) * images_per_request
+        reduced = time_call(in_memory_reduced, data, args.repeat) * images_per_request
+        print(f"{size:>6} {len(data):>10,} {old * 1000:>13.2f} {new * 1000:>13.2f} {(old - new) * 1000:>10.2f} "
+              f"{reduced * 1000:>11.2f} {(new - reduced) * 1000:>16.2f}")
+
+if __name__ == "__main__":
+    main()
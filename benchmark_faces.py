@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Benchmark: face recognition pipeline, stage by stage
+Times decode, detection, feature extraction, encoding I/O and 1:N search on a
+corpus of identities with several shots each, and reports throughput,
+p50/p99 latency, peak RSS and TAR/FAR per backend as a table and JSON.
+Each backend runs in its own process, so its peak RSS is its own.
+
+Usage:
+    python benchmark_faces.py --identities 50 --shots 4 --output run.json
+    python benchmark_faces.py --corpus photos/ --backends opencv deepface
+    python benchmark_faces.py --compare baseline.json --output run.json
+
+A real corpus is a directory with one sub-directory of photos per identity.
+The first shot of each identity is enrolled; the others are probes.
+
+The synthetic corpus only exercises timing: the OpenCV pipeline cannot tell
+its drawn faces apart (rank-1 near chance, every score above the threshold),
+so accuracy is reported but not checked for regressions on synthetic runs,
+nor on any run whose rank-1 is not well above chance.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from benchmark_compare_faces import make_encodings
+from encoding_codec import encode_encoding, decode_encoding
+from face_index import FaceIndex
+from image_io import load_image
+from opencv_face_recognition import (MODEL_NAME, detect_faces_dnn, extract_face_features_with_box_opencv,
+                                     compare_faces_opencv_batch)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BACKENDS = ['opencv', 'deepface']
+STAGES = ['decode', 'detect', 'extract', 'encoding_write', 'encoding_read', 'search']
+SEARCH_CANDIDATES = 5
+# Accuracy is only compared between runs when rank-1 reaches this many times
+# chance (1 / enrolled identities), and at least RANK1_MIN
+RANK1_OVER_CHANCE = 5
+RANK1_MIN = 0.5
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+def draw_face(identity_rng, shot_rng, size=240):
+    """
+    Draw one shot of a synthetic identity.
+
+    The identity fixes skin tone, eye spacing and size, brows, nose and
+    mouth; each shot adds a small shift, rotation, lighting change and noise.
+    """
+    p = identity_rng
+    img = np.full((size, size, 3), int(p.integers(60, 120)), np.uint8)
+    center = size // 2
+    skin = tuple(int(c) for c in p.integers(120, 230, 3))
+    eye_dx, eye_dy, eye_r = int(p.integers(18, 30)), int(p.integers(18, 32)), int(p.integers(6, 12))
+    brow_tilt, nose_len = int(p.integers(-8, 9)), int(p.integers(15, 30))
+    mouth_w, mouth_y = int(p.integers(15, 30)), int(p.integers(32, 48))
+
+    cv2.ellipse(img, (center, center), (int(p.integers(62, 76)), int(p.integers(80, 95))), 0, 0, 360, skin, -1)
+    for side in (-1, 1):
+        eye = (center + side * eye_dx, center - eye_dy)
+        cv2.ellipse(img, eye, (eye_r + 6, eye_r), 0, 0, 360, (240, 240, 240), -1)
+        cv2.circle(img, eye, eye_r - 2, (40, 40, 40), -1)
+        cv2.line(img, (eye[0] - 12, eye[1] - 14 - side * brow_tilt // 2),
+                 (eye[0] + 12, eye[1] - 14 + side * brow_tilt // 2), (30, 30, 30), 3)
+    cv2.line(img, (center, center - 10), (center, center - 10 + nose_len), (80, 80, 80), 2)
+    cv2.ellipse(img, (center, center + mouth_y), (mouth_w, 8), 0, 0, 180, (60, 60, 120), 3)
+
+    s = shot_rng
+    matrix = cv2.getRotationMatrix2D((center, center), float(s.uniform(-3, 3)), 1.0)
+    matrix[:, 2] += s.integers(-4, 5, 2)
+    img = cv2.warpAffine(img, matrix, (size, size), borderMode=cv2.BORDER_REPLICATE)
+    img = cv2.convertScaleAbs(img, alpha=float(s.uniform(0.85, 1.15)), beta=float(s.uniform(-15, 15)))
+    noise = s.normal(0, 4, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+def synthetic_corpus(identities, shots, seed=0):
+    """
+    Generate JPEG shots of synthetic identities.
+
+    Returns:
+    - List of (identity, jpeg bytes)
+    """
+    corpus = []
+    for identity in range(identities):
+        for shot in range(shots):
+            img = draw_face(np.random.default_rng([seed, identity]), np.random.default_rng([seed, identity, shot]))
+            ok, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            corpus.append((f"synthetic-{identity}", jpeg.tobytes()))
+    return corpus
+
+def load_corpus(directory):
+    """
+    Read a corpus with one sub-directory of photos per identity.
+
+    Returns:
+    - List of (identity, file bytes), in name order
+    """
+    corpus = []
+    for identity in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, identity)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(folder, name), 'rb') as f:
+                    corpus.append((identity, f.read()))
+    return corpus
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (never goes down)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def summarize(seconds):
+    """Throughput and latency percentiles of per-item timings."""
+    if not seconds:
+        return {'count': 0}
+    times = np.array(seconds)
+    total = float(times.sum())
+    return {
+        'count': len(times),
+        'per_sec': len(times) / total if total else 0.0,
+        'mean_ms': float(times.mean() * 1000),
+        'p50_ms': float(np.percentile(times, 50) * 1000),
+        'p99_ms': float(np.percentile(times, 99) * 1000),
+    }
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def opencv_backend(threshold):
+    """Functions of the OpenCV-LBP pipeline; scores are similarity percentages."""
+    def extract(image):
+        result = extract_face_features_with_box_opencv(image)
+        return result[0] if result is not None else None
+
+    def search(probe, index, gallery):
+        # As the search route does: shortlist with the index, re-rank with the full metric
+        candidates = index.search(probe, k=SEARCH_CANDIDATES)
+        if not candidates:
+            return None
+        rows = gallery[[child_id for child_id, _ in candidates]]
+        scores = compare_faces_opencv_batch(probe, rows)
+        return candidates[int(np.argmax(scores))][0]
+
+    return {
+        'model': MODEL_NAME,
+        'normalized': True,
+        'detect': detect_faces_dnn,
+        'extract': extract,
+        'scores': compare_faces_opencv_batch,
+        'threshold': threshold,
+        'search': search,
+        'distractors': lambda n, dim: make_encodings(n, dim, seed=1),
+    }
+
+def deepface_backend(model_name):
+    """Functions of a DeepFace model; scores are negated distances."""
+    from deepface import DeepFace
+    from deepface_recognition import (DETECTOR_BACKEND, extract_face_encoding_deepface,
+                                      embedding_distances, find_threshold_deepface)
+
+    def detect(image):
+        try:
+            faces = DeepFace.extract_faces(img_path=image, detector_backend=DETECTOR_BACKEND,
+                                           enforce_detection=True, align=True)
+        except ValueError:
+            return []
+        return [face['facial_area'] for face in faces]
+
+    def search(probe, index, gallery):
+        # verify_against_registry_deepface compares against every stored embedding
+        return int(np.argmin(embedding_distances(probe, gallery)))
+
+    def distractors(n, dim):
+        return np.random.default_rng(1).normal(size=(n, dim)).astype(np.float32)
+
+    return {
+        'model': model_name,
+        'normalized': False,
+        'detect': detect,
+        'extract': lambda image: extract_face_encoding_deepface(image, model_name),
+        'scores': lambda probe, gallery: -embedding_distances(probe, gallery),
+        'threshold': -find_threshold_deepface(model_name),
+        'search': search,
+        'distractors': distractors,
+    }
+
+def run_backend(backend, corpus, distractors):
+    """
+    Run every stage of one backend over the corpus.
+
+    Returns:
+    - Result dictionary with per-stage stats and accuracy
+    """
+    timings = {stage: [] for stage in STAGES}
+
+    # Load models outside the timed loop
+    backend['extract'](load_image(corpus[0][1]))
+
+    features = []
+    for identity, data in corpus:
+        image, seconds = timed(load_image, data)
+        timings['decode'].append(seconds)
+        if image is None:
+            features.append(None)
+            continue
+        _, seconds = timed(backend['detect'], image)
+        timings['detect'].append(seconds)
+        encoding, seconds = timed(backend['extract'], image)
+        timings['extract'].append(seconds)
+        features.append(encoding)
+
+    # Enroll the first shot of each identity that produced features
+    gallery_ids, gallery, probes = [], [], []
+    enrolled = set()
+    for (identity, _), encoding in zip(corpus, features):
+        if encoding is None:
+            continue
+        if identity not in enrolled:
+            enrolled.add(identity)
+            gallery_ids.append(identity)
+            gallery.append(encoding)
+        else:
+            probes.append((identity, encoding))
+    if not gallery:
+        return {'model': backend['model'], 'error': 'No faces found in the corpus'}
+
+    # Encoding I/O: write each enrollment, then read them back as search does
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE children (id INTEGER PRIMARY KEY, face_encoding BLOB)')
+    for child_id, encoding in enumerate(gallery):
+        start = time.perf_counter()
+        blob = encode_encoding(encoding, backend['model'], normalized=backend['normalized'])
+        conn.execute('INSERT INTO children (id, face_encoding) VALUES (?, ?)', (child_id, blob))
+        conn.commit()
+        timings['encoding_write'].append(time.perf_counter() - start)
+    for child_id in range(len(gallery)):
+        start = time.perf_counter()
+        row = conn.execute('SELECT face_encoding FROM children WHERE id = ?', (child_id,)).fetchone()
+        decode_encoding(row[0])
+        timings['encoding_read'].append(time.perf_counter() - start)
+    conn.close()
+
+    # 1:N search over the enrolled faces plus random distractors
+    matrix = np.stack(gallery).astype(np.float32)
+    if distractors:
+        matrix = np.vstack([matrix, backend['distractors'](distractors, matrix.shape[1])])
+    # Child ids are row numbers, so search results index the matrix directly
+    index = FaceIndex(np.arange(len(matrix)), matrix)
+
+    rank1 = 0
+    genuine, impostor = [], []
+    for identity, probe in probes:
+        best, seconds = timed(backend['search'], probe, index, matrix)
+        timings['search'].append(seconds)
+        expected = gallery_ids.index(identity)
+        rank1 += best == expected
+
+        scores = backend['scores'](probe, matrix[:len(gallery)])
+        genuine.append(scores[expected])
+        impostor.extend(np.delete(scores, expected))
+
+    threshold = backend['threshold']
+    genuine, impostor = np.array(genuine), np.array(impostor)
+    rank1 = rank1 / len(probes) if probes else None
+    chance = 1 / len(gallery)
+    informative = rank1 is not None and rank1 >= max(RANK1_MIN, RANK1_OVER_CHANCE * chance)
+    return {
+        'model': backend['model'],
+        'stages': {stage: summarize(times) for stage, times in timings.items()},
+        'accuracy': {
+            'threshold': float(threshold),
+            'enrolled': len(gallery),
+            'probes': len(probes),
+            'failed_to_extract': sum(encoding is None for encoding in features),
+            'tar': float((genuine >= threshold).mean()) if len(genuine) else None,
+            'far': float((impostor >= threshold).mean()) if len(impostor) else None,
+            'rank1': rank1,
+            'chance': chance,
+            'checked': informative,
+            'note': None if informative else 'rank-1 is not well above chance',
+        },
+        'gallery_size': len(matrix),
+    }
+
+def make_backend(name, options):
+    """Backend functions by name; raises ImportError if DeepFace is missing."""
+    if name == 'opencv':
+        return opencv_backend(options['threshold'])
+    return deepface_backend(options['deepface_model'])
+
+def _backend_process(name, options, corpus, distractors):
+    """Run one backend in a fresh process and measure its memory."""
+    try:
+        backend = make_backend(name, options)
+    except ImportError:
+        return None
+    start_rss = peak_rss_mb()
+    result = run_backend(backend, corpus, distractors)
+    end_rss = peak_rss_mb()
+    if start_rss is not None:
+        result['peak_rss_mb'] = {'start': start_rss, 'peak': end_rss, 'increase': end_rss - start_rss}
+    return result
+
+def run_backend_isolated(name, options, corpus, distractors):
+    """
+    Run a backend in its own spawned process.
+
+    ru_maxrss only ever grows, so backends sharing a process would inherit
+    each other's peaks; a fresh process gives each one its own.
+
+    Returns:
+    - Result dictionary, or None if the backend is not installed
+    """
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_backend_process, (name, options, corpus, distractors))
+
+def accuracy_checked(run, accuracy):
+    """True if a run's accuracy numbers can be compared between runs."""
+    if run.get('corpus', {}).get('type') == 'synthetic':
+        return False
+    return accuracy.get('checked', True)
+
+def compare_runs(baseline, current, tolerance):
+    """
+    Regressions of the current run against a baseline run.
+
+    Args:
+    - baseline: Parsed JSON of the earlier run
+    - current: Results of this run
+    - tolerance: Allowed relative p50 slow-down and absolute TAR/FAR/rank-1 change
+
+    Returns:
+    - List of regression messages
+    """
+    regressions = []
+    for name, result in current['backends'].items():
+        old = baseline.get('backends', {}).get(name)
+        if not old or 'stages' not in old or 'stages' not in result:
+            continue
+        for stage, stats in result['stages'].items():
+            before = old['stages'].get(stage, {}).get('p50_ms')
+            after = stats.get('p50_ms')
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{name} {stage}: p50 {before:.2f} ms -> {after:.2f} ms")
+        before, after = old['accuracy'], result['accuracy']
+        if not (accuracy_checked(baseline, before) and accuracy_checked(current, after)):
+            continue
+        if before['rank1'] is not None and after['rank1'] is not None and after['rank1'] < before['rank1'] - tolerance:
+            regressions.append(f"{name}: rank-1 {before['rank1']:.3f} -> {after['rank1']:.3f}")
+        if before['tar'] is not None and after['tar'] is not None and after['tar'] < before['tar'] - tolerance:
+            regressions.append(f"{name}: TAR {before['tar']:.3f} -> {after['tar']:.3f}")
+        if before['far'] is not None and after['far'] is not None and after['far'] > before['far'] + tolerance:
+            regressions.append(f"{name}: FAR {before['far']:.3f} -> {after['far']:.3f}")
+    return regressions
+
+def print_result(name, result, synthetic=False):
+    print(f"\n🔬 {name} ({result['model']})")
+    if 'error' in result:
+        print(f"❌ {result['error']}")
+        return
+    print(f"{'stage':>15} {'count':>7} {'items/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for stage, stats in result['stages'].items():
+        if stats['count']:
+            print(f"{stage:>15} {stats['count']:>7} {stats['per_sec']:>10,.1f} "
+                  f"{stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
+    accuracy = result['accuracy']
+    rates = ', '.join(f"{key.upper()} {accuracy[key]:.3f}" for key in ('tar', 'far', 'rank1')
+                      if accuracy[key] is not None)
+    print(f"📊 {rates} at threshold {accuracy['threshold']:.3f} "
+          f"({accuracy['enrolled']} enrolled, {accuracy['probes']} probes, "
+          f"{accuracy['failed_to_extract']} without a face, chance rank-1 {accuracy['chance']:.3f})")
+    if synthetic:
+        print("⚠️ Synthetic corpus: accuracy is not checked for regressions")
+    elif not accuracy['checked']:
+        print(f"⚠️ Accuracy not checked for regressions: {accuracy['note']}")
+    rss = result.get('peak_rss_mb')
+    if rss:
+        print(f"💾 Peak RSS {rss['peak']:.0f} MB, {rss['increase']:+.0f} MB over the {rss['start']:.0f} MB "
+              f"of the fresh process")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=BACKENDS, choices=BACKENDS)
+    parser.add_argument('--corpus', help="Directory with one sub-directory of photos per identity")
+    parser.add_argument('--identities', type=int, default=30, help="Synthetic identities")
+    parser.add_argument('--shots', type=int, default=4, help="Synthetic shots per identity")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--distractors', type=int, default=1000,
+                        help="Random encodings added to the search gallery")
+    parser.add_argument('--threshold', type=float, default=float(os.environ.get('SIMILARITY_THRESHOLD', 70)),
+                        help="OpenCV similarity percentage that counts as a match")
+    parser.add_argument('--deepface-model', default='VGG-Face')
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--compare', help="Earlier JSON results to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed relative p50 slow-down and absolute TAR/FAR/rank-1 change")
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+        corpus_info = {'type': 'directory', 'path': args.corpus}
+    else:
+        corpus = synthetic_corpus(args.identities, args.shots, args.seed)
+        corpus_info = {'type': 'synthetic', 'identities': args.identities, 'shots': args.shots, 'seed': args.seed}
+    corpus_info.update(photos=len(corpus), identities=len({identity for identity, _ in corpus}))
+    if not corpus:
+        print("❌ Empty corpus")
+        return 1
+
+    print("🏁 Face recognition benchmark")
+    print(f"Corpus: {corpus_info['photos']} photos of {corpus_info['identities']} identities ({corpus_info['type']}), "
+          f"{args.distractors} distractors")
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+        },
+        'corpus': corpus_info,
+        'distractors': args.distractors,
+        'backends': {},
+    }
+
+    options = {'threshold': args.threshold, 'deepface_model': args.deepface_model}
+    for name in args.backends:
+        result = run_backend_isolated(name, options, corpus, args.distractors)
+        if result is None:
+            print(f"\n⚠️ Skipping {name}: DeepFace is not installed")
+            continue
+        results['backends'][name] = result
+        print_result(name, result, synthetic=corpus_info['type'] == 'synthetic')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_runs(json.load(f), results, args.tolerance)
+        if regressions:
+            print("\n❌ Regressions against", args.compare)
+            for message in regressions:
+                print(f"   {message}")
+            return 1
+        print(f"\n✅ No regressions against {args.compare}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request session overhead of the session backends
+Runs concurrent logged-in clients against a minimal app for the Flask-Session
+filesystem store, the SQLite backend and signed cookies
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from flask import Flask, session, flash, get_flashed_messages
+from sessions import init_session, SqliteSessionInterface
+
+BACKENDS = ['filesystem', 'sqlite', 'cookie']
+
+def create_app(backend, directory):
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    app.config['SESSION_FILE_DIR'] = os.path.join(directory, 'flask_session')
+    app.config['SESSION_DATABASE'] = os.path.join(directory, 'sessions.db')
+    init_session(app, backend)
+
+    @app.route('/login')
+    def login():
+        session['username'] = 'officer'
+        session['role'] = 'user'
+        return 'ok'
+
+    @app.route('/dashboard')
+    def dashboard():
+        # Like the dashboards: read the user, sometimes flash a message
+        return session.get('username', '')
+
+    @app.route('/action')
+    def action():
+        flash('Saved', 'success')
+        get_flashed_messages()
+        return 'ok'
+
+    return app
+
+def prefill(app, backend, count):
+    """Add existing sessions, as on a server that has been running a while."""
+    if backend == 'filesystem':
+        cache = app.session_interface.cache
+        for i in range(count):
+            cache.set(f"{app.session_interface.key_prefix}old{i}", {'username': f"user{i}"}, 1800)
+    elif backend == 'sqlite':
+        interface = app.session_interface
+        assert isinstance(interface, SqliteSessionInterface)
+        with interface.pool.connection() as conn:
+            conn.executemany('INSERT INTO sessions (id, data, expiry) VALUES (?, ?, ?)',
+                             [(f"old{i}", '{"username": "user%d"}' % i, time.time() + 1800) for i in range(count)])
+            conn.commit()
+
+def run_client(app, requests, write_every, latencies):
+    client = app.test_client()
+    client.get('/login')
+    for i in range(requests):
+        path = '/action' if write_every and i % write_every == 0 else '/dashboard'
+        start = time.perf_counter()
+        client.get(path)
+        latencies.append(time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=BACKENDS, choices=BACKENDS)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="Requests per thread")
+    parser.add_argument('--existing', type=int, default=2000, help="Sessions already in the store")
+    parser.add_argument('--write-every', type=int, default=5, help="Every Nth request modifies the session")
+    args = parser.parse_args()
+
+    print("🏁 Session backends under concurrent load")
+    print(f"{args.threads} threads x {args.requests} requests, {args.existing} existing sessions, "
+          f"1 in {args.write_every} requests writes")
+    print(f"{'backend':>11} {'req/s':>9} {'mean ms':>9} {'p95 ms':>8}")
+
+    for backend in args.backends:
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app(backend, directory)
+            prefill(app, backend, args.existing)
+
+            latencies = []
+            threads = [threading.Thread(target=run_client, args=(app, args.requests, args.write_every, latencies))
+                       for _ in range(args.threads)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            latencies.sort()
+            mean = sum(latencies) / len(latencies)
+            p95 = latencies[int(len(latencies) * 0.95)]
+            print(f"{backend:>11} {len(latencies) / elapsed:>9,.0f} {mean * 1000:>9.2f} {p95 * 1000:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Bulk face enrollment for ChildSafe
+Re-encodes every registered photo across all CPU cores, e.g. after switching
+models or changing the feature pipeline. Resumable from a checkpoint.
+
+Usage:
+    python bulk_enroll.py --workers 8
+    python bulk_enroll.py --model Facenet512 --restart
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+
+from encoding_codec import encode_encoding
+from enrollment_queue import STATUS_ENCODED, STATUS_NO_FACE, STATUS_FAILED
+from opencv_face_recognition import MODEL_NAME
+from photo_ingest import pipeline_photo_path
+
+CHECKPOINT_FILE = 'bulk_enroll.checkpoint.json'
+
+# Set in each pool process by _init_worker
+_extract = None
+_extract_batch = None
+_model_name = None
+_normalized = False
+# deepface_recognition.NO_FACE_ERROR, imported with the DeepFace backend
+_no_face_error = None
+
+
+def _init_worker(model_name):
+    """Load the encoder once per process; each process uses one core."""
+    global _extract, _extract_batch, _model_name, _normalized, _no_face_error
+    import cv2
+    cv2.setNumThreads(1)
+
+    _model_name = model_name
+    if model_name == MODEL_NAME:
+        from opencv_face_recognition import extract_face_features_opencv
+        from model_registry import registry, FACE_DNN, HAAR
+        registry.warm_up([FACE_DNN, HAAR])
+        _extract, _normalized = extract_face_features_opencv, True
+    else:
+        from deepface_recognition import extract_face_encodings_deepface_batch, NO_FACE_ERROR
+        from model_registry import get_deepface_model
+        get_deepface_model(model_name)
+        _no_face_error = NO_FACE_ERROR
+        # One forward pass per shard instead of one per photo
+        _extract_batch = lambda image_paths: extract_face_encodings_deepface_batch(image_paths, model_name)
+
+
+def encode_shard(shard):
+    """
+    Encode one shard of children in a pool process.
+
+    Args:
+    - shard: List of (child_id, picture, photo_path)
+
+    Returns:
+    - List of (encoding blob or None, encoding_status, child_id, picture)
+    """
+    results, present = [], []
+    for child_id, picture, photo_path in shard:
+        if os.path.exists(photo_path):
+            # Encode the downscaled canonical image when there is one
+            present.append((child_id, picture, pipeline_photo_path(photo_path)))
+        else:
+            results.append((None, STATUS_FAILED, child_id, picture))
+
+    if _extract_batch is not None:
+        for (child_id, picture, _), (features, error) in zip(present, _extract_batch([row[2] for row in present])):
+            if features is not None:
+                blob = encode_encoding(features, _model_name, normalized=_normalized)
+                results.append((blob, STATUS_ENCODED, child_id, picture))
+            else:
+                status = STATUS_NO_FACE if error == _no_face_error else STATUS_FAILED
+                results.append((None, status, child_id, picture))
+        return results
+
+    for child_id, picture, photo_path in present:
+        try:
+            features = _extract(photo_path)
+        except Exception as e:
+            print(f"Error encoding child {child_id}: {str(e)}")
+            results.append((None, STATUS_FAILED, child_id, picture))
+            continue
+        if features is None:
+            results.append((None, STATUS_NO_FACE, child_id, picture))
+        else:
+            blob = encode_encoding(features, _model_name, normalized=_normalized)
+            results.append((blob, STATUS_ENCODED, child_id, picture))
+    return results
+
+
+def load_checkpoint(path, model_name):
+    """
+    Read the checkpoint for a run with this model.
+
+    Args:
+    - path: Checkpoint file
+    - model_name: Model of the current run
+
+    Returns:
+    - Checkpoint dictionary (a fresh one if there is none)
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('model') != model_name:
+            raise ValueError(f"Checkpoint {path} is for model {checkpoint.get('model')}; "
+                             f"use --restart to start a new run")
+        return checkpoint
+    return {'model': model_name, 'last_id': 0, 'done': 0, 'counts': {}}
+
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically so an interrupted run can resume."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def make_shards(database_connection, upload_folder, after_id, shard_size):
+    """
+    Split the children still to encode into contiguous id ranges.
+
+    Args:
+    - database_connection: SQLite connection
+    - upload_folder: Directory holding the photos
+    - after_id: Resume after this child id
+    - shard_size: Children per shard
+
+    Returns:
+    - List of shards, each a list of (child_id, picture, photo_path)
+    """
+    cursor = database_connection.cursor()
+    cursor.execute('''
+        SELECT id, picture FROM children
+        WHERE id > ? AND picture IS NOT NULL AND picture != ''
+        ORDER BY id
+    ''', (after_id,))
+    rows = [(child_id, picture, os.path.join(upload_folder, picture)) for child_id, picture in cursor.fetchall()]
+    return [rows[i:i + shard_size] for i in range(0, len(rows), shard_size)]
+
+
+def write_results(database_connection, results):
+    """
+    Write one shard's encodings in a single transaction.
+
+    Rows whose picture changed while the shard was encoded are left alone.
+
+    Args:
+    - database_connection: SQLite connection
+    - results: Output of encode_shard
+    """
+    cursor = database_connection.cursor()
+    cursor.executemany('''
+        UPDATE children SET face_encoding = ?, encoding_status = ?
+        WHERE id = ? AND picture = ?
+    ''', results)
+    database_connection.commit()
+
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+
+def bulk_enroll(database, upload_folder='uploads', model_name=MODEL_NAME, workers=None,
+                shard_size=64, checkpoint_path=CHECKPOINT_FILE, restart=False):
+    """
+    Re-encode every child's photo with a process pool.
+
+    Shards are encoded in parallel and written by this process in the
+    order they were dispatched, so the checkpoint always marks a prefix of
+    ids that is fully written.
+
+    Args:
+    - database: Path to the SQLite database
+    - upload_folder: Directory holding the photos
+    - model_name: 'OpenCV-LBP' or a DeepFace model name
+    - workers: Pool processes (default: all cores)
+    - shard_size: Children per shard and per write transaction
+    - checkpoint_path: Where progress is recorded
+    - restart: Ignore an existing checkpoint
+
+    Returns:
+    - Final checkpoint dictionary
+    """
+    # Imported here so pool processes don't need Flask
+    from db import connect
+    from migrations import ensure_schema
+
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = load_checkpoint(checkpoint_path, model_name)
+
+    conn = connect(database)
+    try:
+        ensure_schema(conn)
+        shards = make_shards(conn, upload_folder, checkpoint['last_id'], shard_size)
+        total = sum(len(shard) for shard in shards)
+        if not total:
+            print("✅ Nothing left to encode")
+            return checkpoint
+
+        workers = workers or os.cpu_count()
+        print(f"🚀 Encoding {total} photos with {model_name} on {workers} processes "
+              f"(resuming after id {checkpoint['last_id']})")
+
+        start = time.perf_counter()
+        done = 0
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(model_name,)) as pool:
+            for shard, results in zip(shards, pool.imap(encode_shard, shards)):
+                write_results(conn, results)
+                for _, status, _, _ in results:
+                    checkpoint['counts'][status] = checkpoint['counts'].get(status, 0) + 1
+
+                done += len(results)
+                checkpoint['last_id'] = shard[-1][0]
+                checkpoint['done'] += len(results)
+                save_checkpoint(checkpoint_path, checkpoint)
+
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed if elapsed else 0.0
+                eta = (total - done) / rate if rate else 0.0
+                print(f"📈 {done}/{total} photos, {rate:.1f} images/sec, ETA {_format_eta(eta)}")
+    finally:
+        conn.close()
+
+    counts = ', '.join(f"{status}: {count}" for status, count in sorted(checkpoint['counts'].items()))
+    print(f"✅ Encoded {done} photos in {time.perf_counter() - start:.1f}s ({counts})")
+    return checkpoint
+
+
+def main():
+    from db import DATABASE
+
+    parser = argparse.ArgumentParser(description="Re-encode every registered photo in parallel")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--upload-folder', default='uploads')
+    parser.add_argument('--model', default=MODEL_NAME, help="'OpenCV-LBP' or a DeepFace model name")
+    parser.add_argument('--workers', type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument('--shard-size', type=int, default=64, help="Children per shard and write transaction")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+    parser.add_argument('--restart', action='store_true', help="Start over instead of resuming")
+    parser.add_argument('--rebuild-store', action='store_true',
+                        help="Rebuild the memory-mapped encoding store when done")
+    args = parser.parse_args()
+
+    bulk_enroll(args.database, args.upload_folder, args.model, args.workers,
+                args.shard_size, args.checkpoint, args.restart)
+
+    if args.rebuild_store:
+        from encoding_store import build_encoding_store
+        conn = sqlite3.connect(args.database)
+        try:
+            manifest = build_encoding_store(conn)
+            print(f"✅ Built encoding store generation {manifest['generation']} ({manifest['rows']} encodings)")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+SQLite data-access layer for ChildSafe
+Hands out tuned, reusable connections: one per request (stored on Flask's g)
+drawn from a small bounded pool per worker process
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+DATABASE = os.environ.get('CHILDSAFE_DATABASE', 'child_registry.db')
+POOL_SIZE = int(os.environ.get('CHILDSAFE_DB_POOL_SIZE', 4))
+POOL_TIMEOUT = float(os.environ.get('CHILDSAFE_DB_POOL_TIMEOUT', 10))
+MMAP_SIZE = int(os.environ.get('CHILDSAFE_DB_MMAP_SIZE', 256 * 1024 * 1024))
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+
+def connect(database=DATABASE):
+    """
+    Open a connection with the pragmas every ChildSafe connection uses.
+
+    WAL lets readers run alongside a writer, synchronous=NORMAL is durable
+    in WAL mode while avoiding an fsync per commit, and mmap_size lets
+    SQLite read pages straight from the OS page cache. Prepared statements
+    are cached per connection, so reusing connections also reuses them.
+
+    Args:
+    - database: Path to the SQLite database
+
+    Returns:
+    - sqlite3.Connection
+    """
+    conn = sqlite3.connect(database, cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA mmap_size={int(MMAP_SIZE)}')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    return conn
+
+
+class ConnectionPool:
+    """
+    Bounded pool of configured SQLite connections.
+
+    Connections are created lazily up to ``size``; callers beyond that wait
+    up to ``timeout`` seconds for one to be returned. A connection is only
+    ever used by one thread at a time.
+    """
+
+    def __init__(self, database=DATABASE, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Borrow a connection, opening a new one if the pool is not full.
+
+        Returns:
+        - sqlite3.Connection
+
+        Raises:
+        - RuntimeError if no connection became free within the timeout
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return connect(self.database)
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError("Timed out waiting for a database connection")
+
+    def release(self, conn):
+        """
+        Return a connection to the pool, rolling back any open transaction.
+
+        Args:
+        - conn: Connection obtained from acquire
+        """
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped instead of being reused
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Close every idle connection (e.g. before forking workers)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+
+pool = ConnectionPool()
+
+
+def get_db():
+    """
+    Get the connection for the current request.
+
+    The first call in a request borrows a connection from the pool and
+    stores it on ``g``; it is returned by close_db when the request ends.
+
+    Returns:
+    - sqlite3.Connection
+    """
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(e=None):
+    """Return the request's connection to the pool."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+@contextmanager
+def db_connection():
+    """
+    Connection for helpers that run both inside and outside requests.
+
+    Inside a request this is the request's connection; elsewhere (app
+    start-up, CLI scripts) a connection is borrowed for the with block.
+    """
+    if has_app_context():
+        yield get_db()
+    else:
+        with pool.connection() as conn:
+            yield conn
+
+
+def init_app(app):
+    """Return request connections to the pool when each request ends."""
+    app.teardown_appcontext(close_db)
@@ -5,66 +5,242 @@ This provides state-of-the-art accuracy using deep learning models
 
 import os
 import numpy as np
-import base64
 from deepface import DeepFace
 import cv2
 from PIL import Image
-import tempfile
 import warnings
+from collections import namedtuple
+from model_registry import get_deepface_model
+from encoding_codec import encode_encoding, decode_encoding, read_header
+from image_io import load_image, BUFFER_TYPES
+from probe_cache import cached_probe
+from metrics import timed
 
 # Suppress TensorFlow warnings for cleaner output
 warnings.filterwarnings('ignore')
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
-def extract_face_encoding_deepface(image_path_or_bytes, model_name='VGG-Face'):
+# Face detector used for every DeepFace call
+DETECTOR_BACKEND = 'opencv'
+
+# Faces per forward pass in extract_face_encodings_deepface_batch
+DEEPFACE_BATCH_SIZE = int(os.environ.get('CHILDSAFE_DEEPFACE_BATCH_SIZE', 32))
+
+BatchEncoding = namedtuple('BatchEncoding', ['encoding', 'error'])
+# BatchEncoding.error of an image in which the detector found no face
+NO_FACE_ERROR = 'no face detected'
+
+# DeepFace's default verification thresholds, used if it can't be asked directly
+DEEPFACE_THRESHOLDS = {
+    'VGG-Face': {'cosine': 0.68, 'euclidean': 1.17, 'euclidean_l2': 1.17},
+    'Facenet': {'cosine': 0.40, 'euclidean': 10, 'euclidean_l2': 0.80},
+    'Facenet512': {'cosine': 0.30, 'euclidean': 23.56, 'euclidean_l2': 1.04},
+    'ArcFace': {'cosine': 0.68, 'euclidean': 4.15, 'euclidean_l2': 1.13},
+    'Dlib': {'cosine': 0.07, 'euclidean': 0.6, 'euclidean_l2': 0.4},
+    'SFace': {'cosine': 0.593, 'euclidean': 10.734, 'euclidean_l2': 1.055},
+    'OpenFace': {'cosine': 0.10, 'euclidean': 0.55, 'euclidean_l2': 0.55},
+    'DeepFace': {'cosine': 0.23, 'euclidean': 64, 'euclidean_l2': 0.64},
+    'DeepID': {'cosine': 0.015, 'euclidean': 45, 'euclidean_l2': 0.17},
+    'GhostFaceNet': {'cosine': 0.65, 'euclidean': 35.71, 'euclidean_l2': 1.10},
+}
+
+def extract_face_encoding_deepface(image_path_or_bytes, model_name='VGG-Face', digest=None):
     """
     Extract face encoding using DeepFace.
+    Results for uploaded bytes are cached by content hash (see probe_cache.py).
     
     Args:
-    - image_path_or_bytes: Path to image file or image bytes
+    - image_path_or_bytes: Path to image file, image bytes or decoded BGR image
     - model_name: Model to use ('VGG-Face', 'Facenet', 'OpenFace', 'ArcFace')
+    - digest: SHA-256 of the bytes if already known (skips hashing them)
     
     Returns:
     - Face encoding array or None if no face found
     """
+    if isinstance(image_path_or_bytes, BUFFER_TYPES):
+        probe = cached_probe(image_path_or_bytes, f"deepface:{model_name}:{DETECTOR_BACKEND}",
+                             lambda: extract_face_encoding_with_box_deepface(image_path_or_bytes, model_name),
+                             digest)
+        return probe.features if probe is not None else None
+
+    result = extract_face_encoding_with_box_deepface(image_path_or_bytes, model_name)
+    return result[0] if result is not None else None
+
+@timed('deepface_represent')
+def extract_face_encoding_with_box_deepface(image_path_or_bytes, model_name='VGG-Face'):
+    """
+    Extract a face encoding and the face it was taken from.
+    
+    Args:
+    - image_path_or_bytes: Path to image file, image bytes or decoded BGR image
+    - model_name: Model to use ('VGG-Face', 'Facenet', 'OpenFace', 'ArcFace')
+    
+    Returns:
+    - (encoding, (x, y, w, h)) or None if no face was found or DeepFace failed
+    """
     try:
-        temp_file = None
+        # Decode in memory; DeepFace accepts the BGR array directly
+        image = load_image(image_path_or_bytes)
+        if image is None:
+            return None
         
-        # Handle bytes input by creating temporary file
-        if isinstance(image_path_or_bytes, bytes):
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            temp_file.write(image_path_or_bytes)
-            temp_file.close()
-            image_path = temp_file.name
-        else:
-            image_path = image_path_or_bytes
+        # Make sure the model is loaded once per process
+        get_deepface_model(model_name)
         
         # Extract face embedding using DeepFace
         embedding = DeepFace.represent(
-            img_path=image_path,
+            img_path=image,
             model_name=model_name,
             enforce_detection=True,
-            detector_backend='opencv'
+            detector_backend=DETECTOR_BACKEND
         )
         
-        # Clean up temporary file
-        if temp_file:
-            os.unlink(temp_file.name)
-        
-        # DeepFace returns a list of dictionaries, get the first face
+        # DeepFace returns one dictionary per face; keep the largest, as the batch path does
         if embedding and len(embedding) > 0:
-            return np.array(embedding[0]['embedding'], dtype=np.float32)
+            face = max(embedding, key=lambda f: _face_area(f.get('facial_area')))
+            area = face.get('facial_area') or {}
+            keys = ('x', 'y', 'w', 'h')
+            box = tuple(int(area[k]) for k in keys) if all(k in area for k in keys) else None
+            return np.array(face['embedding'], dtype=np.float32), box
         
         return None
         
     except Exception as e:
-        # Clean up temporary file on error
-        if temp_file and os.path.exists(temp_file.name):
-            os.unlink(temp_file.name)
-        
         print(f"DeepFace encoding error: {str(e)}")
         return None
 
+def _face_area(facial_area):
+    """Area of a DeepFace facial_area dictionary (0 if unknown)."""
+    facial_area = facial_area or {}
+    return facial_area.get('w', 0) * facial_area.get('h', 0)
+
+def _model_input_size(model):
+    """(height, width) the embedding network expects."""
+    shape = tuple(model.input_shape)
+    # Keras models report (batch, height, width, channels)
+    if len(shape) == 4:
+        shape = shape[1:3]
+    return int(shape[0]), int(shape[1])
+
+def _prepare_face(face, target_size):
+    """
+    Resize an aligned face crop to the network input, as DeepFace.represent does.
+
+    The crop is scaled to fit and zero-padded to target_size, keeping its
+    aspect ratio.
+    """
+    face = np.asarray(face, dtype=np.float32)
+    if face.max() > 1:
+        face = face / 255.0
+
+    target_h, target_w = target_size
+    factor = min(target_h / face.shape[0], target_w / face.shape[1])
+    new_size = (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor)))
+    face = cv2.resize(face, new_size)
+
+    pad_h, pad_w = target_h - face.shape[0], target_w - face.shape[1]
+    face = np.pad(face, ((pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)))
+    return face
+
+def _forward_batch(model, batch):
+    """
+    Embed a stacked batch of faces the way DeepFace.represent does.
+
+    Newer DeepFace versions wrap the network in a client whose forward()
+    also post-processes the output (VGG-Face L2-normalises it), so the
+    batch goes through forward() to give the same embeddings represent()
+    stores. Clients that only embed one face per call get one call per face.
+    """
+    forward = getattr(model, 'forward', None)
+    if forward is None:
+        # Older DeepFace versions return the bare Keras network
+        return np.asarray(model.predict(batch, verbose=0), dtype=np.float32)
+
+    embeddings = np.asarray(forward(batch), dtype=np.float32)
+    if embeddings.ndim == 1 and len(batch) == 1:
+        return embeddings.reshape(1, -1)
+    if embeddings.ndim != 2 or len(embeddings) != len(batch):
+        return np.stack([np.asarray(forward(face[np.newaxis]), dtype=np.float32).reshape(-1) for face in batch])
+    return embeddings
+
+@timed('deepface_represent_batch')
+def extract_face_encodings_deepface_batch(images, model_name='VGG-Face', batch_size=DEEPFACE_BATCH_SIZE):
+    """
+    Extract face encodings for many images with one forward pass per batch.
+
+    Each image is decoded and its largest face detected and aligned; the
+    crops are stacked and embedded together, instead of one
+    DeepFace.represent call (and one single-image forward pass) per image.
+
+    Args:
+    - images: List of image paths, image bytes or decoded BGR images
+    - model_name: Model to use ('VGG-Face', 'Facenet', 'OpenFace', 'ArcFace')
+    - batch_size: Faces per forward pass
+
+    Returns:
+    - List of BatchEncoding(encoding, error) in the same order as images;
+      encoding is None and error describes the failure for images that
+      could not be encoded (NO_FACE_ERROR when no face was found)
+    """
+    results = [BatchEncoding(None, 'not processed')] * len(images)
+
+    model = get_deepface_model(model_name)
+    if model is None:
+        return [BatchEncoding(None, f"DeepFace model {model_name} is unavailable")] * len(images)
+    target_size = _model_input_size(model)
+
+    crops, owners = [], []
+
+    def flush():
+        try:
+            embeddings = _forward_batch(model, np.stack(crops))
+            for i, embedding in zip(owners, embeddings):
+                results[i] = BatchEncoding(embedding, None)
+        except Exception as e:
+            print(f"DeepFace batch encoding error: {str(e)}")
+            for i in owners:
+                results[i] = BatchEncoding(None, str(e))
+        crops.clear()
+        owners.clear()
+
+    for i, image in enumerate(images):
+        try:
+            image = load_image(image)
+            if image is None:
+                results[i] = BatchEncoding(None, 'Could not decode image')
+                continue
+            try:
+                faces = DeepFace.extract_faces(
+                    img_path=image,
+                    detector_backend=DETECTOR_BACKEND,
+                    enforce_detection=True,
+                    align=True
+                )
+            except ValueError as e:
+                # enforce_detection makes DeepFace raise ValueError when it finds no face
+                if 'could not be detected' not in str(e):
+                    raise
+                results[i] = BatchEncoding(None, NO_FACE_ERROR)
+                continue
+            if not faces:
+                results[i] = BatchEncoding(None, NO_FACE_ERROR)
+                continue
+            # Largest face, as extract_face_encoding_with_box_deepface and the OpenCV pipeline pick
+            face = max(faces, key=lambda f: _face_area(f.get('facial_area')))
+            # extract_faces returns RGB; the networks take BGR like represent() feeds them
+            crops.append(_prepare_face(face['face'][:, :, ::-1], target_size))
+            owners.append(i)
+        except Exception as e:
+            results[i] = BatchEncoding(None, str(e))
+
+        if len(crops) == batch_size:
+            flush()
+
+    if crops:
+        flush()
+
+    return results
+
 def compare_faces_deepface(encoding1, encoding2, model_name='VGG-Face'):
     """
     Compare two face encodings using cosine similarity.
@@ -105,76 +281,212 @@ def compare_faces_deepface(encoding1, encoding2, model_name='VGG-Face'):
         print(f"DeepFace comparison error: {str(e)}")
         return None
 
+def similarity_from_distance(distance, threshold):
+    """
+    Map a verification distance to a 0-100 similarity score.
+    
+    Matches (distance within the threshold) score at least 80 and
+    non-matches at most 79, so the score agrees with the verdict.
+    
+    Args:
+    - distance: Distance between two embeddings
+    - threshold: Model's verification threshold for the distance metric
+    
+    Returns:
+    - Similarity score (0-100)
+    """
+    if distance <= threshold:
+        # Faces match - calculate high similarity
+        similarity = (1 - (distance / threshold)) * 100
+        return max(80, min(100, similarity))  # Ensure high similarity for matches
+    # Faces don't match - calculate low similarity
+    similarity = max(0, (1 - distance) * 100)
+    return min(79, similarity)  # Ensure low similarity for non-matches
+
+def find_threshold_deepface(model_name, distance_metric='cosine'):
+    """
+    Verification threshold DeepFace.verify uses for a model and metric.
+    
+    Args:
+    - model_name: DeepFace model name
+    - distance_metric: 'cosine', 'euclidean' or 'euclidean_l2'
+    
+    Returns:
+    - Distance threshold
+    """
+    try:
+        # DeepFace >= 0.0.80
+        from deepface.modules.verification import find_threshold
+    except ImportError:
+        try:
+            from deepface.commons.distance import findThreshold as find_threshold
+        except ImportError:
+            find_threshold = None
+    if find_threshold is not None:
+        try:
+            return float(find_threshold(model_name, distance_metric))
+        except Exception:
+            pass
+    return DEEPFACE_THRESHOLDS.get(model_name, {}).get(distance_metric, 0.4)
+
+def embedding_distances(probe, encodings, distance_metric='cosine'):
+    """
+    Distances from one probe embedding to each stored embedding.
+    
+    Args:
+    - probe: Probe embedding
+    - encodings: 2-D array with one stored embedding per row
+    - distance_metric: 'cosine', 'euclidean' or 'euclidean_l2'
+    
+    Returns:
+    - 1-D array of distances, computed as DeepFace.verify does
+    """
+    probe = np.asarray(probe, dtype=np.float32)
+    encodings = np.asarray(encodings, dtype=np.float32)
+    
+    if distance_metric == 'cosine':
+        norms = np.linalg.norm(encodings, axis=1) * np.linalg.norm(probe)
+        norms[norms == 0] = np.inf
+        return 1 - (encodings @ probe) / norms
+    if distance_metric == 'euclidean_l2':
+        probe = probe / max(np.linalg.norm(probe), 1e-12)
+        encodings = encodings / np.maximum(np.linalg.norm(encodings, axis=1, keepdims=True), 1e-12)
+    elif distance_metric != 'euclidean':
+        raise ValueError(f"Unsupported distance metric: {distance_metric}")
+    return np.linalg.norm(encodings - probe, axis=1)
+
+@timed('deepface_verify_encodings')
+def verify_encodings_deepface(probe_encoding, encodings, model_name='VGG-Face', distance_metric='cosine'):
+    """
+    Verify a probe embedding against stored embeddings.
+    
+    Applies DeepFace's threshold for the model and the same similarity
+    mapping as verify_faces_deepface, without embedding the stored photos.
+    
+    Args:
+    - probe_encoding: Probe embedding
+    - encodings: Stored embeddings (2-D array or list of vectors)
+    - model_name: Model the embeddings were made with
+    - distance_metric: 'cosine', 'euclidean' or 'euclidean_l2'
+    
+    Returns:
+    - List of result dictionaries shaped like verify_faces_deepface's
+    """
+    if len(encodings) == 0:
+        return []
+    threshold = find_threshold_deepface(model_name, distance_metric)
+    distances = embedding_distances(probe_encoding, np.stack(encodings), distance_metric)
+    return [{
+        'verified': bool(distance <= threshold),
+        'similarity': similarity_from_distance(float(distance), threshold),
+        'distance': float(distance),
+        'threshold': threshold,
+        'model': model_name
+    } for distance in distances]
+
+def verify_against_registry_deepface(probe_path_or_bytes, database_connection, child_ids=None,
+                                     model_name='VGG-Face', distance_metric='cosine'):
+    """
+    Verify a probe photo against children's stored embeddings.
+    
+    Only the probe is detected and embedded, so checking N children costs
+    one forward pass instead of N DeepFace.verify calls. Children whose
+    stored encoding came from a different model are skipped.
+    
+    Args:
+    - probe_path_or_bytes: Probe image (path, bytes or decoded BGR image)
+    - database_connection: SQLite connection
+    - child_ids: Children to check, or None for every encoded child
+    - model_name: DeepFace model to use
+    - distance_metric: 'cosine', 'euclidean' or 'euclidean_l2'
+    
+    Returns:
+    - List of result dictionaries with a 'child_id' key, best match first,
+      or None if no face was found in the probe
+    """
+    probe = extract_face_encoding_deepface(probe_path_or_bytes, model_name)
+    if probe is None:
+        return None
+    
+    try:
+        cursor = database_connection.cursor()
+        if child_ids is None:
+            cursor.execute('SELECT id, face_encoding FROM children WHERE face_encoding IS NOT NULL')
+            rows = cursor.fetchall()
+        else:
+            child_ids = list(child_ids)
+            rows = []
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(child_ids), 500):
+                chunk = child_ids[start:start + 500]
+                cursor.execute(f"SELECT id, face_encoding FROM children WHERE id IN ({','.join('?' * len(chunk))}) "
+                               f"AND face_encoding IS NOT NULL", chunk)
+                rows.extend(cursor.fetchall())
+    except Exception as e:
+        print(f"Error loading stored DeepFace encodings: {str(e)}")
+        return None
+    
+    ids, encodings = [], []
+    for child_id, value in rows:
+        header = read_header(value)
+        if header is not None and header.model_name != model_name:
+            continue
+        encoding = decode_encoding(value)
+        if encoding is not None and len(encoding) == len(probe):
+            ids.append(child_id)
+            encodings.append(encoding)
+    
+    results = verify_encodings_deepface(probe, encodings, model_name, distance_metric)
+    for child_id, result in zip(ids, results):
+        result['child_id'] = child_id
+    return sorted(results, key=lambda result: result['distance'])
+
+@timed('deepface_verify')
 def verify_faces_deepface(img1_path_or_bytes, img2_path_or_bytes, model_name='VGG-Face'):
     """
     Verify if two images contain the same person using DeepFace.
     This is a direct verification without manual encoding extraction.
     
     Args:
-    - img1_path_or_bytes: First image (path or bytes)
-    - img2_path_or_bytes: Second image (path or bytes)
+    - img1_path_or_bytes: First image (path, bytes or decoded BGR image)
+    - img2_path_or_bytes: Second image (path, bytes or decoded BGR image)
     - model_name: Model to use for verification
     
     Returns:
     - Dictionary with verification result and confidence
     """
     try:
-        temp_files = []
+        # Decode both images in memory; DeepFace accepts BGR arrays directly
+        images = [load_image(img_data) for img_data in [img1_path_or_bytes, img2_path_or_bytes]]
+        if any(image is None for image in images):
+            print("DeepFace verification error: could not decode image")
+            return None
         
-        # Handle bytes inputs
-        paths = []
-        for img_data in [img1_path_or_bytes, img2_path_or_bytes]:
-            if isinstance(img_data, bytes):
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-                temp_file.write(img_data)
-                temp_file.close()
-                temp_files.append(temp_file.name)
-                paths.append(temp_file.name)
-            else:
-                paths.append(img_data)
+        # Make sure the model is loaded once per process
+        get_deepface_model(model_name)
         
         # Use DeepFace.verify for direct comparison
         result = DeepFace.verify(
-            img1_path=paths[0],
-            img2_path=paths[1],
+            img1_path=images[0],
+            img2_path=images[1],
             model_name=model_name,
-            detector_backend='opencv',
+            detector_backend=DETECTOR_BACKEND,
             enforce_detection=True
         )
         
-        # Clean up temporary files
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-        
         # Convert distance to similarity percentage
         distance = result.get('distance', 1.0)
         threshold = result.get('threshold', 0.4)
         
-        # Calculate similarity based on distance and threshold
-        if distance <= threshold:
-            # Faces match - calculate high similarity
-            similarity = (1 - (distance / threshold)) * 100
-            similarity = max(80, min(100, similarity))  # Ensure high similarity for matches
-        else:
-            # Faces don't match - calculate low similarity
-            similarity = max(0, (1 - distance) * 100)
-            similarity = min(79, similarity)  # Ensure low similarity for non-matches
-        
         return {
             'verified': result.get('verified', False),
-            'similarity': similarity,
+            'similarity': similarity_from_distance(distance, threshold),
             'distance': distance,
             'threshold': threshold,
             'model': model_name
         }
         
     except Exception as e:
-        # Clean up temporary files on error
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-        
         print(f"DeepFace verification error: {str(e)}")
         return None
 
@@ -194,13 +506,13 @@ def save_face_encoding_deepface(image_path, child_id, database_connection, model
     try:
         encoding = extract_face_encoding_deepface(image_path, model_name)
         if encoding is not None:
-            # Convert encoding to base64 string for storage
-            encoding_str = base64.b64encode(encoding.tobytes()).decode('utf-8')
+            # Pack encoding into the binary encoding format
+            encoding_blob = encode_encoding(encoding, model_name)
             
             cursor = database_connection.cursor()
             cursor.execute('''
                 UPDATE children SET face_encoding = ? WHERE id = ?
-            ''', (encoding_str, child_id))
+            ''', (encoding_blob, child_id))
             database_connection.commit()
             return True
     except Exception as e:
@@ -224,10 +536,8 @@ def get_face_encoding_from_db_deepface(child_id, database_connection):
         result = cursor.fetchone()
         
         if result and result[0]:
-            # Convert base64 string back to numpy array
-            encoding_bytes = base64.b64decode(result[0])
-            encoding = np.frombuffer(encoding_bytes, dtype=np.float32)
-            return encoding
+            # Zero-copy view over the stored BLOB (legacy base64 is also accepted)
+            return decode_encoding(result[0])
     except Exception as e:
         print(f"Error retrieving DeepFace encoding: {str(e)}")
     return None
@@ -0,0 +1,223 @@
+"""
+Binary storage format for face encodings in ChildSafe
+Shared by the OpenCV and DeepFace backends to read and write
+children.face_encoding as a compact, self-describing BLOB
+"""
+
+import argparse
+import base64
+import binascii
+import sqlite3
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Layout (little endian):
+#   magic 'CSFE' | format version u8 | dtype code u8 | flags u8 |
+#   model name length u8 | dimension u32 | model name (padded to 4 bytes) |
+#   dimension * itemsize bytes of vector data
+MAGIC = b'CSFE'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sBBBBI')
+
+FLAG_NORMALIZED = 0x01
+
+_DTYPE_CODES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+_CODES_BY_DTYPE = {dtype: code for code, dtype in _DTYPE_CODES.items()}
+
+# Model names for legacy base64 rows, which carry no header
+LEGACY_MODELS_BY_DIMENSION = {
+    6656: 'OpenCV-LBP',
+    4096: 'VGG-Face',
+    2622: 'VGG-Face',
+    128: 'Facenet',
+    512: 'Facenet512',
+}
+
+EncodingHeader = namedtuple('EncodingHeader', ['model_name', 'dimension', 'dtype', 'normalized', 'offset'])
+
+
+def _padded(length):
+    return (length + 3) & ~3
+
+
+def encode_encoding(encoding, model_name, normalized=False, dtype=np.float32):
+    """
+    Pack a face encoding into the binary BLOB format.
+
+    Args:
+    - encoding: 1-D face encoding
+    - model_name: Name of the model that produced it (max 255 ASCII bytes)
+    - normalized: True if the vector is already L2-normalised
+    - dtype: Storage dtype (float32 or float16)
+
+    Returns:
+    - bytes ready to bind to an SQLite BLOB parameter
+    """
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype not in _CODES_BY_DTYPE:
+        raise ValueError(f"Unsupported encoding dtype: {dtype}")
+
+    vector = np.ascontiguousarray(encoding, dtype=dtype).ravel()
+    name = model_name.encode('ascii')
+    if len(name) > 255:
+        raise ValueError("Model name is too long")
+
+    flags = FLAG_NORMALIZED if normalized else 0
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, _CODES_BY_DTYPE[dtype], flags, len(name), len(vector))
+    return header + name.ljust(_padded(len(name)), b'\0') + vector.tobytes()
+
+
+def is_binary_encoding(value):
+    """True if a stored value uses the binary BLOB format."""
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:4]) == MAGIC
+
+
+def read_header(value):
+    """
+    Parse the header of a binary encoding.
+
+    Args:
+    - value: Stored BLOB
+
+    Returns:
+    - EncodingHeader or None if the value is not a valid binary encoding
+    """
+    if not is_binary_encoding(value) or len(value) < _HEADER.size:
+        return None
+
+    magic, version, dtype_code, flags, name_length, dimension = _HEADER.unpack_from(value)
+    if version != FORMAT_VERSION or dtype_code not in _DTYPE_CODES:
+        return None
+
+    dtype = _DTYPE_CODES[dtype_code]
+    offset = _HEADER.size + _padded(name_length)
+    if len(value) != offset + dimension * dtype.itemsize:
+        return None
+
+    model_name = bytes(value[_HEADER.size:_HEADER.size + name_length]).decode('ascii')
+    return EncodingHeader(model_name, dimension, dtype, bool(flags & FLAG_NORMALIZED), offset)
+
+
+def decode_encoding(value):
+    """
+    Read a stored face encoding.
+
+    Binary BLOBs are returned as a zero-copy, read-only view over the value.
+    Legacy base64 TEXT is decoded as raw float32 for backwards compatibility.
+
+    Args:
+    - value: Stored face_encoding value (BLOB or base64 string)
+
+    Returns:
+    - 1-D numpy array or None
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, (bytes, bytearray, memoryview)) and is_binary_encoding(value):
+        header = read_header(value)
+        if header is None:
+            return None
+        return np.frombuffer(value, dtype=header.dtype, count=header.dimension, offset=header.offset)
+
+    try:
+        return np.frombuffer(base64.b64decode(value, validate=True), dtype=np.float32)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def describe_encoding(value):
+    """
+    Model name, dimension and normalisation flag of a stored value.
+
+    Legacy base64 rows report the model guessed from their dimension.
+
+    Args:
+    - value: Stored face_encoding value
+
+    Returns:
+    - EncodingHeader or None
+    """
+    header = read_header(value)
+    if header is not None:
+        return header
+
+    vector = decode_encoding(value)
+    if vector is None:
+        return None
+    model_name = LEGACY_MODELS_BY_DIMENSION.get(len(vector), 'unknown')
+    return EncodingHeader(model_name, len(vector), np.dtype('<f4'), False, 0)
+
+
+def migrate_base64_encodings(database_connection, batch_size=500, pause_seconds=0.0):
+    """
+    Convert legacy base64 TEXT encodings to binary BLOBs in place.
+
+    Rows are converted in small transactions so the app can keep serving
+    requests while the migration runs. It is safe to interrupt and rerun.
+
+    Args:
+    - database_connection: SQLite connection
+    - batch_size: Rows converted per transaction
+    - pause_seconds: Sleep between batches to yield to other writers
+
+    Returns:
+    - Number of rows converted
+    """
+    cursor = database_connection.cursor()
+    converted = 0
+    last_id = 0
+
+    while True:
+        cursor.execute('''
+            SELECT id, face_encoding FROM children
+            WHERE id > ? AND typeof(face_encoding) = 'text'
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for child_id, value in rows:
+            header = describe_encoding(value)
+            if header is not None:
+                vector = decode_encoding(value)
+                updates.append((encode_encoding(vector, header.model_name), child_id, value))
+            last_id = child_id
+
+        # Only overwrite rows that still hold the value we read
+        cursor.executemany('UPDATE children SET face_encoding = ? WHERE id = ? AND face_encoding = ?', updates)
+        if updates:
+            # Rows changed since the SELECT match no row and aren't counted
+            converted += cursor.rowcount
+        database_connection.commit()
+
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    return converted
+
+
+def main():
+    from db import DATABASE
+
+    parser = argparse.ArgumentParser(description="Convert base64 face encodings to binary BLOBs")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pause', type=float, default=0.05, help="Seconds to sleep between batches")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    try:
+        converted = migrate_base64_encodings(conn, args.batch_size, args.pause)
+        print(f"✅ Converted {converted} face encodings to binary format")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
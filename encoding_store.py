@@ -0,0 +1,228 @@
+"""
+Memory-mapped encoding store for ChildSafe
+Writes every registered encoding to a flat float32 matrix on disk that all
+gunicorn workers map read-only, so they share one copy in the page cache
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from face_index import FaceIndex
+
+STORE_DIR = os.environ.get('CHILDSAFE_ENCODING_STORE', 'encoding_store')
+MANIFEST = 'CURRENT'
+KEEP_GENERATIONS = 2
+
+
+def _write_atomic(path, data):
+    """Write bytes to a temp file, fsync it and rename it over path."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _save_array(path, array):
+    """Save an array as .npy with fsync, so it is complete before the swap."""
+    with open(path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def build_encoding_store(database_connection, directory=STORE_DIR, dimension=None):
+    """
+    Build a new store generation from the children table and swap it in.
+
+    The matrix and id sidecar are written under a fresh generation name,
+    then the CURRENT manifest is atomically replaced to point at them.
+    Workers notice the new manifest on their next refresh. The change-log
+    version is read before the rows, so changes made during the build are
+    replayed by each worker's index sync.
+
+    Args:
+    - database_connection: SQLite connection
+    - directory: Store directory
+    - dimension: Expected encoding length or None for the most common
+
+    Returns:
+    - The manifest dictionary that was published
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    index = FaceIndex.from_database(database_connection, dimension)
+    # Nanosecond timestamps keep generation names unique and sortable
+    generation = f"{time.time_ns():020d}-{os.getpid()}"
+    matrix_name = f"encodings-{generation}.npy"
+    ids_name = f"ids-{generation}.npy"
+
+    _save_array(directory / matrix_name, np.ascontiguousarray(index.matrix, dtype=np.float32))
+    _save_array(directory / ids_name, np.asarray(index.ids, dtype=np.int64))
+
+    manifest = {
+        'generation': generation,
+        'matrix': matrix_name,
+        'ids': ids_name,
+        'rows': len(index),
+        'dimension': index.dimension,
+        'change_version': index.version,
+        'built_at': time.time(),
+    }
+    _write_atomic(directory / MANIFEST, json.dumps(manifest).encode('utf-8'))
+    _remove_old_generations(directory, generation)
+    return manifest
+
+
+def _remove_old_generations(directory, current):
+    """
+    Delete all but the newest KEEP_GENERATIONS generations.
+
+    Unlinking a file that a worker still has mapped is safe on POSIX: the
+    mapping stays valid until the worker swaps to the new generation.
+    """
+    generations = sorted({p.stem.split('-', 1)[1] for p in directory.glob('encodings-*.npy')})
+    for generation in generations[:-KEEP_GENERATIONS]:
+        if generation == current:
+            continue
+        for name in (f"encodings-{generation}.npy", f"ids-{generation}.npy"):
+            try:
+                (directory / name).unlink()
+            except FileNotFoundError:
+                pass
+
+
+class EncodingStore:
+    """
+    Read-only view of the current store generation.
+
+    ``matrix`` is a read-only np.memmap, so every worker that opens the
+    store shares the same physical pages. ``refresh`` re-reads the manifest
+    and remaps when a new generation has been published.
+    """
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = Path(directory)
+        self.manifest = None
+        self.matrix = None
+        self.ids = None
+        self._manifest_stat = None
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self.manifest['generation'] if self.manifest else None
+
+    @property
+    def change_version(self):
+        return self.manifest['change_version'] if self.manifest else 0
+
+    def exists(self):
+        return (self.directory / MANIFEST).exists()
+
+    def refresh(self):
+        """
+        Map the newest generation if the manifest changed.
+
+        Returns:
+        - True if a new generation was mapped
+        """
+        path = self.directory / MANIFEST
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key == self._manifest_stat:
+            return False
+
+        with self._lock:
+            if key == self._manifest_stat:
+                return False
+            with open(path, 'rb') as f:
+                manifest = json.loads(f.read().decode('utf-8'))
+            if manifest.get('generation') == self.generation:
+                self._manifest_stat = key
+                return False
+
+            ids = np.load(self.directory / manifest['ids'])
+            if len(ids):
+                matrix = np.load(self.directory / manifest['matrix'], mmap_mode='r')
+            else:
+                # An empty file cannot be memory-mapped
+                matrix = np.zeros((0, manifest['dimension']), dtype=np.float32)
+            if matrix.shape[0] != len(ids):
+                print(f"⚠️ Encoding store generation {manifest['generation']} is inconsistent, ignoring it")
+                return False
+
+            self.matrix, self.ids, self.manifest = matrix, ids, manifest
+            self._manifest_stat = key
+            return True
+
+    def to_index(self):
+        """
+        Build a FaceIndex whose base segment is this store's memory map.
+
+        Returns:
+        - FaceIndex at the store's change version, or None if no store exists
+        """
+        if self.manifest is None and not self.refresh():
+            return None
+        return FaceIndex(self.ids, self.matrix, version=self.change_version)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_encoding_store(directory=STORE_DIR):
+    """
+    Get the process-wide store, or None if no generation has been built.
+
+    Args:
+    - directory: Store directory
+
+    Returns:
+    - EncodingStore instance or None
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = EncodingStore(directory)
+            if not store.exists():
+                return None
+            _store = store
+    return _store
+
+
+def main():
+    from db import DATABASE
+
+    parser = argparse.ArgumentParser(description="Rebuild the memory-mapped face encoding store")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--directory', default=STORE_DIR)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    try:
+        start = time.perf_counter()
+        manifest = build_encoding_store(conn, args.directory)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Built generation {manifest['generation']}: {manifest['rows']} encodings "
+              f"x {manifest['dimension']} in {elapsed:.1f}s (change version {manifest['change_version']})")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
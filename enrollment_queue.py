@@ -0,0 +1,312 @@
+"""
+Persistent face enrollment queue for ChildSafe
+Web requests enqueue a job per photo; worker processes that keep the face
+models loaded claim jobs from SQLite, encode the photo and record the result
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from collections import namedtuple
+
+from encoding_codec import encode_encoding
+from face_index import prune_change_log
+from model_registry import registry, FACE_DNN, HAAR
+from opencv_face_recognition import extract_face_features_with_box_opencv, MODEL_NAME
+from photo_ingest import pipeline_photo_path
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# children.encoding_status values
+STATUS_PENDING = 'pending'
+STATUS_ENCODED = 'encoded'
+STATUS_NO_FACE = 'no_face'
+STATUS_FAILED = 'failed'
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 5
+# A running job whose worker has not finished it in this time is reclaimed
+LEASE_SECONDS = 300
+POLL_INTERVAL_SECONDS = 1.0
+# Idle workers trim the face index change log this often
+PRUNE_INTERVAL_SECONDS = 3600
+
+EnrollmentJob = namedtuple('EnrollmentJob', ['id', 'child_id', 'photo_path', 'attempts', 'max_attempts'])
+
+
+def enqueue_enrollment(database_connection, child_id, photo_path, max_attempts=MAX_ATTEMPTS):
+    """
+    Queue a child's photo for face encoding.
+
+    Any job still queued for the child is superseded, so only the newest
+    photo is encoded.
+
+    Args:
+    - database_connection: SQLite connection
+    - child_id: Child's database ID
+    - photo_path: Path to the saved photo
+    - max_attempts: Attempts before the job is marked failed
+
+    Returns:
+    - ID of the new job
+    """
+    cursor = database_connection.cursor()
+    cursor.execute('''
+        UPDATE enrollment_jobs SET status = ?, last_error = 'superseded'
+        WHERE child_id = ? AND status = ?
+    ''', (DONE, child_id, QUEUED))
+    cursor.execute('''
+        INSERT INTO enrollment_jobs (child_id, photo_path, max_attempts, available_at)
+        VALUES (?, ?, ?, ?)
+    ''', (child_id, photo_path, max_attempts, time.time()))
+    job_id = cursor.lastrowid
+    cursor.execute('UPDATE children SET encoding_status = ? WHERE id = ?', (STATUS_PENDING, child_id))
+    database_connection.commit()
+    return job_id
+
+
+def claim_job(database_connection, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Claim the oldest job that is ready to run.
+
+    Jobs left running by a worker that died are reclaimed once their lease
+    expires, unless they have used up their attempts: those are marked
+    failed, so a photo that crashes the worker is not retried forever. The
+    claim happens under an IMMEDIATE transaction, so two workers never
+    claim the same job.
+
+    Args:
+    - database_connection: SQLite connection
+    - worker_id: Name recorded on the claimed job
+    - lease_seconds: How long a running job stays claimed
+
+    Returns:
+    - EnrollmentJob or None if nothing is ready
+    """
+    now = time.time()
+    cursor = database_connection.cursor()
+    if database_connection.in_transaction:
+        database_connection.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            SELECT id, child_id, photo_path, attempts FROM enrollment_jobs
+            WHERE status = ? AND claimed_at < ? AND attempts >= max_attempts
+        ''', (RUNNING, now - lease_seconds))
+        for job_id, child_id, photo_path, attempts in cursor.fetchall():
+            error = f"lease expired on attempt {attempts}, worker probably crashed"
+            cursor.execute('UPDATE enrollment_jobs SET status = ?, last_error = ? WHERE id = ?',
+                           (FAILED, error, job_id))
+            cursor.execute('UPDATE children SET encoding_status = ? WHERE id = ? AND picture = ?',
+                           (STATUS_FAILED, child_id, os.path.basename(photo_path)))
+
+        cursor.execute('''
+            SELECT id, child_id, photo_path, attempts, max_attempts FROM enrollment_jobs
+            WHERE (status = ? AND available_at <= ?)
+               OR (status = ? AND claimed_at < ? AND attempts < max_attempts)
+            ORDER BY available_at, id LIMIT 1
+        ''', (QUEUED, now, RUNNING, now - lease_seconds))
+        row = cursor.fetchone()
+        if row is None:
+            database_connection.commit()
+            return None
+
+        cursor.execute('''
+            UPDATE enrollment_jobs SET status = ?, attempts = attempts + 1, claimed_by = ?, claimed_at = ?
+            WHERE id = ?
+        ''', (RUNNING, worker_id, now, row[0]))
+        database_connection.commit()
+    except Exception:
+        database_connection.rollback()
+        raise
+
+    job_id, child_id, photo_path, attempts, max_attempts = row
+    return EnrollmentJob(job_id, child_id, photo_path, attempts + 1, max_attempts)
+
+
+def complete_job(database_connection, job, features):
+    """
+    Store the result of a job and mark it done.
+
+    The encoding is only written if the child's picture is still the photo
+    the job encoded, so a slow job cannot overwrite a newer photo.
+
+    Args:
+    - database_connection: SQLite connection
+    - job: Claimed EnrollmentJob
+    - features: Face feature vector, or None if no face was found
+    """
+    picture = os.path.basename(job.photo_path)
+    if features is not None:
+        encoding, status = encode_encoding(features, MODEL_NAME, normalized=True), STATUS_ENCODED
+    else:
+        encoding, status = None, STATUS_NO_FACE
+
+    cursor = database_connection.cursor()
+    cursor.execute('''
+        UPDATE children SET face_encoding = ?, encoding_status = ?
+        WHERE id = ? AND picture = ?
+    ''', (encoding, status, job.child_id, picture))
+    cursor.execute('UPDATE enrollment_jobs SET status = ?, last_error = NULL WHERE id = ?', (DONE, job.id))
+    database_connection.commit()
+
+
+def fail_job(database_connection, job, error):
+    """
+    Record a failed attempt, retrying with exponential backoff.
+
+    Args:
+    - database_connection: SQLite connection
+    - job: Claimed EnrollmentJob
+    - error: Exception or message describing the failure
+
+    Returns:
+    - True if the job will be retried
+    """
+    cursor = database_connection.cursor()
+    retry = job.attempts < job.max_attempts
+    if retry:
+        delay = RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1)
+        cursor.execute('''
+            UPDATE enrollment_jobs SET status = ?, available_at = ?, last_error = ? WHERE id = ?
+        ''', (QUEUED, time.time() + delay, str(error), job.id))
+    else:
+        cursor.execute('UPDATE enrollment_jobs SET status = ?, last_error = ? WHERE id = ?',
+                       (FAILED, str(error), job.id))
+        cursor.execute('UPDATE children SET encoding_status = ? WHERE id = ? AND picture = ?',
+                       (STATUS_FAILED, job.child_id, os.path.basename(job.photo_path)))
+    database_connection.commit()
+    return retry
+
+
+def process_job(database_connection, job):
+    """
+    Encode the photo for one claimed job.
+
+    A photo without a face completes the job as no_face; a photo that
+    cannot be read or processed is an error, so the job is retried.
+
+    Args:
+    - database_connection: SQLite connection
+    - job: Claimed EnrollmentJob
+
+    Returns:
+    - True if the job finished, False if it failed
+    """
+    try:
+        if not os.path.exists(job.photo_path):
+            raise FileNotFoundError(f"Photo not found: {job.photo_path}")
+        result = extract_face_features_with_box_opencv(pipeline_photo_path(job.photo_path))
+        if result is None:
+            raise ValueError(f"Could not process photo: {job.photo_path}")
+        complete_job(database_connection, job, result[0])
+        return True
+    except Exception as e:
+        print(f"Error processing enrollment job {job.id}: {str(e)}")
+        fail_job(database_connection, job, e)
+        return False
+
+
+def run_worker(database=None, poll_interval=POLL_INTERVAL_SECONDS, drain=False):
+    """
+    Claim and process jobs until stopped.
+
+    Models are loaded once when the worker starts and stay loaded for every
+    job it processes. While idle, the worker also prunes old face index
+    change-log entries so the log does not grow forever.
+
+    Args:
+    - database: Path to the SQLite database (default db.DATABASE)
+    - poll_interval: Seconds to sleep when the queue is empty
+    - drain: Exit once no job is ready instead of polling
+
+    Returns:
+    - Number of jobs processed
+    """
+    # Imported here so the queue functions don't depend on Flask
+    from db import connect, DATABASE
+    from migrations import ensure_schema
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    registry.warm_up([FACE_DNN, HAAR])
+    conn = connect(database or DATABASE)
+    ensure_schema(conn)
+    processed = 0
+    last_prune = None
+    try:
+        while True:
+            job = claim_job(conn, worker_id)
+            if job is None:
+                if last_prune is None or time.monotonic() - last_prune >= PRUNE_INTERVAL_SECONDS:
+                    try:
+                        prune_change_log(conn)
+                    except sqlite3.Error as e:
+                        print(f"Error pruning face index change log: {str(e)}")
+                    last_prune = time.monotonic()
+                if drain:
+                    break
+                time.sleep(poll_interval)
+                continue
+            process_job(conn, job)
+            processed += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+    return processed
+
+
+def queue_stats(database_connection):
+    """
+    Number of jobs in each state.
+
+    Args:
+    - database_connection: SQLite connection
+
+    Returns:
+    - Dictionary mapping job status to count
+    """
+    cursor = database_connection.cursor()
+    cursor.execute('SELECT status, COUNT(*) FROM enrollment_jobs GROUP BY status')
+    return dict(cursor.fetchall())
+
+
+def main():
+    from db import DATABASE
+
+    parser = argparse.ArgumentParser(description="Run face enrollment workers")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('CHILDSAFE_ENROLLMENT_WORKERS', 1)),
+                        help="Worker processes, each with its own loaded models")
+    parser.add_argument('--drain', action='store_true', help="Exit once the queue is empty")
+    parser.add_argument('--stats', action='store_true', help="Show job counts and exit")
+    args = parser.parse_args()
+
+    if args.stats:
+        conn = sqlite3.connect(args.database)
+        try:
+            for status, count in sorted(queue_stats(conn).items()):
+                print(f"{status}: {count}")
+        finally:
+            conn.close()
+        return
+
+    print(f"🚀 Starting {args.workers} enrollment worker(s)")
+    if args.workers == 1:
+        processed = run_worker(args.database, drain=args.drain)
+    else:
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.starmap(run_worker, [(args.database, POLL_INTERVAL_SECONDS, args.drain)] * args.workers)
+        processed = sum(results)
+    print(f"✅ Processed {processed} enrollment job(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+"""
+In-memory face encoding index for ChildSafe
+Keeps every registered encoding in one contiguous float32 matrix so a
+lost-child search is a single matrix-vector product
+"""
+
+import sqlite3
+import threading
+from collections import Counter
+
+import numpy as np
+
+from encoding_codec import decode_encoding
+from metrics import timed
+
+# Compact once tombstones exceed this share of rows (and at least this many)
+COMPACT_RATIO = 0.25
+COMPACT_MIN_TOMBSTONES = 64
+
+
+def _normalize_rows(matrix):
+    """L2-normalise every row in place; all-zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class FaceIndex:
+    """
+    Matrix-backed index over child face encodings.
+
+    Rows of ``matrix`` are L2-normalised float32 encodings and ``ids`` holds
+    the matching ``children.id`` values, so the cosine similarity of a probe
+    against every child is ``matrix @ probe``.
+
+    Rows live in two segments. The base segment is the matrix the index was
+    built from and is never written to, so it can be a read-only memory map
+    shared by every worker (see encoding_store.py). Changes go to a private
+    delta segment: ``append`` grows it with amortised doubling, ``replace``
+    overwrites a delta row (or tombstones the base row and appends), and
+    ``remove`` marks a tombstone that searches skip until ``compact`` drops
+    it. ``version`` is the last change-log version applied by ``sync``.
+    """
+
+    def __init__(self, ids=None, matrix=None, version=0):
+        if matrix is None:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        if not isinstance(matrix, np.memmap):
+            matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        ids = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        if len(ids) != matrix.shape[0]:
+            raise ValueError("ids and matrix must have the same number of rows")
+
+        self._lock = threading.RLock()
+        self._base = matrix
+        self._base_ids = ids
+        self._base_alive = np.ones(len(ids), dtype=bool)
+        self._dimension = matrix.shape[1] if matrix.ndim == 2 else 0
+
+        self._buffer = np.zeros((0, self._dimension), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+
+        # Rows below len(self._base) are base rows, the rest are delta rows
+        self._positions = {int(child_id): row for row, child_id in enumerate(ids)}
+        self.version = version
+
+    @property
+    def matrix(self):
+        if not self._size:
+            return self._base
+        if not len(self._base):
+            return self._buffer[:self._size]
+        return np.vstack([self._base, self._buffer[:self._size]])
+
+    @property
+    def ids(self):
+        if not self._size:
+            return self._base_ids
+        return np.concatenate([self._base_ids, self._ids[:self._size]])
+
+    @property
+    def dimension(self):
+        return self._dimension
+
+    @property
+    def tombstones(self):
+        return len(self._base) + self._size - len(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, child_id):
+        return int(child_id) in self._positions
+
+    @classmethod
+    def from_rows(cls, rows, dimension=None, version=0):
+        """
+        Build an index from (child_id, encoding) pairs.
+
+        Encodings whose length differs from ``dimension`` are skipped, which
+        keeps rows written by a different backend out of the matrix. When no
+        dimension is given the most common one is used.
+
+        Args:
+        - rows: Iterable of (child_id, float32 vector) pairs
+        - dimension: Expected encoding length or None
+        - version: Change-log version the rows reflect
+
+        Returns:
+        - FaceIndex instance
+        """
+        rows = [(child_id, vec) for child_id, vec in rows if vec is not None and len(vec)]
+        if not rows:
+            return cls(version=version)
+
+        if dimension is None:
+            dimension = Counter(len(vec) for _, vec in rows).most_common(1)[0][0]
+        rows = [(child_id, vec) for child_id, vec in rows if len(vec) == dimension]
+
+        matrix = np.empty((len(rows), dimension), dtype=np.float32)
+        for i, (_, vec) in enumerate(rows):
+            matrix[i] = vec
+        ids = np.fromiter((child_id for child_id, _ in rows), dtype=np.int64, count=len(rows))
+        return cls(ids, _normalize_rows(matrix), version=version)
+
+    @classmethod
+    def from_database(cls, database_connection, dimension=None):
+        """
+        Build an index from every encoding in the children table.
+
+        Args:
+        - database_connection: SQLite connection
+        - dimension: Expected encoding length or None
+
+        Returns:
+        - FaceIndex instance
+        """
+        version = current_change_version(database_connection)
+        cursor = database_connection.cursor()
+        cursor.execute('SELECT id, face_encoding FROM children WHERE face_encoding IS NOT NULL')
+        return cls.from_rows(((row[0], decode_encoding(row[1])) for row in cursor), dimension, version)
+
+    def _prepare(self, encoding):
+        """Validate and L2-normalise an encoding for storage."""
+        if encoding is None:
+            return None
+        vec = np.asarray(encoding, dtype=np.float32).ravel()
+        if self._dimension and len(vec) != self._dimension:
+            return None
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def append(self, child_id, encoding):
+        """
+        Add a child's encoding, replacing it if the child is already indexed.
+
+        Args:
+        - child_id: Child's database ID
+        - encoding: Face encoding
+
+        Returns:
+        - True if the encoding was indexed, False if it was rejected
+        """
+        vec = self._prepare(encoding)
+        if vec is None:
+            return False
+
+        with self._lock:
+            child_id = int(child_id)
+            base_rows = len(self._base)
+            row = self._positions.get(child_id)
+            if row is not None and row >= base_rows:
+                self._buffer[row - base_rows] = vec
+                return True
+            if row is not None:
+                # The base segment is read-only: retire the old row
+                self._base_alive[row] = False
+
+            if not self._dimension:
+                self._dimension = len(vec)
+            if self._size == self._buffer.shape[0]:
+                self._grow()
+            self._buffer[self._size] = vec
+            self._ids[self._size] = child_id
+            self._alive[self._size] = True
+            self._positions[child_id] = base_rows + self._size
+            self._size += 1
+            return True
+
+    def replace(self, child_id, encoding):
+        """
+        Overwrite a child's encoding (appends if the child is not indexed).
+
+        Args:
+        - child_id: Child's database ID
+        - encoding: New face encoding
+
+        Returns:
+        - True if the encoding was indexed, False if it was rejected
+        """
+        if self._prepare(encoding) is None:
+            self.remove(child_id)
+            return False
+        return self.append(child_id, encoding)
+
+    def remove(self, child_id):
+        """
+        Tombstone a child's row; compacts once tombstones pile up.
+
+        Args:
+        - child_id: Child's database ID
+
+        Returns:
+        - True if the child was indexed
+        """
+        with self._lock:
+            row = self._positions.pop(int(child_id), None)
+            if row is None:
+                return False
+            base_rows = len(self._base)
+            if row < base_rows:
+                self._base_alive[row] = False
+            else:
+                self._alive[row - base_rows] = False
+            if isinstance(self._base, np.memmap):
+                # compact() can only drop delta rows of a shared memory map
+                reclaimable = self._size - int(np.count_nonzero(self._alive[:self._size]))
+                rows = self._size
+            else:
+                reclaimable, rows = self.tombstones, base_rows + self._size
+            if reclaimable > max(COMPACT_MIN_TOMBSTONES, COMPACT_RATIO * rows):
+                self.compact()
+            return True
+
+    def _grow(self):
+        """Double the delta capacity. Caller holds the lock."""
+        capacity = max(16, 2 * self._buffer.shape[0])
+        buffer = np.zeros((capacity, self._dimension), dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        alive = np.zeros(capacity, dtype=bool)
+        if self._size:
+            buffer[:self._size] = self._buffer[:self._size]
+            ids[:self._size] = self._ids[:self._size]
+            alive[:self._size] = self._alive[:self._size]
+        self._buffer, self._ids, self._alive = buffer, ids, alive
+
+    def compact(self):
+        """
+        Drop tombstoned rows and release unused capacity.
+
+        A memory-mapped base segment is left alone so it stays shared
+        between workers; its tombstones go away when the store is rebuilt.
+        """
+        with self._lock:
+            if isinstance(self._base, np.memmap):
+                keep = np.flatnonzero(self._alive[:self._size])
+                self._buffer = np.ascontiguousarray(self._buffer[keep])
+                self._ids = self._ids[keep]
+                self._alive = np.ones(len(keep), dtype=bool)
+                self._size = len(keep)
+            else:
+                alive = np.concatenate([self._base_alive, self._alive[:self._size]])
+                keep = np.flatnonzero(alive)
+                self._base = np.ascontiguousarray(self.matrix[keep])
+                self._base_ids = self.ids[keep]
+                self._base_alive = np.ones(len(keep), dtype=bool)
+                self._buffer = np.zeros((0, self._dimension), dtype=np.float32)
+                self._ids = np.zeros(0, dtype=np.int64)
+                self._alive = np.zeros(0, dtype=bool)
+                self._size = 0
+
+            base_rows = len(self._base)
+            self._positions = {int(child_id): row
+                               for row, child_id in enumerate(self._base_ids) if self._base_alive[row]}
+            self._positions.update({int(child_id): base_rows + row
+                                    for row, child_id in enumerate(self._ids[:self._size])})
+
+    def sync(self, database_connection):
+        """
+        Apply changes recorded in the change log since ``version``.
+
+        Only the children named in the delta are re-read. If the log has
+        been pruned past this index's version the caller must rebuild.
+
+        Args:
+        - database_connection: SQLite connection
+
+        Returns:
+        - True if the index is now current, False if a full rebuild is needed
+        """
+        cursor = database_connection.cursor()
+        cursor.execute('SELECT MIN(version), MAX(version) FROM face_index_changes')
+        oldest, latest = cursor.fetchone()
+        if latest is None or latest <= self.version:
+            return True
+        if oldest > self.version + 1:
+            return False
+
+        cursor.execute('SELECT DISTINCT child_id FROM face_index_changes WHERE version > ? AND version <= ?',
+                       (self.version, latest))
+        changed = [row[0] for row in cursor.fetchall()]
+        for child_id in changed:
+            cursor.execute('SELECT face_encoding FROM children WHERE id = ?', (child_id,))
+            row = cursor.fetchone()
+            encoding = decode_encoding(row[0]) if row else None
+            if encoding is None:
+                self.remove(child_id)
+            else:
+                self.replace(child_id, encoding)
+
+        self.version = latest
+        return True
+
+    @timed('index_search')
+    def search(self, probe, k=5):
+        """
+        Find the k most similar children to a probe encoding.
+
+        Args:
+        - probe: Probe face encoding
+        - k: Number of results
+
+        Returns:
+        - List of (child_id, cosine_similarity) sorted best first
+        """
+        with self._lock:
+            base, base_ids = self._base, self._base_ids
+            delta, delta_ids = self._buffer[:self._size], self._ids[:self._size]
+            alive = None
+            if self.tombstones:
+                alive = np.concatenate([self._base_alive, self._alive[:self._size]])
+            live = len(self._positions)
+
+        if live == 0 or probe is None:
+            return []
+
+        query = np.asarray(probe, dtype=np.float32)
+        if query.shape != (self._dimension,):
+            return []
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        if len(delta):
+            scores = np.concatenate([base @ query if len(base) else np.zeros(0, dtype=np.float32),
+                                     delta @ query])
+            ids = np.concatenate([base_ids, delta_ids])
+        else:
+            scores, ids = base @ query, base_ids
+        if alive is not None:
+            scores[~alive] = -np.inf
+
+        n = len(scores)
+        k = min(k, live)
+        if k < n:
+            top = np.argpartition(scores, n - k)[n - k:]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+# Change log table and the triggers that feed it, also applied by migrations
+CHANGE_LOG_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS face_index_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        child_id INTEGER NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS children_face_index_insert
+    AFTER INSERT ON children WHEN NEW.face_encoding IS NOT NULL
+    BEGIN
+        INSERT INTO face_index_changes (child_id) VALUES (NEW.id);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS children_face_index_update
+    AFTER UPDATE OF face_encoding ON children
+    BEGIN
+        INSERT INTO face_index_changes (child_id) VALUES (NEW.id);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS children_face_index_delete
+    AFTER DELETE ON children
+    BEGIN
+        INSERT INTO face_index_changes (child_id) VALUES (OLD.id);
+    END''',
+]
+
+
+def create_change_log(database_connection):
+    """
+    Create the face index change log and the triggers that feed it.
+
+    Every insert, encoding update or delete on children bumps the change
+    version, so any process (web worker, enrollment worker, bulk encoder)
+    that writes an encoding is visible to every other worker's index.
+
+    Args:
+    - database_connection: SQLite connection
+    """
+    cursor = database_connection.cursor()
+    for statement in CHANGE_LOG_SCHEMA:
+        cursor.execute(statement)
+    database_connection.commit()
+
+
+def current_change_version(database_connection):
+    """
+    Latest change-log version, or 0 if nothing has been recorded.
+
+    Args:
+    - database_connection: SQLite connection
+    """
+    try:
+        cursor = database_connection.cursor()
+        cursor.execute('SELECT MAX(version) FROM face_index_changes')
+        return cursor.fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def prune_change_log(database_connection, max_age_hours=24):
+    """
+    Delete old change-log entries.
+
+    The newest entry is always kept so the version never goes backwards.
+    Workers whose index is older than the remaining log rebuild from scratch.
+
+    Args:
+    - database_connection: SQLite connection
+    - max_age_hours: Entries older than this are removed
+    """
+    cursor = database_connection.cursor()
+    cursor.execute('''
+        DELETE FROM face_index_changes
+        WHERE changed_at < datetime('now', ?)
+          AND version < (SELECT MAX(version) FROM face_index_changes)
+    ''', (f'-{int(max_age_hours)} hours',))
+    database_connection.commit()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _build_index(database_connection, store):
+    """Build an index from the shared store if there is one, else from SQLite."""
+    if store is not None:
+        index = store.to_index()
+        if index is not None and index.sync(database_connection):
+            return index
+        print("⚠️ Encoding store is older than the change log, loading encodings from the database")
+    return FaceIndex.from_database(database_connection)
+
+
+def get_face_index(database_connection=None, database=None):
+    """
+    Get the process-wide face index, bringing it up to date.
+
+    The index is built on first use, from the memory-mapped encoding store
+    when one has been published and from the children table otherwise.
+    Later calls remap if a new store generation was swapped in, and
+    otherwise compare the index version with the change log and apply only
+    the delta written by other workers.
+
+    Args:
+    - database_connection: SQLite connection to reuse, e.g. the request's
+    - database: Path to the SQLite database, used when no connection is
+      given (default db.DATABASE)
+
+    Returns:
+    - FaceIndex instance
+    """
+    # Imported here because encoding_store builds on this module
+    from encoding_store import get_encoding_store
+    from db import DATABASE
+
+    global _index
+    with _index_lock:
+        conn = database_connection if database_connection is not None else sqlite3.connect(database or DATABASE)
+        try:
+            store = get_encoding_store()
+            swapped = store is not None and store.refresh()
+            if _index is None or swapped or not _index.sync(conn):
+                _index = _build_index(conn, store)
+        except sqlite3.Error as e:
+            print(f"Error building face index: {str(e)}")
+            if _index is None:
+                return FaceIndex()
+        finally:
+            if database_connection is None:
+                conn.close()
+    return _index
+
+
+def index_child(child_id, encoding):
+    """
+    Apply a new or changed encoding to this worker's index.
+
+    Other workers pick the change up from the change log on their next
+    search. Nothing happens if this worker has not built its index yet.
+
+    Args:
+    - child_id: Child's database ID
+    - encoding: Face encoding, or None to drop the child from the index
+    """
+    with _index_lock:
+        index = _index
+    if index is None:
+        return
+    if encoding is None:
+        index.remove(child_id)
+    else:
+        index.replace(child_id, encoding)
+
+
+def unindex_child(child_id):
+    """
+    Tombstone a deleted child in this worker's index.
+
+    Args:
+    - child_id: Child's database ID
+    """
+    index_child(child_id, None)
+
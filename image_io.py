@@ -0,0 +1,138 @@
+"""
+Image decoding helpers for ChildSafe
+Decodes an upload once (at reduced resolution when it is large) so the
+same buffer can be shared by detection, cropping and feature extraction
+"""
+
+import io
+import mmap
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from metrics import stage_timer
+
+# Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale as long as the long
+# side stays at least this many pixels. Face detection runs at 300x300 and
+# features at 128x128, so full-resolution phone photos are never needed.
+DECODE_TARGET_SIZE = int(os.environ.get('CHILDSAFE_DECODE_TARGET_SIZE', 800))
+
+# Encoded image data that can be decoded in place (see upload_stream.py)
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+class _BufferReader(io.RawIOBase):
+    """Read-only file over a buffer, so PIL can parse the header without a copy."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._position))
+        b[:n] = self._view[self._position:self._position + n]
+        self._position += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        # Release the export so an underlying mmap can be closed
+        self._view.release()
+        super().close()
+
+
+def _probe_image(source):
+    """
+    Read the image header without decoding pixel data.
+
+    Args:
+    - source: Path or file-like object
+
+    Returns:
+    - (format, (width, height)) or (None, None) if the header is unreadable
+    """
+    try:
+        with Image.open(source) as img:
+            return img.format, img.size
+    except Exception:
+        return None, None
+
+
+def reduced_decode_flag(image_format, size, target_size=DECODE_TARGET_SIZE):
+    """
+    Pick the cv2 imread flag for a reduced-resolution decode.
+
+    Only JPEG can be decoded at reduced scale without first decoding the
+    full image, so every other format uses a plain colour decode.
+
+    Args:
+    - image_format: PIL format name ('JPEG', 'PNG', ...)
+    - size: (width, height) of the stored image
+    - target_size: Smallest acceptable long side after reduction
+
+    Returns:
+    - cv2 imread flag
+    """
+    if image_format != 'JPEG' or not size or not target_size:
+        return cv2.IMREAD_COLOR
+
+    long_side = max(size)
+    for factor, flag in _REDUCED_FLAGS:
+        if long_side // factor >= target_size:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def load_image(image_path_or_bytes, target_size=DECODE_TARGET_SIZE):
+    """
+    Decode an image once into a BGR ndarray.
+
+    Args:
+    - image_path_or_bytes: Path to image file, image bytes (or a memoryview
+      or mmap of them, decoded in place), or an already decoded BGR ndarray
+      (returned unchanged)
+    - target_size: Smallest acceptable long side for reduced JPEG decoding,
+      or None to always decode at full resolution
+
+    Returns:
+    - BGR image as a numpy array or None if decoding fails
+    """
+    if isinstance(image_path_or_bytes, np.ndarray):
+        return image_path_or_bytes
+
+    try:
+        with stage_timer('decode'):
+            if isinstance(image_path_or_bytes, (str, os.PathLike)):
+                path = os.fspath(image_path_or_bytes)
+                image_format, size = _probe_image(path)
+                return cv2.imread(path, reduced_decode_flag(image_format, size, target_size))
+
+            with _BufferReader(image_path_or_bytes) as reader:
+                image_format, size = _probe_image(reader)
+            buffer = np.frombuffer(image_path_or_bytes, np.uint8)
+            return cv2.imdecode(buffer, reduced_decode_flag(image_format, size, target_size))
+
+    except Exception as e:
+        print(f"Error decoding image: {str(e)}")
+        return None
@@ -0,0 +1,284 @@
+"""
+Instrumentation for ChildSafe
+Per-stage timings of the face pipeline and of requests, kept as in-process
+histograms and exposed in Prometheus text format at /metrics, plus one
+structured log line per request
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+# CHILDSAFE_METRICS=0 turns timers and decorators into no-ops (read at import)
+ENABLED = os.environ.get('CHILDSAFE_METRICS', '1') != '0'
+# Bearer token required to read /metrics; empty leaves it open
+METRICS_TOKEN = os.environ.get('CHILDSAFE_METRICS_TOKEN', '')
+
+# Upper bounds in seconds, from sub-millisecond array work to slow requests
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage durations of the current request, when one is being traced
+_trace = ContextVar('childsafe_trace', default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations, as Prometheus expects."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, count of observations <= bound) pairs, ending with +Inf."""
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """
+    Process-wide store of stage histograms, request histograms, counters
+    and gauge collectors.
+
+    Each gunicorn worker keeps its own numbers; Prometheus sums them when
+    it scrapes every worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.requests = {}
+        self.counters = {}
+        self.collectors = {}
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+        trace = _trace.get()
+        if trace is not None:
+            trace[stage] = trace.get(stage, 0.0) + seconds
+
+    def observe_request(self, endpoint, status, seconds):
+        key = (endpoint, str(status))
+        with self._lock:
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, event, amount=1):
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def register_collector(self, name, collect):
+        """
+        Export the numeric values of a stats function as gauges.
+
+        Args:
+        - name: Metric name prefix, e.g. 'probe_cache'
+        - collect: Callable returning a dictionary of numbers
+        """
+        self.collectors[name] = collect
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.requests.clear()
+            self.counters.clear()
+
+    def render(self):
+        """
+        All metrics in Prometheus text exposition format.
+
+        Returns:
+        - Text for the /metrics endpoint
+        """
+        lines = []
+        with self._lock:
+            stages = {stage: (h.cumulative(), h.sum, h.count) for stage, h in self.stages.items()}
+            requests = {key: (h.cumulative(), h.sum, h.count) for key, h in self.requests.items()}
+            counters = dict(self.counters)
+
+        lines.append('# HELP childsafe_stage_duration_seconds Time spent in each face pipeline stage')
+        lines.append('# TYPE childsafe_stage_duration_seconds histogram')
+        for stage, data in sorted(stages.items()):
+            _render_histogram(lines, 'childsafe_stage_duration_seconds', f'stage="{stage}"', data)
+
+        lines.append('# HELP childsafe_request_duration_seconds Request latency by endpoint and status')
+        lines.append('# TYPE childsafe_request_duration_seconds histogram')
+        for (endpoint, status), data in sorted(requests.items()):
+            _render_histogram(lines, 'childsafe_request_duration_seconds',
+                              f'endpoint="{endpoint}",status="{status}"', data)
+
+        lines.append('# HELP childsafe_events_total Pipeline events such as detector fallbacks')
+        lines.append('# TYPE childsafe_events_total counter')
+        for event, value in sorted(counters.items()):
+            lines.append(f'childsafe_events_total{{event="{event}"}} {value}')
+
+        for name, collect in sorted(self.collectors.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Error collecting {name} metrics: {str(e)}")
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f'childsafe_{name}_{key}'
+                lines.append(f'# TYPE {metric} gauge')
+                lines.append(f'{metric} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def _render_histogram(lines, metric, labels, data):
+    cumulative, total, count = data
+    for bound, value in cumulative:
+        lines.append(f'{metric}_bucket{{{labels},le="{_format_bound(bound)}"}} {value}')
+    lines.append(f'{metric}_sum{{{labels}}} {total}')
+    lines.append(f'{metric}_count{{{labels}}} {count}')
+
+
+metrics = Metrics()
+
+
+class _StageTimer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics.observe_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage_timer(stage):
+    """
+    Context manager recording how long a block takes.
+
+    Args:
+    - stage: Stage name, e.g. 'detect_dnn'
+
+    Returns:
+    - Context manager (a shared no-op when instrumentation is disabled)
+    """
+    return _StageTimer(stage) if ENABLED else _NULL_TIMER
+
+
+def timed(stage):
+    """
+    Decorator recording the duration of every call under a stage name.
+
+    When instrumentation is disabled the function is returned unchanged.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe_stage(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count_event(event, amount=1):
+    """Increment an event counter, e.g. 'haar_fallback'."""
+    if ENABLED:
+        metrics.increment(event, amount)
+
+
+def init_app(app):
+    """
+    Time every request, log it as one JSON line and serve /metrics.
+
+    Args:
+    - app: Flask application
+    """
+    from flask import Response, g, request, session
+
+    if not ENABLED:
+        return
+
+    @app.before_request
+    def _start_request_trace():
+        g.metrics_start = time.perf_counter()
+        g.metrics_token = _trace.set({})
+
+    @app.after_request
+    def _finish_request_trace(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        stages = _trace.get() or {}
+
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe_request(endpoint, response.status_code, duration)
+        if endpoint != 'static':
+            print(json.dumps({
+                'event': 'request',
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'user': session.get('username'),
+                'stages_ms': {stage: round(seconds * 1000, 2) for stage, seconds in stages.items()},
+            }), flush=True)
+        return response
+
+    @app.teardown_request
+    def _end_request_trace(exc):
+        token = g.pop('metrics_token', None)
+        if token is not None:
+            _trace.reset(token)
+
+    def metrics_endpoint():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
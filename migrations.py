@@ -0,0 +1,224 @@
+"""
+Versioned schema migrations for ChildSafe
+Brings child_registry.db up to the current schema and records the version
+in PRAGMA user_version, so app start-up only has to compare one number
+"""
+
+import argparse
+import sqlite3
+
+from face_index import CHANGE_LOG_SCHEMA
+
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {column[1] for column in cursor.fetchall()}
+
+
+def _create_base_tables(cursor):
+    """Children and users tables, upgrading databases from create_database.py."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS children (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT,
+            last_name TEXT,
+            huduma_number TEXT UNIQUE NOT NULL,
+            dob DATE NOT NULL,
+            gender TEXT,
+            mother_first_name TEXT NOT NULL,
+            mother_last_name TEXT NOT NULL,
+            father_first_name TEXT NOT NULL,
+            father_last_name TEXT NOT NULL,
+            mother_contact TEXT NOT NULL,
+            father_contact TEXT NOT NULL,
+            county TEXT NOT NULL,
+            sub_county TEXT NOT NULL,
+            ward TEXT NOT NULL,
+            picture TEXT NOT NULL
+        )
+    ''')
+    # Databases created before the gender column existed
+    if 'gender' not in _columns(cursor, 'children'):
+        cursor.execute('ALTER TABLE children ADD COLUMN gender TEXT')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            is_admin INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def _add_face_encoding_column(cursor):
+    """Encoded face for each child (see encoding_codec)."""
+    if 'face_encoding' not in _columns(cursor, 'children'):
+        cursor.execute('ALTER TABLE children ADD COLUMN face_encoding BLOB')
+
+
+def _create_face_index_change_log(cursor):
+    """Change log that keeps every worker's face index current."""
+    for statement in CHANGE_LOG_SCHEMA:
+        cursor.execute(statement)
+
+
+def _create_query_indexes(cursor):
+    """Indexes for location, date of birth, surname and admin lookups."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_children_location ON children (county, sub_county, ward)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_children_dob ON children (dob)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_children_last_name ON children (last_name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_is_admin ON users (is_admin)')
+    # Only rows with an encoding, so loading the face index skips the rest
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_children_with_encoding
+        ON children (id) WHERE face_encoding IS NOT NULL
+    ''')
+
+
+def _create_enrollment_queue(cursor):
+    """Persistent face enrollment jobs and each child's encoding status."""
+    if 'encoding_status' not in _columns(cursor, 'children'):
+        cursor.execute('ALTER TABLE children ADD COLUMN encoding_status TEXT')
+    cursor.execute("UPDATE children SET encoding_status = 'encoded' WHERE face_encoding IS NOT NULL")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS enrollment_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            child_id INTEGER NOT NULL,
+            photo_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            available_at REAL NOT NULL,
+            claimed_by TEXT,
+            claimed_at REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_enrollment_jobs_ready
+        ON enrollment_jobs (status, available_at)
+    ''')
+
+
+def _add_role_version_column(cursor):
+    """Per-user counter bumped on every role change (see role_cache)."""
+    if 'role_version' not in _columns(cursor, 'users'):
+        cursor.execute('ALTER TABLE users ADD COLUMN role_version INTEGER NOT NULL DEFAULT 0')
+
+
+# (version, description, step) in the order they are applied. Append new
+# migrations at the end; never renumber or edit one that has shipped.
+MIGRATIONS = [
+    (1, 'Create children and users tables', _create_base_tables),
+    (2, 'Add children.face_encoding', _add_face_encoding_column),
+    (3, 'Create face index change log', _create_face_index_change_log),
+    (4, 'Add query indexes', _create_query_indexes),
+    (5, 'Create enrollment job queue', _create_enrollment_queue),
+    (6, 'Add users.role_version', _add_role_version_column),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(database_connection):
+    """
+    Schema version recorded in the database.
+
+    Args:
+    - database_connection: SQLite connection
+
+    Returns:
+    - Version number, 0 for a new or unversioned database
+    """
+    return database_connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(database_connection, target=SCHEMA_VERSION):
+    """
+    Apply every pending migration up to target.
+
+    Each migration runs in its own IMMEDIATE transaction together with the
+    version bump, so a failure leaves the database at the previous version.
+    The version is re-read under the write lock, so workers starting at the
+    same time apply each migration once.
+
+    Args:
+    - database_connection: SQLite connection
+    - target: Version to migrate to
+
+    Returns:
+    - List of versions that were applied
+    """
+    applied = []
+    cursor = database_connection.cursor()
+    for version, description, step in MIGRATIONS:
+        if version > target:
+            break
+        if schema_version(database_connection) >= version:
+            continue
+
+        if database_connection.in_transaction:
+            database_connection.commit()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(database_connection) >= version:
+                database_connection.rollback()
+                continue
+            step(cursor)
+            cursor.execute(f'PRAGMA user_version = {int(version)}')
+            database_connection.commit()
+        except Exception:
+            database_connection.rollback()
+            raise
+        print(f"✅ Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def ensure_schema(database_connection):
+    """
+    Migrate the database if it is behind the code.
+
+    This is the start-up check: when the schema is current it costs a
+    single PRAGMA read.
+
+    Args:
+    - database_connection: SQLite connection
+
+    Returns:
+    - True if any migration was applied
+    """
+    if schema_version(database_connection) >= SCHEMA_VERSION:
+        return False
+    return bool(migrate(database_connection))
+
+
+def main():
+    from db import DATABASE
+
+    parser = argparse.ArgumentParser(description="Create or upgrade the ChildSafe database schema")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--status', action='store_true', help="Show the schema version without migrating")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    try:
+        current = schema_version(conn)
+        if args.status:
+            print(f"Schema version {current} (latest {SCHEMA_VERSION})")
+            for version, description, _ in MIGRATIONS:
+                state = 'applied' if version <= current else 'pending'
+                print(f"  {version}: {description} [{state}]")
+            return
+
+        applied = migrate(conn)
+        if not applied:
+            print(f"✅ Database schema is up to date (version {current})")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Process-wide model registry for ChildSafe
+Loads face detection/recognition models once per worker process and
+hands the same instance to every caller
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import cv2
+
+MODELS_DIR = Path('models')
+FACE_PROTO = MODELS_DIR / 'opencv_face_detector.pbtxt'
+FACE_MODEL = MODELS_DIR / 'opencv_face_detector_uint8.pb'
+HAAR_CASCADE = 'haarcascade_frontalface_default.xml'
+
+FACE_DNN = 'face_dnn'
+HAAR = 'haar_cascade'
+DEEPFACE_PREFIX = 'deepface:'
+
+
+class ModelRegistry:
+    """
+    Thread-safe, lazily populated cache of loaded models.
+
+    Each model is registered with a loader callable. The first ``get`` runs
+    the loader under a lock; later calls return the cached instance. Models
+    registered with ``per_thread=True`` (e.g. cv2.dnn nets, whose forward
+    pass keeps per-instance state) get one instance per thread instead.
+    A loader returning None is recorded as a failure and not retried until
+    ``reset`` is called, so a missing model file does not hit the disk or
+    network on every request.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaders = {}
+        self._shared = {}
+        self._local = threading.local()
+        self._stats = {}
+
+    def register(self, name, loader, per_thread=False):
+        """
+        Register a model loader.
+
+        Args:
+        - name: Registry key
+        - loader: Zero-argument callable returning the loaded model (or None)
+        - per_thread: Load one instance per thread instead of per process
+        """
+        with self._lock:
+            self._loaders[name] = (loader, per_thread)
+            self._stats.setdefault(name, {
+                'loads': 0,
+                'load_seconds': 0.0,
+                'reuses': 0,
+                'failures': 0,
+                'per_thread': per_thread,
+            })
+
+    def is_registered(self, name):
+        return name in self._loaders
+
+    def _load(self, name, loader):
+        """Run a loader and record its timing. Caller holds the lock."""
+        stats = self._stats[name]
+        start = time.perf_counter()
+        try:
+            model = loader()
+        except Exception as e:
+            print(f"Error loading model {name}: {e}")
+            model = None
+        stats['load_seconds'] += time.perf_counter() - start
+        stats['loads'] += 1
+        if model is None:
+            stats['failures'] += 1
+        return model
+
+    def get(self, name):
+        """
+        Get a loaded model, loading it on first use.
+
+        Args:
+        - name: Registry key
+
+        Returns:
+        - The model instance, or None if it could not be loaded
+        """
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model: {name}")
+        loader, per_thread = self._loaders[name]
+
+        if per_thread:
+            cache = self._local.__dict__.setdefault('models', {})
+            if name in cache:
+                with self._lock:
+                    self._stats[name]['reuses'] += 1
+                return cache[name]
+            with self._lock:
+                model = self._load(name, loader)
+            cache[name] = model
+            return model
+
+        if name in self._shared:
+            with self._lock:
+                self._stats[name]['reuses'] += 1
+            return self._shared[name]
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if name in self._shared:
+                self._stats[name]['reuses'] += 1
+                return self._shared[name]
+            model = self._load(name, loader)
+            self._shared[name] = model
+            return model
+
+    def reset(self, name=None):
+        """
+        Drop cached instances so the next ``get`` reloads them.
+
+        Only the calling thread's per-thread instances can be dropped;
+        other threads keep theirs until they exit.
+
+        Args:
+        - name: Registry key, or None to drop everything
+        """
+        with self._lock:
+            cache = self._local.__dict__.get('models', {})
+            if name is None:
+                self._shared.clear()
+                cache.clear()
+            else:
+                self._shared.pop(name, None)
+                cache.pop(name, None)
+
+    def warm_up(self, names=None):
+        """
+        Load models ahead of the first request.
+
+        Args:
+        - names: Registry keys to load, or None for every registered model
+
+        Returns:
+        - Dictionary mapping each name to True if it loaded
+        """
+        if names is None:
+            names = list(self._loaders)
+        return {name: self.get(name) is not None for name in names}
+
+    def stats(self):
+        """
+        Load times and reuse counts for every registered model.
+
+        Returns:
+        - Dictionary keyed by model name
+        """
+        with self._lock:
+            return {name: dict(values) for name, values in self._stats.items()}
+
+
+def _load_face_dnn():
+    """Load the OpenCV DNN face detector, downloading it if needed."""
+    if not (FACE_PROTO.exists() and FACE_MODEL.exists()):
+        # Imported here to avoid a circular import at module load
+        from opencv_face_recognition import download_face_models
+        download_face_models()
+        if not (FACE_PROTO.exists() and FACE_MODEL.exists()):
+            return None
+    return cv2.dnn.readNetFromTensorflow(str(FACE_MODEL), str(FACE_PROTO))
+
+
+def _load_haar_cascade():
+    """Load the Haar cascade frontal face classifier."""
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + HAAR_CASCADE)
+    if cascade.empty():
+        return None
+    return cascade
+
+
+registry = ModelRegistry()
+registry.register(FACE_DNN, _load_face_dnn, per_thread=True)
+registry.register(HAAR, _load_haar_cascade)
+
+
+def get_deepface_model(model_name='VGG-Face'):
+    """
+    Get a DeepFace recognition model, building it once per process.
+
+    DeepFace keeps its own model cache, so building through the registry
+    also warms the model DeepFace.represent/verify will use.
+
+    Args:
+    - model_name: DeepFace model name ('VGG-Face', 'Facenet', ...)
+
+    Returns:
+    - The built model or None if DeepFace is unavailable
+    """
+    name = DEEPFACE_PREFIX + model_name
+    if not registry.is_registered(name):
+        def loader():
+            from deepface import DeepFace
+            return DeepFace.build_model(model_name)
+        registry.register(name, loader)
+    return registry.get(name)
+
+
+def model_stats():
+    """Load times and reuse counts for every registered model."""
+    return registry.stats()
+
+
+def warm_up_from_environment():
+    """
+    Warm up models listed in CHILDSAFE_WARM_MODELS.
+
+    The variable is a comma-separated list of registry keys, e.g.
+    ``face_dnn,haar_cascade,deepface:VGG-Face``. ``all`` loads the OpenCV
+    detectors. Unset or empty means models load lazily on first use.
+
+    Returns:
+    - Dictionary mapping each warmed model to True if it loaded
+    """
+    names = [n.strip() for n in os.environ.get('CHILDSAFE_WARM_MODELS', '').split(',') if n.strip()]
+    if not names:
+        return {}
+    if 'all' in names:
+        names = [FACE_DNN, HAAR] + [n for n in names if n.startswith(DEEPFACE_PREFIX)]
+
+    results = {}
+    for name in names:
+        if name.startswith(DEEPFACE_PREFIX):
+            results[name] = get_deepface_model(name[len(DEEPFACE_PREFIX):]) is not None
+        elif registry.is_registered(name):
+            results[name] = registry.get(name) is not None
+        else:
+            print(f"⚠️ Unknown model in CHILDSAFE_WARM_MODELS: {name}")
+    return results
+
+
+warm_up_from_environment()
@@ -7,28 +7,34 @@ import cv2
 import numpy as np
 import os
 from PIL import Image
-import base64
 import urllib.request
 from pathlib import Path
+from lbp_features import local_binary_pattern
+from model_registry import registry, FACE_DNN, HAAR
+from image_io import load_image, BUFFER_TYPES
+from encoding_codec import encode_encoding, decode_encoding
+from probe_cache import cached_probe
+from metrics import stage_timer, timed, count_event
 
+# Model name recorded in the header of stored encodings
+MODEL_NAME = 'OpenCV-LBP'
+# Bump when detection or feature extraction changes, so cached probes expire
+PIPELINE_VERSION = f"{MODEL_NAME}:1"
+
+@timed('detect_haar')
 def detect_faces_opencv(image_path_or_bytes):
     """
     Detect faces using OpenCV's Haar Cascade classifier.
     
     Args:
-    - image_path_or_bytes: Path to image file or image bytes
+    - image_path_or_bytes: Path to image file, image bytes or decoded BGR image
     
     Returns:
     - List of face rectangles or empty list if no faces found
     """
     try:
-        # Load the image
-        if isinstance(image_path_or_bytes, str):
-            image = cv2.imread(image_path_or_bytes)
-        else:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_path_or_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Load the image (no-op if it is already decoded)
+        image = load_image(image_path_or_bytes)
         
         if image is None:
             return []
@@ -36,8 +42,10 @@ def detect_faces_opencv(image_path_or_bytes):
         # Convert to grayscale
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
-        # Load the face cascade classifier
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # Get the shared face cascade classifier
+        face_cascade = registry.get(HAAR)
+        if face_cascade is None:
+            return []
         
         # Detect faces
         faces = face_cascade.detectMultiScale(gray, 1.1, 4)
@@ -87,49 +95,41 @@ def download_face_models():
 def get_face_detector():
     """
     Get OpenCV DNN face detector.
+    The net is loaded once per thread by the model registry.
     """
-    models_dir = Path('models')
-    face_proto = models_dir / 'opencv_face_detector.pbtxt'
-    face_model = models_dir / 'opencv_face_detector_uint8.pb'
-    
-    if not (face_proto.exists() and face_model.exists()):
-        if not download_face_models():
-            return None
-    
-    try:
-        net = cv2.dnn.readNetFromTensorflow(str(face_model), str(face_proto))
-        return net
-    except Exception as e:
-        print(f"Error loading face detector: {e}")
-        return None
+    return registry.get(FACE_DNN)
 
 def detect_faces_dnn(image_path_or_bytes, confidence_threshold=0.5):
     """
     Detect faces using OpenCV DNN (more accurate than Haar Cascades).
+    
+    Args:
+    - image_path_or_bytes: Path to image file, image bytes or decoded BGR image
+    - confidence_threshold: Minimum detection confidence
+    
+    Returns:
+    - List of face rectangles or empty list if no faces found
     """
+    # Decode once so the Haar fallback reuses the same buffer
+    image = load_image(image_path_or_bytes)
+    if image is None:
+        return []
+    
     try:
-        # Load the image
-        if isinstance(image_path_or_bytes, str):
-            image = cv2.imread(image_path_or_bytes)
-        else:
-            nparr = np.frombuffer(image_path_or_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            return []
-        
         # Get face detector
         net = get_face_detector()
         if net is None:
             # Fallback to Haar Cascades
-            return detect_faces_opencv(image_path_or_bytes)
+            count_event('haar_fallback')
+            return detect_faces_opencv(image)
         
         h, w = image.shape[:2]
         
         # Create blob from image
-        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), [104, 117, 123])
-        net.setInput(blob)
-        detections = net.forward()
+        with stage_timer('detect_dnn'):
+            blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), [104, 117, 123])
+            net.setInput(blob)
+            detections = net.forward()
         
         faces = []
         for i in range(detections.shape[2]):
@@ -146,40 +146,65 @@ def detect_faces_dnn(image_path_or_bytes, confidence_threshold=0.5):
     except Exception as e:
         print(f"Error in DNN face detection: {e}")
         # Fallback to Haar Cascades
-        return detect_faces_opencv(image_path_or_bytes)
+        count_event('haar_fallback')
+        return detect_faces_opencv(image)
 
-def extract_face_features_opencv(image_path_or_bytes):
+def extract_face_features_opencv(image_path_or_bytes, digest=None):
     """
     Extract face features using improved OpenCV methods.
     Uses Local Binary Patterns (LBP) for better face representation.
+    Results for uploaded bytes are cached by content hash (see probe_cache.py).
     
     Args:
-    - image_path_or_bytes: Path to image file or image bytes
+    - image_path_or_bytes: Path to image file, image bytes (or a memoryview
+      or mmap of them) or decoded BGR image
+    - digest: SHA-256 of the bytes if already known (skips hashing them)
     
     Returns:
     - Face feature vector or None if no face found
     """
+    if isinstance(image_path_or_bytes, BUFFER_TYPES):
+        probe = cached_probe(image_path_or_bytes, PIPELINE_VERSION,
+                             lambda: extract_face_features_with_box_opencv(image_path_or_bytes), digest)
+        return probe.features if probe is not None else None
+
+    result = extract_face_features_with_box_opencv(image_path_or_bytes)
+    return result[0] if result is not None else None
+
+@timed('extract_features')
+def extract_face_features_with_box_opencv(image_path_or_bytes):
+    """
+    Extract face features and the face they were taken from.
+    
+    Args:
+    - image_path_or_bytes: Path to image file, image bytes or decoded BGR image
+    
+    Returns:
+    - (features, (x, y, w, h)); (None, None) if no face was found; None if
+      the image could not be processed
+    """
     try:
+        # Decode once; detection, cropping and features share this buffer
+        image = load_image(image_path_or_bytes)
+        if image is None:
+            return None
+        
         # Use DNN face detection for better accuracy
-        faces = detect_faces_dnn(image_path_or_bytes)
+        faces = detect_faces_dnn(image)
         
         if not faces:
             # Fallback to Haar Cascades
-            faces = detect_faces_opencv(image_path_or_bytes)
+            count_event('haar_retry')
+            faces = detect_faces_opencv(image)
             
         if not faces:
-            return None
-        
-        # Load the image
-        if isinstance(image_path_or_bytes, str):
-            image = cv2.imread(image_path_or_bytes)
-        else:
-            nparr = np.frombuffer(image_path_or_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            count_event('no_face_found')
+            return None, None
         
         # Get the largest face (most prominent)
         face = max(faces, key=lambda f: f[2] * f[3])  # largest by area
         x, y, w, h = face
+        box = (int(x), int(y), int(w), int(h))
         
         # Add padding around face
         padding = int(min(w, h) * 0.1)
@@ -210,35 +235,10 @@ def extract_face_features_opencv(image_path_or_bytes):
         hist = cv2.calcHist([gray_face], [0], None, [256], [0, 256])
         features.extend(hist.flatten())
         
-        # 2. Local Binary Pattern (manual implementation)
-        def local_binary_pattern(image, radius=1, n_points=8):
-            """Simple LBP implementation."""
-            h, w = image.shape
-            lbp_image = np.zeros((h, w), dtype=np.uint8)
-            
-            for i in range(radius, h - radius):
-                for j in range(radius, w - radius):
-                    center = image[i, j]
-                    binary_string = ''
-                    
-                    # Sample points around the center
-                    for k in range(n_points):
-                        angle = 2 * np.pi * k / n_points
-                        x = int(i + radius * np.cos(angle))
-                        y = int(j + radius * np.sin(angle))
-                        
-                        if 0 <= x < h and 0 <= y < w:
-                            binary_string += '1' if image[x, y] >= center else '0'
-                        else:
-                            binary_string += '0'
-                    
-                    lbp_image[i, j] = int(binary_string, 2)
-            
-            return lbp_image
-        
-        # Apply LBP
-        lbp_img = local_binary_pattern(gray_face)
-        lbp_hist = cv2.calcHist([lbp_img], [0], None, [256], [0, 256])
+        # 2. Local Binary Pattern (vectorized, see lbp_features.py)
+        with stage_timer('lbp'):
+            lbp_img = local_binary_pattern(gray_face)
+            lbp_hist = cv2.calcHist([lbp_img], [0], None, [256], [0, 256])
         features.extend(lbp_hist.flatten())
         
         # 3. Resized face (normalized)
@@ -247,15 +247,17 @@ def extract_face_features_opencv(image_path_or_bytes):
         features.extend(face_normalized)
         
         # 4. Edge features
-        edges = cv2.Canny(gray_face, 50, 150)
+        with stage_timer('canny'):
+            edges = cv2.Canny(gray_face, 50, 150)
         edge_features = cv2.resize(edges, (32, 32)).flatten().astype(np.float32)
         edge_features = edge_features / 255.0
         features.extend(edge_features)
         
         # 5. Gradient features
-        grad_x = cv2.Sobel(gray_face, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(gray_face, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
+        with stage_timer('sobel'):
+            grad_x = cv2.Sobel(gray_face, cv2.CV_64F, 1, 0, ksize=3)
+            grad_y = cv2.Sobel(gray_face, cv2.CV_64F, 0, 1, ksize=3)
+            gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
         grad_features = cv2.resize(gradient_magnitude, (32, 32)).flatten().astype(np.float32)
         grad_features = grad_features / np.max(grad_features) if np.max(grad_features) > 0 else grad_features
         features.extend(grad_features)
@@ -268,12 +270,13 @@ def extract_face_features_opencv(image_path_or_bytes):
         if norm > 0:
             combined_features = combined_features / norm
         
-        return combined_features
+        return combined_features, box
         
     except Exception as e:
         print(f"Error extracting face features: {str(e)}")
         return None
 
+@timed('compare')
 def compare_faces_opencv(features1, features2, threshold=0.8):
     """
     Compare two face feature vectors using multiple similarity metrics.
@@ -345,6 +348,104 @@ def compare_faces_opencv(features1, features2, threshold=0.8):
         print(f"Error comparing faces: {str(e)}")
         return None
 
+# Weights of the cosine, correlation, Euclidean and Manhattan similarities.
+# compare_faces_opencv assigns them by position among the metrics that
+# could be computed, and the batched version reproduces that.
+SIMILARITY_WEIGHTS = np.array([0.4, 0.3, 0.2, 0.1])
+
+@timed('compare_batch')
+def compare_faces_opencv_batch(probe, candidates, chunk_size=4096):
+    """
+    Score one probe against many candidates at once.
+    Returns the same enhanced similarity as compare_faces_opencv for every
+    row, computed with row-wise array operations instead of a Python loop.
+    
+    Args:
+    - probe: Probe face feature vector
+    - candidates: 2-D array with one candidate feature vector per row
+    - chunk_size: Rows processed per block (bounds temporary memory)
+    
+    Returns:
+    - float64 array of similarity scores (0-100) or None if comparison fails
+    """
+    try:
+        if probe is None or candidates is None:
+            return None
+        
+        probe = np.asarray(probe)
+        candidates = np.asarray(candidates)
+        if candidates.ndim != 2:
+            return None
+        
+        # Ensure same length
+        min_len = min(len(probe), candidates.shape[1])
+        p = probe[:min_len].astype(np.float32)
+        n = candidates.shape[0]
+        scores = np.empty(n, dtype=np.float64)
+        
+        # Per-probe terms; every per-row term below comes from one BLAS
+        # product plus row sums, so only Manhattan needs a difference matrix
+        p_sum = float(p.sum(dtype=np.float64))
+        p_sq = float(np.dot(p, p))
+        p_norm = np.sqrt(p_sq)
+        p_centered_sq = p_sq - p_sum * p_sum / min_len
+        
+        for start in range(0, n, chunk_size):
+            block = np.ascontiguousarray(candidates[start:start + chunk_size, :min_len], dtype=np.float32)
+            
+            dots = (block @ p).astype(np.float64)
+            row_sq = np.einsum('ij,ij->i', block, block).astype(np.float64)
+            row_sum = block.sum(axis=1, dtype=np.float64)
+            norms = np.sqrt(row_sq)
+            
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # 1. Cosine similarity (skipped when either vector is all zeros)
+                cos_ok = (norms > 0) & (p_norm > 0)
+                cosine = np.where(cos_ok, np.maximum(0, dots / (norms * p_norm)), 0.0)
+                
+                # 2. Correlation coefficient (skipped when it is NaN)
+                if min_len > 1:
+                    covariance = dots - row_sum * p_sum / min_len
+                    row_centered_sq = np.maximum(row_sq - row_sum * row_sum / min_len, 0)
+                    correlation = np.clip(covariance / np.sqrt(row_centered_sq * max(p_centered_sq, 0)), -1, 1)
+                    # Constant vectors have no correlation (np.corrcoef gives NaN);
+                    # the relative tolerance absorbs float32 cancellation
+                    corr_ok = ~np.isnan(correlation) & (row_centered_sq > 1e-6 * row_sq) & \
+                        (p_centered_sq > 1e-6 * p_sq)
+                    correlation = np.where(corr_ok, np.maximum(0, correlation), 0.0)
+                else:
+                    corr_ok = np.zeros(len(block), dtype=bool)
+                    correlation = np.zeros(len(block))
+            
+            # 3. Inverse Euclidean distance, ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab
+            euclidean_dist = np.sqrt(np.maximum(row_sq + p_sq - 2 * dots, 0))
+            euclidean = np.maximum(0, 1 - euclidean_dist / np.sqrt(min_len))
+            
+            # 4. Manhattan distance similarity
+            diff = block - p
+            np.abs(diff, out=diff)
+            manhattan = np.maximum(0, 1 - diff.sum(axis=1, dtype=np.float64) / min_len)
+            
+            # Positional weights, as in the scalar version
+            w_cos = np.where(cos_ok, SIMILARITY_WEIGHTS[0], 0.0)
+            w_corr = np.where(corr_ok, SIMILARITY_WEIGHTS[cos_ok.astype(int)], 0.0)
+            euclid_pos = cos_ok.astype(int) + corr_ok.astype(int)
+            w_euclid = SIMILARITY_WEIGHTS[euclid_pos]
+            w_manhattan = SIMILARITY_WEIGHTS[euclid_pos + 1]
+            
+            weighted_sim = (w_cos * cosine + w_corr * correlation +
+                            w_euclid * euclidean + w_manhattan * manhattan) / (
+                            w_cos + w_corr + w_euclid + w_manhattan)
+            
+            enhanced = 100 * (1 / (1 + np.exp(-10 * (weighted_sim - 0.5))))
+            scores[start:start + len(block)] = np.clip(enhanced, 0, 100)
+        
+        return scores
+        
+    except Exception as e:
+        print(f"Error comparing faces: {str(e)}")
+        return None
+
 def save_face_features_opencv(image_path, child_id, database_connection):
     """
     Save face features to database using OpenCV.
@@ -360,13 +461,13 @@ def save_face_features_opencv(image_path, child_id, database_connection):
     try:
         features = extract_face_features_opencv(image_path)
         if features is not None:
-            # Convert features to base64 string for storage
-            features_str = base64.b64encode(features.tobytes()).decode('utf-8')
+            # Pack features into the binary encoding format (already L2-normalised)
+            features_blob = encode_encoding(features, MODEL_NAME, normalized=True)
             
             cursor = database_connection.cursor()
             cursor.execute('''
                 UPDATE children SET face_encoding = ? WHERE id = ?
-            ''', (features_str, child_id))
+            ''', (features_blob, child_id))
             database_connection.commit()
             return True
     except Exception as e:
@@ -390,10 +491,8 @@ def get_face_features_from_db_opencv(child_id, database_connection):
         result = cursor.fetchone()
         
         if result and result[0]:
-            # Convert base64 string back to numpy array
-            features_bytes = base64.b64decode(result[0])
-            features = np.frombuffer(features_bytes, dtype=np.float32)
-            return features
+            # Zero-copy view over the stored BLOB (legacy base64 is also accepted)
+            return decode_encoding(result[0])
     except Exception as e:
         print(f"Error retrieving face features: {str(e)}")
     return None
@@ -0,0 +1,203 @@
+"""
+Password hashing for ChildSafe
+Runs bcrypt in a small process pool so a burst of logins can't tie up the
+request workers, with a bounded queue, a tunable cost factor and
+rehash-on-login when the cost changes
+"""
+
+import base64
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from werkzeug.security import check_password_hash
+
+# bcrypt cost: each step doubles the time per hash (12 is about 0.25s)
+BCRYPT_ROUNDS = int(os.environ.get('CHILDSAFE_BCRYPT_ROUNDS', 12))
+# Processes per worker that hash passwords; 0 hashes on the request thread
+HASH_WORKERS = int(os.environ.get('CHILDSAFE_HASH_WORKERS', 2))
+# Hashes allowed to be running or waiting before new ones are turned away,
+# and how long a request waits for a slot
+HASH_QUEUE_DEPTH = int(os.environ.get('CHILDSAFE_HASH_QUEUE_DEPTH', 16))
+HASH_QUEUE_TIMEOUT = float(os.environ.get('CHILDSAFE_HASH_QUEUE_TIMEOUT', 2))
+
+# bcrypt only uses the first 72 bytes of a password
+BCRYPT_MAX_BYTES = 72
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue stays full for HASH_QUEUE_TIMEOUT."""
+
+
+def _bcrypt_input(password):
+    data = password.encode('utf-8')
+    if len(data) > BCRYPT_MAX_BYTES:
+        # Pre-hash long passwords so every byte counts
+        data = base64.b64encode(hashlib.sha256(data).digest())
+    return data
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_bcrypt_input(password), bcrypt.gensalt(rounds)).decode('ascii')
+
+
+def _verify(password_hash, password):
+    if password_hash.startswith('$2'):
+        return bcrypt.checkpw(_bcrypt_input(password), password_hash.encode('ascii'))
+    # Hashes created before the switch to bcrypt (werkzeug scrypt/pbkdf2)
+    return check_password_hash(password_hash, password)
+
+
+def needs_rehash(password_hash, rounds=None):
+    """
+    Check whether a stored hash uses other parameters than the current ones.
+
+    Args:
+    - password_hash: Hash from the users table
+    - rounds: Current bcrypt cost (default BCRYPT_ROUNDS)
+
+    Returns:
+    - True if the hash should be replaced at the next successful login
+    """
+    rounds = rounds or BCRYPT_ROUNDS
+    if not password_hash.startswith('$2'):
+        return True
+    try:
+        return int(password_hash.split('$')[2]) != rounds
+    except (IndexError, ValueError):
+        return True
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords in a process pool.
+
+    At most queue_depth hashes are in flight per worker process; callers
+    beyond that wait up to queue_timeout and then get HashingBusy, so a
+    login storm is answered with "try again" instead of an ever-growing
+    backlog. The pool is created on first use in each worker process.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=HASH_WORKERS,
+                 queue_depth=HASH_QUEUE_DEPTH, queue_timeout=HASH_QUEUE_TIMEOUT):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'hashes': 0, 'verifies': 0, 'rehashes': 0, 'rejected': 0,
+            'in_flight': 0, 'hash_seconds': 0.0, 'max_seconds': 0.0, 'wait_seconds': 0.0,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            # A pool inherited through fork (e.g. gunicorn --preload) can't be used
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, operation, function, *args):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HashingBusy("Too many password checks in progress")
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._stats['in_flight'] += 1
+        try:
+            if self.workers > 0:
+                return self._get_executor().submit(function, *args).result()
+            return function(*args)
+        finally:
+            self._slots.release()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stats['in_flight'] -= 1
+                self._stats[operation] += 1
+                self._stats['hash_seconds'] += elapsed
+                self._stats['max_seconds'] = max(self._stats['max_seconds'], elapsed)
+                self._stats['wait_seconds'] += waited
+
+    def hash(self, password):
+        """
+        Hash a password with the current cost.
+
+        Args:
+        - password: Plain-text password
+
+        Returns:
+        - bcrypt hash string
+        """
+        return self._run('hashes', _hash, password, self.rounds)
+
+    def verify(self, password_hash, password):
+        """
+        Check a password against a stored bcrypt or werkzeug hash.
+
+        Args:
+        - password_hash: Hash from the users table
+        - password: Plain-text password
+
+        Returns:
+        - True if the password matches
+        """
+        return self._run('verifies', _verify, password_hash, password)
+
+    def verify_and_update(self, password_hash, password):
+        """
+        Check a password and, if it matches an outdated hash, rehash it.
+
+        Args:
+        - password_hash: Hash from the users table
+        - password: Plain-text password
+
+        Returns:
+        - (matched, new hash or None)
+        """
+        if not self.verify(password_hash, password):
+            return False, None
+        if not needs_rehash(password_hash, self.rounds):
+            return True, None
+        new_hash = self.hash(password)
+        with self._lock:
+            self._stats['rehashes'] += 1
+        return True, new_hash
+
+    def stats(self):
+        """
+        Hashing latency and queue metrics.
+
+        Returns:
+        - Dictionary with operation counts, rejected, in_flight, total,
+          mean and max seconds per operation and mean queue wait
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        operations = stats['hashes'] + stats['verifies']
+        stats['mean_seconds'] = stats['hash_seconds'] / operations if operations else 0.0
+        stats['mean_wait_seconds'] = stats['wait_seconds'] / operations if operations else 0.0
+        stats.update(rounds=self.rounds, workers=self.workers)
+        return stats
+
+    def shutdown(self):
+        """Stop the pool processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+hasher = PasswordHasher()
+
+
+def hash_stats():
+    """Metrics of the process-wide password hasher."""
+    return hasher.stats()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Photo normalisation for ChildSafe
+Keeps each uploaded original and writes a canonical, EXIF-oriented,
+downscaled JPEG next to it. Detection, encoding and the detail pages use
+the canonical image instead of multi-megabyte originals, and smaller sizes
+are fixed-width renditions made from it on request.
+
+Usage:
+    python photo_ingest.py                  # create missing canonical images
+    python photo_ingest.py --force          # recreate all of them
+"""
+
+import argparse
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+# Long side of the canonical image used by the face pipeline and detail pages
+CANONICAL_SIZE = int(os.environ.get('CHILDSAFE_CANONICAL_SIZE', 800))
+JPEG_QUALITY = int(os.environ.get('CHILDSAFE_DERIVATIVE_QUALITY', 85))
+
+# Sub-directory of the upload folder holding the canonical images
+CANONICAL_DIR = 'canonical'
+# Sub-directory holding fixed-width renditions, one folder per width
+RESIZED_DIR = 'resized'
+
+
+def derivative_name(picture):
+    """File name of a picture's derivatives (always JPEG)."""
+    return f"{os.path.splitext(picture)[0]}.jpg"
+
+
+def canonical_path(upload_folder, picture):
+    """
+    Path of the canonical image of an uploaded picture.
+
+    Args:
+    - upload_folder: Directory holding the originals
+    - picture: Original file name, as stored in children.picture
+
+    Returns:
+    - File path (which may not exist yet)
+    """
+    return os.path.join(upload_folder, CANONICAL_DIR, derivative_name(picture))
+
+
+def _save_jpeg(image, path):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Unique temp name: concurrent requests may write the same rendition
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        # mkstemp creates the file owner-only; a front-end server sending it needs read access
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _to_rgb(image):
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        # Flatten transparency onto white rather than black
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def normalize_photo(upload_folder, picture, canonical_size=CANONICAL_SIZE):
+    """
+    Write the canonical image of an uploaded photo.
+
+    JPEGs are decoded with Image.draft(), which lets libjpeg scale by 1/2,
+    1/4 or 1/8 while decoding, so a 12-megapixel original never has to be
+    decoded at full size. The result is rotated upright from its EXIF
+    orientation before it is resized.
+
+    Args:
+    - upload_folder: Directory holding the originals
+    - picture: Original file name
+    - canonical_size: Long side of the canonical image
+
+    Returns:
+    - Path of the canonical image, or None on error
+    """
+    try:
+        with Image.open(os.path.join(upload_folder, picture)) as original:
+            original.draft('RGB', (canonical_size, canonical_size))
+            image = _to_rgb(ImageOps.exif_transpose(original))
+
+        image.thumbnail((canonical_size, canonical_size), Image.LANCZOS)
+        path = canonical_path(upload_folder, picture)
+        _save_jpeg(image, path)
+        return path
+
+    except Exception as e:
+        print(f"Error normalising photo {picture}: {str(e)}")
+        return None
+
+
+def resized_path(upload_folder, picture, width):
+    """Path of a picture's rendition at a given width (which may not exist yet)."""
+    return os.path.join(upload_folder, RESIZED_DIR, str(width), derivative_name(picture))
+
+
+def resize_photo(upload_folder, picture, width):
+    """
+    Rendition of an uploaded photo scaled to a width, cached on disk.
+
+    Renditions no wider than the canonical image are made from it rather
+    than from the original, and a width the canonical image already fits
+    is served by the canonical image itself. A cached rendition older than
+    its source is made again, e.g. after photo_ingest.py --force.
+
+    Args:
+    - upload_folder: Directory holding the originals
+    - picture: Original file name
+    - width: Target width in pixels (images are never enlarged)
+
+    Returns:
+    - Path of the rendition, or None on error
+    """
+    try:
+        source = os.path.join(upload_folder, picture)
+        canonical = canonical_path(upload_folder, picture)
+        if width <= CANONICAL_SIZE and os.path.exists(canonical):
+            with Image.open(canonical) as image:
+                if image.width <= width:
+                    return canonical
+            source = canonical
+
+        path = resized_path(upload_folder, picture, width)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+            return path
+
+        with Image.open(source) as original:
+            original.draft('RGB', (width, width))
+            image = _to_rgb(ImageOps.exif_transpose(original))
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        _save_jpeg(image, path)
+        return path
+
+    except Exception as e:
+        print(f"Error resizing photo {picture} to {width}px: {str(e)}")
+        return None
+
+
+def pipeline_photo_path(photo_path):
+    """
+    Image the face pipeline should read for an uploaded original.
+
+    Args:
+    - photo_path: Path of the original in the upload folder
+
+    Returns:
+    - Path of the canonical image if it exists, else photo_path
+    """
+    canonical = canonical_path(*os.path.split(photo_path))
+    return canonical if os.path.exists(canonical) else photo_path
+
+
+def remove_derivatives(upload_folder, picture):
+    """Delete a picture's derivatives, e.g. when its upload is discarded."""
+    paths = [canonical_path(upload_folder, picture)]
+    resized_root = os.path.join(upload_folder, RESIZED_DIR)
+    if os.path.isdir(resized_root):
+        paths += [resized_path(upload_folder, picture, entry.name) for entry in os.scandir(resized_root)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create canonical images for uploaded photos")
+    parser.add_argument('--upload-folder', default='uploads')
+    parser.add_argument('--force', action='store_true', help="Recreate existing canonical images")
+    args = parser.parse_args()
+
+    pictures = sorted(entry.name for entry in os.scandir(args.upload_folder) if entry.is_file())
+    created = failed = 0
+    for picture in pictures:
+        if not args.force and os.path.exists(canonical_path(args.upload_folder, picture)):
+            continue
+        if normalize_photo(args.upload_folder, picture):
+            created += 1
+        else:
+            failed += 1
+    print(f"✅ Created canonical images for {created} photos ({failed} failed, {len(pictures)} in {args.upload_folder})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Probe feature cache for ChildSafe
+Remembers the features and face box extracted from uploaded search photos,
+keyed by a hash of the bytes and the pipeline that produced them, so a
+re-uploaded photo skips detection and feature extraction
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from encoding_codec import encode_encoding, decode_encoding
+
+MAX_BYTES = int(os.environ.get('CHILDSAFE_PROBE_CACHE_BYTES', 64 * 1024 * 1024))
+# Optional SQLite file shared by every worker; empty keeps the cache in memory
+CACHE_DATABASE = os.environ.get('CHILDSAFE_PROBE_CACHE_DB', '')
+MAX_PERSISTED_ROWS = 10000
+
+# Rough per-entry overhead (key, tuple, dict slot) added to the array size
+ENTRY_OVERHEAD = 256
+
+CachedProbe = namedtuple('CachedProbe', ['features', 'box'])
+
+
+def probe_key(data, pipeline, digest=None):
+    """
+    Cache key for uploaded bytes processed by a pipeline.
+
+    Args:
+    - data: Uploaded image bytes (or a buffer of them)
+    - pipeline: Model/pipeline version string, e.g. 'OpenCV-LBP:1'
+    - digest: SHA-256 hex digest of data if already known
+
+    Returns:
+    - Key string
+    """
+    return f"{pipeline}:{digest or hashlib.sha256(data).hexdigest()}"
+
+
+def _entry_size(key, features):
+    size = ENTRY_OVERHEAD + len(key)
+    if features is not None:
+        size += features.nbytes
+    return size
+
+
+class ProbeCache:
+    """
+    Byte-bounded LRU of extracted probe features.
+
+    A cached entry with features None records that no face was found, so
+    a bad photo is not re-processed either. With a database path, entries
+    are also written to SQLite, where other workers and later processes
+    find them after an in-memory miss.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, database=None, max_persisted=MAX_PERSISTED_ROWS):
+        self.max_bytes = max_bytes
+        self.max_persisted = max_persisted
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'persisted_hits': 0, 'misses': 0, 'evictions': 0}
+        self._conn = None
+        if database:
+            self._conn = sqlite3.connect(database, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS probe_cache (
+                    key TEXT PRIMARY KEY,
+                    features BLOB,
+                    box TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            self._conn.commit()
+
+    def get(self, key):
+        """
+        Look up a probe.
+
+        Args:
+        - key: Key from probe_key
+
+        Returns:
+        - CachedProbe, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry
+
+            entry = self._load(key)
+            if entry is not None:
+                self._stats['persisted_hits'] += 1
+                self._insert(key, entry)
+                return entry
+
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key, features, box=None):
+        """
+        Cache the result of processing a probe.
+
+        Args:
+        - key: Key from probe_key
+        - features: Extracted features, or None if no face was found
+        - box: Detected face (x, y, w, h), or None
+        """
+        if features is not None:
+            features = np.asarray(features, dtype=np.float32)
+            features.setflags(write=False)
+        box = tuple(int(v) for v in box) if box is not None else None
+        entry = CachedProbe(features, box)
+
+        with self._lock:
+            self._insert(key, entry)
+            self._store(key, entry)
+
+    def _insert(self, key, entry):
+        if key in self._entries:
+            self._bytes -= _entry_size(key, self._entries.pop(key).features)
+        size = _entry_size(key, entry.features)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._bytes -= _entry_size(old_key, old_entry.features)
+            self._stats['evictions'] += 1
+
+    def _load(self, key):
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute('SELECT features, box FROM probe_cache WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading probe cache: {str(e)}")
+            return None
+        if row is None:
+            return None
+        features = decode_encoding(row[0]) if row[0] is not None else None
+        box = tuple(int(v) for v in row[1].split(',')) if row[1] else None
+        return CachedProbe(features, box)
+
+    def _store(self, key, entry):
+        if self._conn is None:
+            return
+        blob = encode_encoding(entry.features, 'probe', normalized=False) if entry.features is not None else None
+        box = ','.join(str(v) for v in entry.box) if entry.box is not None else None
+        try:
+            cursor = self._conn.cursor()
+            cursor.execute('INSERT OR REPLACE INTO probe_cache (key, features, box, created_at) VALUES (?, ?, ?, ?)',
+                           (key, blob, box, time.time()))
+            # Trim the oldest rows now and then rather than on every insert
+            if cursor.lastrowid % 100 == 0:
+                cursor.execute('''
+                    DELETE FROM probe_cache WHERE key IN (
+                        SELECT key FROM probe_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_persisted,))
+            self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing probe cache: {str(e)}")
+
+    def clear(self):
+        """Drop every cached probe (in memory and persisted)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM probe_cache')
+                self._conn.commit()
+
+    def stats(self):
+        """
+        Hit/miss counts and memory use.
+
+        Returns:
+        - Dictionary with hits, persisted_hits, misses, evictions, entries,
+          bytes, max_bytes and hit_rate
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+        lookups = stats['hits'] + stats['persisted_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['persisted_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_probe_cache():
+    """Process-wide probe cache, configured from the environment."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ProbeCache(MAX_BYTES, CACHE_DATABASE or None)
+    return _cache
+
+
+def probe_cache_stats():
+    """Hit-rate metrics of the process-wide probe cache."""
+    return get_probe_cache().stats()
+
+
+def cached_probe(data, pipeline, extract, digest=None):
+    """
+    Features for uploaded bytes, extracting them only on a cache miss.
+
+    Args:
+    - data: Uploaded image bytes
+    - pipeline: Model/pipeline version string
+    - extract: Callable returning (features, box), or None on an error
+      that should not be cached
+    - digest: SHA-256 hex digest of data if already known, e.g. hashed
+      while the upload streamed in
+
+    Returns:
+    - CachedProbe, or None if extraction failed
+    """
+    cache = get_probe_cache()
+    key = probe_key(data, pipeline, digest)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    result = extract()
+    if result is None:
+        return None
+    features, box = result
+    cache.put(key, features, box)
+    return CachedProbe(features, box)
+
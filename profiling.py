@@ -0,0 +1,256 @@
+"""
+Opt-in profiling for ChildSafe
+Captures a cProfile dump of every request slower than a threshold and runs
+on-demand stack sampling, keeping the results in a bounded directory that
+admins can list and download
+"""
+
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Off unless CHILDSAFE_PROFILING=1: profiling every request costs CPU
+PROFILING_ENABLED = os.environ.get('CHILDSAFE_PROFILING', '0') == '1'
+PROFILE_DIR = os.environ.get('CHILDSAFE_PROFILE_DIR', 'profiles')
+# Requests taking at least this long keep their cProfile dump
+SLOW_REQUEST_SECONDS = float(os.environ.get('CHILDSAFE_SLOW_REQUEST_SECONDS', 2))
+# Share of requests run under cProfile (the rest can't be captured)
+PROFILE_SAMPLE_RATE = float(os.environ.get('CHILDSAFE_PROFILE_SAMPLE_RATE', 1.0))
+# Comma-separated endpoints to profile; empty profiles all of them
+PROFILE_ENDPOINTS = {e for e in os.environ.get('CHILDSAFE_PROFILE_ENDPOINTS', '').split(',') if e}
+# Oldest dumps are deleted beyond these limits
+PROFILE_MAX_FILES = int(os.environ.get('CHILDSAFE_PROFILE_MAX_FILES', 50))
+PROFILE_MAX_BYTES = int(os.environ.get('CHILDSAFE_PROFILE_MAX_BYTES', 100 * 1024 * 1024))
+
+MAX_SAMPLE_SECONDS = 120
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class ProfileStore:
+    """
+    Directory of profile dumps with count and size limits.
+
+    Files are written under a temporary name and renamed, so a listing
+    never shows a half-written dump.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, max_files=PROFILE_MAX_FILES, max_bytes=PROFILE_MAX_BYTES):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def new_name(self, label, extension):
+        """
+        Unique file name for a dump.
+
+        Args:
+        - label: Short description, e.g. 'search_lost_child_2350ms'
+        - extension: 'prof' for cProfile, 'folded' for sampled stacks
+
+        Returns:
+        - File name (no directory)
+        """
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        return f"{stamp}_{_SAFE_NAME.sub('_', label)}_{os.getpid()}.{extension}"
+
+    def save(self, name, write):
+        """
+        Write a dump and rotate old ones.
+
+        Args:
+        - name: File name from new_name
+        - write: Callable taking the path to write to
+
+        Returns:
+        - Path of the saved file
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        self.rotate()
+        return path
+
+    def list(self):
+        """
+        Dumps, newest first.
+
+        Returns:
+        - List of dictionaries with name, size and modified (datetime)
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append({'name': entry.name, 'size': stat.st_size,
+                                'modified': datetime.fromtimestamp(stat.st_mtime)})
+        entries.sort(key=lambda e: e['modified'], reverse=True)
+        return entries
+
+    def rotate(self):
+        """Delete the oldest dumps beyond max_files or max_bytes."""
+        with self._lock:
+            entries = self.list()
+            total = 0
+            for i, entry in enumerate(entries):
+                total += entry['size']
+                if i >= self.max_files or total > self.max_bytes:
+                    try:
+                        os.remove(os.path.join(self.directory, entry['name']))
+                    except OSError as e:
+                        print(f"Error rotating profile {entry['name']}: {str(e)}")
+
+    def contains(self, name):
+        """True if name is a dump in this store (rejects paths)."""
+        return (name == os.path.basename(name) and not name.endswith('.tmp')
+                and os.path.isfile(os.path.join(self.directory, name)))
+
+
+store = ProfileStore()
+
+
+class StackSampler:
+    """
+    Samples the stacks of every other thread in this process.
+
+    Stacks are counted in folded form ("outer;inner;leaf count"), which
+    flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def sample_once(self, skip_thread=None):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == skip_thread:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        """Sample for a number of seconds, from the calling thread."""
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample_once(skip_thread=me)
+            time.sleep(self.interval)
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+_sampler_lock = threading.Lock()
+_sampler_running = False
+
+
+def start_sampling(seconds, interval=DEFAULT_SAMPLE_INTERVAL, profile_store=None):
+    """
+    Sample this worker's stacks in the background and save a .folded dump.
+
+    Only the worker that handles this call is sampled; with several gunicorn
+    workers, repeat it or lower the worker count while investigating.
+
+    Args:
+    - seconds: Sampling window (capped at MAX_SAMPLE_SECONDS)
+    - interval: Seconds between samples
+    - profile_store: Where to save the dump (default: the shared store)
+
+    Returns:
+    - File name the dump will be saved as, or None if sampling is already running
+    """
+    global _sampler_running
+    profile_store = profile_store or store
+    seconds = max(0.1, min(float(seconds), MAX_SAMPLE_SECONDS))
+    with _sampler_lock:
+        if _sampler_running:
+            return None
+        _sampler_running = True
+
+    name = profile_store.new_name(f"sample_{seconds:g}s", 'folded')
+
+    def run():
+        global _sampler_running
+        try:
+            sampler = StackSampler(interval)
+            sampler.run(seconds)
+
+            def write(path):
+                with open(path, 'w') as f:
+                    f.write(sampler.folded())
+            profile_store.save(name, write)
+        except Exception as e:
+            print(f"Error sampling stacks: {str(e)}")
+        finally:
+            with _sampler_lock:
+                _sampler_running = False
+
+    threading.Thread(target=run, name='stack-sampler', daemon=True).start()
+    return name
+
+
+def init_app(app, profile_store=None):
+    """
+    Profile requests and keep the dumps of slow ones.
+
+    Does nothing unless CHILDSAFE_PROFILING=1 (or app.config['PROFILING']).
+
+    Args:
+    - app: Flask application
+    - profile_store: Where to save dumps (default: the shared store)
+    """
+    from flask import g, request
+
+    if not app.config.get('PROFILING', PROFILING_ENABLED):
+        return
+    profile_store = profile_store or store
+    threshold = app.config.get('SLOW_REQUEST_SECONDS', SLOW_REQUEST_SECONDS)
+
+    @app.before_request
+    def _start_profile():
+        if request.endpoint in (None, 'static') or (PROFILE_ENDPOINTS and request.endpoint not in PROFILE_ENDPOINTS):
+            return
+        if random.random() >= PROFILE_SAMPLE_RATE:
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return
+        g.profiler = profiler
+        g.profile_start = time.perf_counter()
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        duration = time.perf_counter() - g.pop('profile_start')
+        if duration < threshold:
+            return
+        try:
+            name = profile_store.new_name(f"{request.endpoint}_{duration * 1000:.0f}ms", 'prof')
+            profile_store.save(name, profiler.dump_stats)
+            print(f"🐢 Slow request {request.method} {request.path} took {duration:.2f}s, profile saved as {name}")
+        except Exception as e:
+            print(f"Error saving request profile: {str(e)}")
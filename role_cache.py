@@ -0,0 +1,75 @@
+"""
+User role cache for ChildSafe
+Per-process TTL cache of users.is_admin, validated against each user's
+role_version so role changes reach every worker straight away
+"""
+
+import os
+import threading
+import time
+
+ROLE_CACHE_TTL = float(os.environ.get('CHILDSAFE_ROLE_CACHE_TTL', 60))
+
+
+class RoleCache:
+    """
+    TTL cache mapping username to is_admin.
+
+    Each entry records the user's ``users.role_version`` when it was read.
+    Role changes bump that column in the database, so every process (and
+    every session copy of a role) sees the change on its next version check
+    and only the changed user's entry stops matching.
+    """
+
+    def __init__(self, ttl=ROLE_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, username, version):
+        """
+        Cached role of a user.
+
+        Args:
+        - username: Username to look up
+        - version: User's current role_version
+
+        Returns:
+        - True/False, or None if not cached, expired or read at another version
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[1] == version and entry[2] > now:
+                self._stats['hits'] += 1
+                return entry[0]
+            self._entries.pop(username, None)
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, username, admin, version):
+        """Cache a role read from the database at a role_version."""
+        with self._lock:
+            self._entries[username] = (bool(admin), version, time.monotonic() + self.ttl)
+
+    def invalidate(self, username=None):
+        """
+        Forget cached roles in this process.
+
+        Args:
+        - username: User to forget, or None for everyone
+        """
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(username, None)
+
+    def stats(self):
+        """Hit and miss counts."""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+role_cache = RoleCache()
@@ -0,0 +1,164 @@
+"""
+Session backends for ChildSafe
+Keeps sessions in a SQLite table (WAL) with a background expiry sweep, or in
+Flask's signed cookies, instead of one pickle file per session on disk
+"""
+
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from werkzeug.datastructures import CallbackDict
+
+from db import ConnectionPool
+
+SESSION_BACKEND = os.environ.get('CHILDSAFE_SESSION_BACKEND', 'sqlite')
+SESSION_DATABASE = os.environ.get('CHILDSAFE_SESSION_DB', 'sessions.db')
+SWEEP_INTERVAL_SECONDS = 300
+# Unmodified sessions are only rewritten to extend their expiry once this
+# fraction of the lifetime has passed, instead of on every request
+REFRESH_FRACTION = 0.1
+
+
+class SqliteSession(CallbackDict, SessionMixin):
+    """Server-side session whose data lives in the sessions table."""
+
+    def __init__(self, initial=None, sid=None, expiry=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.expiry = expiry
+        self.new = new
+        self.modified = False
+
+
+class SqliteSessionInterface(SessionInterface):
+    """
+    Stores each session as one row of JSON in SQLite.
+
+    The cookie only carries a random session id. Rows are written when the
+    session changes, or when its expiry needs extending, so most requests
+    only do a primary-key read. A daemon thread in each process deletes
+    expired rows every sweep_interval seconds.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, database=SESSION_DATABASE, sweep_interval=SWEEP_INTERVAL_SECONDS):
+        self.database = database
+        self.sweep_interval = sweep_interval
+        self.pool = ConnectionPool(database)
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expiry REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions (expiry)')
+            conn.commit()
+
+    def _start_sweeper(self):
+        # Started lazily so each forked worker gets its own thread
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._sweeper_lock:
+            if self._sweeper is None or not self._sweeper.is_alive():
+                self._sweeper = threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True)
+                self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep()
+
+    def sweep(self):
+        """
+        Delete expired sessions.
+
+        Returns:
+        - Number of rows deleted
+        """
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.execute('DELETE FROM sessions WHERE expiry <= ?', (time.time(),))
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            print(f"Error sweeping sessions: {str(e)}")
+            return 0
+
+    def open_session(self, app, request):
+        self._start_sweeper()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT data, expiry FROM sessions WHERE id = ? AND expiry > ?',
+                                   (sid, time.time())).fetchone()
+            if row is not None:
+                try:
+                    return SqliteSession(self.serializer.loads(row[0]), sid=sid, expiry=row[1])
+                except Exception:
+                    pass
+        return SqliteSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        name = self.get_cookie_name(app)
+
+        if not session:
+            if session.modified and not session.new:
+                with self.pool.connection() as conn:
+                    conn.execute('DELETE FROM sessions WHERE id = ?', (session.sid,))
+                    conn.commit()
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        stale = session.expiry is None or session.expiry - now < lifetime * (1 - REFRESH_FRACTION)
+        if not session.modified and not stale:
+            return
+
+        expiry = now + lifetime
+        with self.pool.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO sessions (id, data, expiry) VALUES (?, ?, ?)',
+                         (session.sid, self.serializer.dumps(dict(session)), expiry))
+            conn.commit()
+        session.expiry = expiry
+
+        if session.new or session.modified or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+        response.vary.add('Cookie')
+
+
+def init_session(app, backend=SESSION_BACKEND):
+    """
+    Install the configured session backend on the app.
+
+    Args:
+    - app: Flask application
+    - backend: 'sqlite' (default), 'cookie' for Flask's signed cookies, or
+      'filesystem' for the previous Flask-Session file store
+    """
+    if backend == 'sqlite':
+        app.session_interface = SqliteSessionInterface(app.config.get('SESSION_DATABASE', SESSION_DATABASE))
+    elif backend == 'cookie':
+        # Signed, compressed cookies: no server state, limited to ~4 KB
+        app.session_interface = SecureCookieSessionInterface()
+    elif backend == 'filesystem':
+        from flask_session import Session
+        app.config['SESSION_TYPE'] = 'filesystem'
+        Session(app)
+    else:
+        raise ValueError(f"Unknown session backend: {backend}")
@@ -7,7 +7,6 @@ This script helps set up the ChildSafe application with all necessary dependenci
 import os
 import sys
 import subprocess
-import sqlite3
 from pathlib import Path
 
 def print_banner():
@@ -56,31 +55,12 @@ def setup_database():
     print("\n🗄️  Setting up database...")
     
     try:
-        # Run the database creation script
-        subprocess.check_call([sys.executable, "create_database.py"])
+        # Create the database or apply any pending migrations
+        subprocess.check_call([sys.executable, "migrations.py"])
         
         # Verify database was created
         if os.path.exists("child_registry.db"):
             print("✅ Database created successfully!")
-            
-            # Add face_encoding column if it doesn't exist
-            conn = sqlite3.connect("child_registry.db")
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute("PRAGMA table_info(children)")
-                columns = cursor.fetchall()
-                column_names = [column[1] for column in columns]
-                
-                if 'face_encoding' not in column_names:
-                    cursor.execute('ALTER TABLE children ADD COLUMN face_encoding TEXT')
-                    conn.commit()
-                    print("✅ Added face_encoding column to database")
-                
-            except Exception as e:
-                print(f"⚠️  Warning: Could not add face_encoding column: {e}")
-            
-            conn.close()
             return True
         else:
             print("❌ Database creation failed!")
@@ -171,7 +151,7 @@ def main():
     
     # Setup database
     if not setup_database():
-        print("\n⚠️  Database setup failed. You may need to run create_database.py manually.")
+        print("\n⚠️  Database setup failed. You may need to run migrations.py manually.")
     
     # Create directories
     create_directories()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test script for bulk face enrollment
+Checks that every photo is encoded in parallel and that runs resume
+"""
+
+import os
+import sqlite3
+import tempfile
+import cv2
+import numpy as np
+import bulk_enroll as bulk_enroll_module
+from migrations import migrate
+from bulk_enroll import bulk_enroll, load_checkpoint, encode_shard
+from test_face_matching import create_test_face_image
+from test_migrations import insert_child
+
+def create_registry(directory, pictures):
+    """Database and upload folder with one child per picture."""
+    database = os.path.join(directory, 'test.db')
+    conn = sqlite3.connect(database)
+    migrate(conn)
+    for i, picture in enumerate(pictures, start=1):
+        insert_child(conn, picture, huduma_number=f"H{i}")
+    conn.commit()
+    conn.close()
+    return database
+
+def statuses(database):
+    conn = sqlite3.connect(database)
+    try:
+        return [row[0] for row in conn.execute('SELECT encoding_status FROM children ORDER BY id')]
+    finally:
+        conn.close()
+
+def test_bulk_enroll():
+    """Faces, blank photos and missing files each get the right status."""
+    print("🧪 Testing bulk enrollment...")
+    with tempfile.TemporaryDirectory() as directory:
+        uploads = os.path.join(directory, 'uploads')
+        os.makedirs(uploads)
+        pictures = ['face1.jpg', 'face2.jpg', 'blank.jpg', 'missing.jpg', 'face3.jpg']
+        for name in ('face1.jpg', 'face2.jpg', 'face3.jpg'):
+            cv2.imwrite(os.path.join(uploads, name), create_test_face_image())
+        cv2.imwrite(os.path.join(uploads, 'blank.jpg'), np.full((200, 200, 3), 128, dtype=np.uint8))
+
+        database = create_registry(directory, pictures)
+        checkpoint_path = os.path.join(directory, 'checkpoint.json')
+        checkpoint = bulk_enroll(database, uploads, workers=2, shard_size=2, checkpoint_path=checkpoint_path)
+
+        assert statuses(database) == ['encoded', 'encoded', 'no_face', 'failed', 'encoded']
+        assert checkpoint['last_id'] == 5 and checkpoint['done'] == 5
+        print("✅ All photos processed")
+
+        # Resuming picks up only children added after the checkpoint
+        conn = sqlite3.connect(database)
+        insert_child(conn, 'face1.jpg', huduma_number='H6', first_name='B')
+        conn.commit()
+        conn.close()
+
+        checkpoint = bulk_enroll(database, uploads, workers=1, shard_size=2, checkpoint_path=checkpoint_path)
+        assert checkpoint['done'] == 6
+        assert load_checkpoint(checkpoint_path, 'OpenCV-LBP')['last_id'] == 6
+        assert statuses(database)[-1] == 'encoded'
+        print("✅ Run resumed from the checkpoint")
+
+def test_batch_statuses():
+    """Only the batch backend's explicit no-face result is recorded as no_face."""
+    print("\n🏷️ Testing batch encoding statuses...")
+    with tempfile.TemporaryDirectory() as directory:
+        shard = []
+        for child_id, name in enumerate(['face.jpg', 'blank.jpg', 'broken.jpg'], start=1):
+            path = os.path.join(directory, name)
+            open(path, 'wb').close()
+            shard.append((child_id, name, path))
+
+        outcomes = {'face.jpg': (np.ones(4, dtype=np.float32), None),
+                    'blank.jpg': (None, 'no face detected'),
+                    'broken.jpg': (None, 'Error loading face detector model')}
+        saved = bulk_enroll_module._extract_batch, bulk_enroll_module._no_face_error, bulk_enroll_module._model_name
+        bulk_enroll_module._extract_batch = lambda paths: [outcomes[os.path.basename(path)] for path in paths]
+        bulk_enroll_module._no_face_error = 'no face detected'
+        bulk_enroll_module._model_name = 'Facenet'
+        try:
+            results = encode_shard(shard)
+        finally:
+            bulk_enroll_module._extract_batch, bulk_enroll_module._no_face_error, bulk_enroll_module._model_name = saved
+
+        assert {picture: status for _, status, _, picture in results} == {
+            'face.jpg': 'encoded', 'blank.jpg': 'no_face', 'broken.jpg': 'failed'}
+        print("✅ Detector errors recorded as failed, not no_face")
+
+if __name__ == "__main__":
+    test_bulk_enroll()
+    test_batch_statuses()
+    print("\n🎉 Bulk enrollment tests passed!")
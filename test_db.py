@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test script for the SQLite connection pool
+Checks that connections are tuned, reused per request and bounded
+"""
+
+import os
+import tempfile
+from flask import Flask
+import db
+
+def test_pool_reuse():
+    """Connections are configured once and reused after release."""
+    print("🧪 Testing connection pool reuse...")
+    with tempfile.TemporaryDirectory() as directory:
+        pool = db.ConnectionPool(os.path.join(directory, 'test.db'), size=2, timeout=0.1)
+
+        conn = pool.acquire()
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.execute('INSERT INTO t VALUES (1)')
+        pool.release(conn)
+
+        # Uncommitted work is rolled back, and the same connection comes back
+        again = pool.acquire()
+        assert again is conn
+        assert not again.in_transaction
+        assert again.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+        print("✅ Connection reused and rolled back")
+
+        other = pool.acquire()
+        try:
+            pool.acquire()
+            assert False, "Pool should be bounded"
+        except RuntimeError:
+            print("✅ Pool is bounded")
+        pool.release(other)
+        pool.release(again)
+        pool.close_all()
+
+def test_request_connection():
+    """Each request gets one connection, returned at teardown."""
+    print("\n🔁 Testing per-request connection...")
+    with tempfile.TemporaryDirectory() as directory:
+        original = db.pool
+        db.pool = db.ConnectionPool(os.path.join(directory, 'test.db'), size=1, timeout=0.1)
+        try:
+            app = Flask(__name__)
+            db.init_app(app)
+            seen = []
+
+            @app.route('/')
+            def index():
+                seen.append(db.get_db())
+                with db.db_connection() as conn:
+                    assert conn is db.get_db()
+                return 'ok'
+
+            client = app.test_client()
+            client.get('/')
+            client.get('/')
+            assert seen[0] is seen[1]
+            print("✅ Request connection returned to the pool")
+
+            # Outside a request a connection is borrowed for the block
+            with db.db_connection() as conn:
+                assert conn is seen[0]
+        finally:
+            db.pool.close_all()
+            db.pool = original
+
+if __name__ == "__main__":
+    test_pool_reuse()
+    test_request_connection()
+    print("\n🎉 Database pool tests passed!")
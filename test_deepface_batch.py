@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Test script for batched DeepFace encoding
+Runs extract_face_encodings_deepface_batch against a stubbed deepface
+module, checking result order, faceless images, partial batches and
+agreement with single-image encoding
+"""
+
+import importlib
+import sys
+import types
+from contextlib import contextmanager
+import cv2
+import numpy as np
+from model_registry import registry, DEEPFACE_PREFIX
+
+STUB_MODELS = ('VGG-Face', 'Facenet')
+
+class StubNetwork:
+    """Keras-like network embedding a face as [mean intensity, 1]."""
+
+    def predict(self, batch, verbose=0):
+        means = batch.reshape(len(batch), -1).mean(axis=1)
+        return np.stack([means, np.ones_like(means)], axis=1)
+
+class StubClient:
+    """
+    DeepFace model client: forward() L2-normalises like VGG-Face's, and
+    records every batch size it is given.
+    """
+
+    input_shape = (16, 16)
+
+    def __init__(self):
+        self.model = StubNetwork()
+        self.batches = []
+
+    def forward(self, img):
+        if img.ndim == 3:
+            img = img[np.newaxis]
+        self.batches.append(len(img))
+        embeddings = self.model.predict(img)
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings[0].tolist() if len(embeddings) == 1 else embeddings.tolist()
+
+class StubDeepFace:
+    """
+    Stand-in for deepface.DeepFace. Images darker than 5 have no face,
+    brighter than 245 break the detector, and wider than 40 pixels hold a
+    small face on the left and a large one on the right.
+    """
+
+    network = None
+    # img_path arguments passed to represent() and verify()
+    inputs = []
+
+    @staticmethod
+    def represent(img_path, model_name, enforce_detection, detector_backend):
+        StubDeepFace.inputs.append(img_path)
+        results = []
+        for face in StubDeepFace.extract_faces(img_path, detector_backend, enforce_detection, align=True):
+            crop = cv2.resize(face['face'][:, :, ::-1].astype(np.float32), StubClient.input_shape)
+            embedding = StubDeepFace.network.forward(crop[np.newaxis])
+            results.append({'embedding': embedding, 'facial_area': face['facial_area']})
+        # represent() runs the network per face; only batched passes are of interest
+        StubDeepFace.network.batches.clear()
+        return results
+
+    @staticmethod
+    def verify(img1_path, img2_path, model_name, detector_backend, enforce_detection):
+        StubDeepFace.inputs.extend([img1_path, img2_path])
+        distance = abs(float(img1_path.mean()) - float(img2_path.mean())) / 255.0
+        return {'verified': distance <= 0.4, 'distance': distance, 'threshold': 0.4}
+
+    @staticmethod
+    def build_model(model_name):
+        return StubDeepFace.network
+
+    @staticmethod
+    def extract_faces(img_path, detector_backend, enforce_detection, align):
+        if img_path.mean() < 5:
+            raise ValueError("Face could not be detected in numpy array. Please confirm that the picture is a face photo")
+        if img_path.mean() > 245:
+            raise ValueError("Confirm that opencv is installed on your environment! Expected path violated.")
+        if img_path.shape[1] > 40:
+            width = img_path.shape[1]
+            return [_stub_face(img_path, 0, 0, 10), _stub_face(img_path, 0, width - 30, 30)]
+        return [_stub_face(img_path, 0, 0, 20)]
+
+def _stub_face(image, y, x, size):
+    face = image[y:y + size, x:x + size, ::-1] / 255.0
+    return {'face': face, 'facial_area': {'x': x, 'y': y, 'w': size, 'h': size}, 'confidence': 1.0}
+
+def _reset_models():
+    for model_name in STUB_MODELS:
+        registry.reset(DEEPFACE_PREFIX + model_name)
+
+@contextmanager
+def stubbed_deepface():
+    """
+    Import deepface_recognition against a stub deepface module.
+
+    The real modules (if any) are restored afterwards, and the stub model is
+    dropped from the model registry.
+    """
+    module = types.ModuleType('deepface')
+    module.DeepFace = StubDeepFace
+    StubDeepFace.network = StubClient()
+    StubDeepFace.inputs = []
+    saved = {name: sys.modules.get(name) for name in ('deepface', 'deepface_recognition')}
+    sys.modules['deepface'] = module
+    sys.modules.pop('deepface_recognition', None)
+    _reset_models()
+    try:
+        yield importlib.import_module('deepface_recognition')
+    finally:
+        for name, saved_module in saved.items():
+            if saved_module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = saved_module
+        _reset_models()
+
+def solid_image(value):
+    return np.full((40, 40, 3), value, dtype=np.uint8)
+
+def expected_encoding(value):
+    """Stub embedding of a face of one intensity, after L2 normalisation."""
+    embedding = np.array([value / 255.0, 1.0])
+    return embedding / np.linalg.norm(embedding)
+
+def test_batch_order_and_partial_batches():
+    """Results follow the input order when faces are embedded in batches of 3."""
+    print("🧪 Testing batched DeepFace encoding...")
+    values = [40, 0, 80, 120, 250, 160, 200, 220, 230]
+    images = [solid_image(value) for value in values]
+    # Encoded bytes are decoded like any upload
+    ok, jpeg = cv2.imencode('.png', images[2])
+    images[2] = jpeg.tobytes()
+
+    with stubbed_deepface() as deepface_recognition:
+        results = deepface_recognition.extract_face_encodings_deepface_batch(images, 'VGG-Face', batch_size=3)
+        no_face = deepface_recognition.NO_FACE_ERROR
+
+    assert len(results) == len(values)
+    # Seven faces in batches of 3: the last forward pass holds the remainder
+    assert StubDeepFace.network.batches == [3, 3, 1]
+    for value, (encoding, error) in zip(values, results):
+        if value == 0:
+            assert encoding is None and error == no_face
+        elif value == 250:
+            assert encoding is None and error != no_face and 'opencv' in error
+        else:
+            assert error is None
+            assert np.allclose(encoding, expected_encoding(value), atol=1e-3), (value, encoding)
+    print("✅ Order kept across full and partial batches")
+
+def test_batch_matches_single():
+    """Batch and single-image encodings of the same photos agree, largest face included."""
+    print("\n🔗 Testing batch against single-image encoding...")
+    two_faces = np.concatenate([np.full((40, 40, 3), 60, np.uint8), np.full((40, 40, 3), 180, np.uint8)], axis=1)
+    images = [solid_image(90), two_faces, solid_image(150)]
+    with stubbed_deepface() as deepface_recognition:
+        batch = deepface_recognition.extract_face_encodings_deepface_batch(images, 'VGG-Face', batch_size=2)
+        single = [deepface_recognition.extract_face_encoding_deepface(image, 'VGG-Face') for image in images]
+
+    for (encoding, error), expected in zip(batch, single):
+        assert error is None
+        assert np.allclose(encoding, expected, atol=1e-5), (encoding, expected)
+        assert np.isclose(np.linalg.norm(encoding), 1.0)
+    # Both paths embed the large right-hand face
+    assert np.allclose(batch[1].encoding, expected_encoding(180), atol=1e-3)
+    print("✅ Same normalised embedding and face from both paths")
+
+def test_all_faceless_and_empty():
+    """No forward pass runs when no image has a face."""
+    print("\n🙈 Testing batches without faces...")
+    with stubbed_deepface() as deepface_recognition:
+        results = deepface_recognition.extract_face_encodings_deepface_batch([solid_image(0)] * 2, 'VGG-Face')
+        assert [error for _, error in results] == [deepface_recognition.NO_FACE_ERROR] * 2
+        assert deepface_recognition.extract_face_encodings_deepface_batch([], 'VGG-Face') == []
+        assert deepface_recognition.extract_face_encodings_deepface_batch([b'not an image'], 'VGG-Face')[0].error
+    assert StubDeepFace.network.batches == []
+    print("✅ Faceless images reported without a forward pass")
+
+if __name__ == "__main__":
+    test_batch_order_and_partial_batches()
+    test_batch_matches_single()
+    test_all_faceless_and_empty()
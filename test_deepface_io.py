@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for the DeepFace input path
+Checks that paths, uploaded bytes and decoded arrays reach DeepFace as
+in-memory BGR arrays, without temp files
+"""
+
+import os
+import tempfile
+import cv2
+import numpy as np
+from test_deepface_batch import StubDeepFace, stubbed_deepface, solid_image
+
+class NoTempFiles:
+    """Fail any attempt to create a named temp file."""
+
+    def __enter__(self):
+        self.saved = tempfile.NamedTemporaryFile
+        tempfile.NamedTemporaryFile = self._fail
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        tempfile.NamedTemporaryFile = self.saved
+        return False
+
+    @staticmethod
+    def _fail(*args, **kwargs):
+        raise AssertionError("temp file created")
+
+def test_encoding_inputs():
+    """Paths, bytes and ndarrays all give the same encoding from an in-memory array."""
+    print("🧪 Testing DeepFace encoding inputs...")
+    image = solid_image(90)
+    ok, png = cv2.imencode('.png', image)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'child.png')
+        cv2.imwrite(path, image)
+
+        with stubbed_deepface() as deepface_recognition, NoTempFiles():
+            from_array = deepface_recognition.extract_face_encoding_deepface(image)
+            from_bytes = deepface_recognition.extract_face_encoding_deepface(png.tobytes())
+            from_view = deepface_recognition.extract_face_encoding_deepface(memoryview(png.tobytes()))
+            from_path = deepface_recognition.extract_face_encoding_deepface(path)
+            no_face = deepface_recognition.extract_face_encoding_deepface(solid_image(0))
+
+    for encoding in (from_bytes, from_view, from_path):
+        assert np.allclose(encoding, from_array)
+    assert no_face is None
+    assert StubDeepFace.inputs[0] is image
+    assert all(isinstance(value, np.ndarray) and value.shape == image.shape for value in StubDeepFace.inputs)
+    print("✅ Every input type decoded in memory")
+
+def test_verify_inputs():
+    """verify_faces_deepface decodes both images in memory and maps the distance."""
+    print("\n🔍 Testing DeepFace verification inputs...")
+    ok, png = cv2.imencode('.png', solid_image(100))
+    with stubbed_deepface() as deepface_recognition, NoTempFiles():
+        same = deepface_recognition.verify_faces_deepface(png.tobytes(), solid_image(100))
+        different = deepface_recognition.verify_faces_deepface(solid_image(10), solid_image(240))
+        broken = deepface_recognition.verify_faces_deepface(b'not an image', solid_image(100))
+
+    assert same['verified'] and same['distance'] == 0 and same['similarity'] == 100
+    assert not different['verified'] and different['similarity'] <= 79
+    assert broken is None
+    assert all(isinstance(value, np.ndarray) for value in StubDeepFace.inputs)
+    print("✅ Verification ran on decoded arrays")
+
+if __name__ == "__main__":
+    test_encoding_inputs()
+    test_verify_inputs()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test script for DeepFace verification against stored embeddings
+Checks the distance metrics, thresholds and similarity mapping with a
+stubbed deepface module
+"""
+
+import numpy as np
+from test_deepface_batch import stubbed_deepface
+
+def test_distances():
+    """Cosine, euclidean and euclidean_l2 match their textbook definitions."""
+    print("🧪 Testing embedding distances...")
+    probe = np.array([3.0, 4.0, 0.0])
+    encodings = np.array([[3.0, 4.0, 0.0], [0.0, 0.0, 2.0], [-6.0, -8.0, 0.0], [0.0, 0.0, 0.0]])
+    with stubbed_deepface() as deepface_recognition:
+        distances = deepface_recognition.embedding_distances
+
+        cosine = distances(probe, encodings, 'cosine')
+        assert np.allclose(cosine[:3], [0.0, 1.0, 2.0])
+        # A zero vector is treated as orthogonal rather than dividing by zero
+        assert np.isclose(cosine[3], 1.0)
+
+        euclidean = distances(probe, encodings, 'euclidean')
+        assert np.allclose(euclidean, [0.0, np.sqrt(29.0), 15.0, 5.0])
+
+        euclidean_l2 = distances(probe, encodings, 'euclidean_l2')
+        assert np.allclose(euclidean_l2[:3], [0.0, np.sqrt(2.0), 2.0])
+
+        try:
+            distances(probe, encodings, 'manhattan')
+            assert False, "unsupported metric accepted"
+        except ValueError:
+            pass
+    print("✅ Distances correct, unknown metric rejected")
+
+def test_thresholds_and_similarity():
+    """Thresholds fall back to DeepFace's table and scores agree with the verdict."""
+    print("\n🎯 Testing thresholds and similarity...")
+    with stubbed_deepface() as deepface_recognition:
+        find_threshold = deepface_recognition.find_threshold_deepface
+        similarity = deepface_recognition.similarity_from_distance
+
+        # The stub has no deepface.modules, so the built-in table is used
+        assert find_threshold('Facenet', 'cosine') == 0.40
+        assert find_threshold('ArcFace', 'euclidean_l2') == 1.13
+        assert find_threshold('UnknownModel', 'cosine') == 0.4
+
+        assert similarity(0.0, 0.4) == 100
+        assert similarity(0.39, 0.4) == 80
+        assert similarity(0.4, 0.4) == 80
+        assert np.isclose(similarity(0.41, 0.4), 59)
+        assert similarity(0.1, 0.05) == 79
+        assert similarity(1.5, 0.4) == 0
+    print("✅ Thresholds found, similarity clamped to the verdict")
+
+def test_verify_encodings():
+    """Stored embeddings are verified without running the model."""
+    print("\n🔍 Testing verification of stored embeddings...")
+    probe = np.array([1.0, 0.0], dtype=np.float32)
+    encodings = [np.array([1.0, 0.1], dtype=np.float32), np.array([0.0, 1.0], dtype=np.float32)]
+    with stubbed_deepface() as deepface_recognition:
+        results = deepface_recognition.verify_encodings_deepface(probe, encodings, 'Facenet')
+        assert deepface_recognition.verify_encodings_deepface(probe, [], 'Facenet') == []
+
+    assert [result['verified'] for result in results] == [True, False]
+    assert results[0]['similarity'] >= 80 and results[1]['similarity'] <= 79
+    assert all(result['threshold'] == 0.40 and result['model'] == 'Facenet' for result in results)
+    assert np.isclose(results[1]['distance'], 1.0)
+    print("✅ Match and non-match verified")
+
+if __name__ == "__main__":
+    test_distances()
+    test_thresholds_and_similarity()
+    test_verify_encodings()
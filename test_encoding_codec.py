@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for the binary face encoding format
+Covers round trips, legacy base64 rows and the online migration
+"""
+
+import base64
+import os
+import sqlite3
+import tempfile
+import numpy as np
+import encoding_codec
+from encoding_codec import (encode_encoding, decode_encoding, read_header,
+                            describe_encoding, migrate_base64_encodings)
+
+def test_round_trip():
+    """Encodings survive a round trip and decode as zero-copy views."""
+    print("🧪 Testing binary round trip...")
+    vector = np.random.default_rng(0).random(6656).astype(np.float32)
+    blob = encode_encoding(vector, 'OpenCV-LBP', normalized=True)
+
+    header = read_header(blob)
+    assert header.model_name == 'OpenCV-LBP'
+    assert header.dimension == 6656
+    assert header.normalized
+    assert header.offset % 4 == 0
+
+    decoded = decode_encoding(blob)
+    assert np.array_equal(decoded, vector)
+    assert not decoded.flags.owndata and not decoded.flags.writeable
+    assert len(blob) < len(base64.b64encode(vector.tobytes()))
+    print(f"✅ {len(blob)} bytes vs {len(base64.b64encode(vector.tobytes()))} as base64")
+
+def test_float16_and_legacy():
+    """float16 storage and legacy base64 TEXT both decode."""
+    vector = np.linspace(-1, 1, 128).astype(np.float32)
+    half = decode_encoding(encode_encoding(vector, 'Facenet', dtype=np.float16))
+    assert half.dtype == np.float16
+    assert np.allclose(half, vector, atol=1e-3)
+
+    legacy = base64.b64encode(vector.tobytes()).decode('utf-8')
+    assert np.array_equal(decode_encoding(legacy), vector)
+    assert describe_encoding(legacy).model_name == 'Facenet'
+    assert decode_encoding('not base64!') is None
+    assert decode_encoding(b'CSFE' + b'\0' * 4) is None
+
+def test_migration():
+    """Base64 rows are converted in batches and reruns are no-ops."""
+    print("\n🗄️  Testing base64 -> BLOB migration...")
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE children (id INTEGER PRIMARY KEY, face_encoding TEXT)')
+    vectors = {}
+    for child_id in range(1, 8):
+        vectors[child_id] = np.full(16, child_id, dtype=np.float32)
+        conn.execute('INSERT INTO children VALUES (?, ?)',
+                     (child_id, base64.b64encode(vectors[child_id].tobytes()).decode('utf-8')))
+    conn.execute('INSERT INTO children VALUES (8, NULL)')
+    conn.commit()
+
+    assert migrate_base64_encodings(conn, batch_size=3) == 7
+    assert migrate_base64_encodings(conn, batch_size=3) == 0
+
+    for child_id, value, kind in conn.execute('SELECT id, face_encoding, typeof(face_encoding) FROM children'):
+        if child_id in vectors:
+            assert kind == 'blob'
+            assert np.array_equal(decode_encoding(value), vectors[child_id])
+    print("✅ All legacy rows converted")
+
+def test_migration_skips_concurrent_changes():
+    """Rows rewritten while a batch is being converted are left alone and not counted."""
+    print("\n🔀 Testing migration with a concurrent writer...")
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'children.db')
+        conn = sqlite3.connect(database)
+        conn.execute('CREATE TABLE children (id INTEGER PRIMARY KEY, face_encoding TEXT)')
+        for child_id in range(1, 4):
+            conn.execute('INSERT INTO children VALUES (?, ?)', (child_id, base64.b64encode(
+                np.full(16, child_id, dtype=np.float32).tobytes()).decode('utf-8')))
+        conn.commit()
+
+        replacement = encode_encoding(np.zeros(16, dtype=np.float32), 'Facenet')
+        original_encode = encoding_codec.encode_encoding
+
+        def encode_while_another_worker_writes(vector, model_name, **kwargs):
+            # Another worker stores a new encoding for child 2 mid-batch
+            if vector[0] == 2:
+                other = sqlite3.connect(database)
+                other.execute('UPDATE children SET face_encoding = ? WHERE id = 2', (replacement,))
+                other.commit()
+                other.close()
+            return original_encode(vector, model_name, **kwargs)
+
+        encoding_codec.encode_encoding = encode_while_another_worker_writes
+        try:
+            assert migrate_base64_encodings(conn, batch_size=10) == 2
+        finally:
+            encoding_codec.encode_encoding = original_encode
+        assert conn.execute('SELECT face_encoding FROM children WHERE id = 2').fetchone()[0] == replacement
+        conn.close()
+    print("✅ Concurrently changed row kept and not counted")
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_float16_and_legacy()
+    test_migration()
+    test_migration_skips_concurrent_changes()
+    print("\n🎉 Encoding codec tests passed!")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for the memory-mapped encoding store
+Checks that workers map the store read-only and pick up swapped generations
+"""
+
+import sqlite3
+import tempfile
+import numpy as np
+from encoding_codec import encode_encoding
+from encoding_store import EncodingStore, build_encoding_store
+from face_index import create_change_log
+
+def create_database(vectors):
+    """In-memory children table with binary encodings and a change log."""
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE children (id INTEGER PRIMARY KEY, face_encoding TEXT)')
+    create_change_log(conn)
+    for child_id, vec in vectors.items():
+        conn.execute('INSERT INTO children VALUES (?, ?)', (child_id, encode_encoding(vec, 'test')))
+    conn.commit()
+    return conn
+
+def test_build_and_map():
+    """A built store is memory-mapped read-only and searchable."""
+    print("🧪 Testing store build and mapping...")
+    rng = np.random.default_rng(0)
+    vectors = {child_id: rng.normal(size=32).astype(np.float32) for child_id in range(1, 51)}
+    conn = create_database(vectors)
+
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = build_encoding_store(conn, directory)
+        assert manifest['rows'] == 50 and manifest['dimension'] == 32
+
+        store = EncodingStore(directory)
+        assert store.refresh()
+        assert isinstance(store.matrix, np.memmap)
+        assert not store.matrix.flags.writeable
+        assert not store.refresh()
+
+        index = store.to_index()
+        assert index.search(vectors[7], k=1)[0][0] == 7
+
+        # Changes after the build land in the private delta segment
+        index.replace(7, vectors[8])
+        index.append(99, vectors[9])
+        assert isinstance(index._base, np.memmap)
+        assert index.search(vectors[9], k=2)[0][0] in (9, 99)
+        assert 7 in index and len(index) == 51
+        print("✅ Store mapped read-only and updated through the delta")
+
+def test_atomic_swap():
+    """Readers switch to a rebuilt generation without reopening."""
+    print("\n🔁 Testing generation swap...")
+    rng = np.random.default_rng(1)
+    vectors = {child_id: rng.normal(size=16).astype(np.float32) for child_id in range(1, 6)}
+    conn = create_database(vectors)
+
+    with tempfile.TemporaryDirectory() as directory:
+        build_encoding_store(conn, directory)
+        store = EncodingStore(directory)
+        store.refresh()
+        first = store.generation
+
+        conn.execute('INSERT INTO children VALUES (6, ?)', (encode_encoding(vectors[1] * 2, 'test'),))
+        conn.commit()
+        manifest = build_encoding_store(conn, directory)
+
+        assert store.refresh()
+        assert store.generation != first
+        assert len(store.ids) == 6
+        assert store.change_version == manifest['change_version']
+        print("✅ New generation picked up")
+
+if __name__ == "__main__":
+    test_build_and_map()
+    test_atomic_swap()
+    print("\n🎉 Encoding store tests passed!")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test script for the face enrollment queue
+Checks claiming, completion, retries and superseded photos
+"""
+
+import os
+import sqlite3
+import tempfile
+import cv2
+import numpy as np
+from migrations import migrate
+from encoding_codec import decode_encoding
+from enrollment_queue import (enqueue_enrollment, claim_job, process_job, queue_stats,
+                              QUEUED, DONE, FAILED)
+from test_face_matching import create_test_face_image
+from test_migrations import insert_child
+
+def create_database(picture):
+    """Migrated in-memory database with one child."""
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    insert_child(conn, picture)
+    conn.commit()
+    return conn
+
+def child_status(conn):
+    return conn.execute('SELECT encoding_status, face_encoding FROM children WHERE id = 1').fetchone()
+
+def test_enroll_photo():
+    """A queued photo is claimed once and its encoding stored."""
+    print("🧪 Testing enrollment job...")
+    with tempfile.TemporaryDirectory() as directory:
+        photo_path = os.path.join(directory, 'child.jpg')
+        cv2.imwrite(photo_path, create_test_face_image())
+        conn = create_database('child.jpg')
+
+        enqueue_enrollment(conn, 1, photo_path)
+        assert child_status(conn)[0] == 'pending'
+
+        job = claim_job(conn, 'test')
+        assert job is not None and job.attempts == 1
+        assert claim_job(conn, 'other') is None
+
+        assert process_job(conn, job)
+        status, encoding = child_status(conn)
+        assert status == 'encoded'
+        assert decode_encoding(encoding) is not None
+        assert queue_stats(conn) == {DONE: 1}
+        print("✅ Photo encoded by the worker")
+
+def test_retry_and_fail():
+    """A failing job is retried with backoff, then marked failed."""
+    print("\n🔁 Testing retries...")
+    conn = create_database('missing.jpg')
+    enqueue_enrollment(conn, 1, '/nonexistent/missing.jpg', max_attempts=2)
+
+    job = claim_job(conn, 'test')
+    assert not process_job(conn, job)
+    assert queue_stats(conn) == {QUEUED: 1}
+    # Backoff keeps the job from being claimed straight away
+    assert claim_job(conn, 'test') is None
+
+    conn.execute('UPDATE enrollment_jobs SET available_at = 0')
+    conn.commit()
+    job = claim_job(conn, 'test')
+    assert job.attempts == 2
+    assert not process_job(conn, job)
+    assert queue_stats(conn) == {FAILED: 1}
+    assert child_status(conn)[0] == 'failed'
+    print("✅ Job retried, then failed")
+
+def test_corrupt_photo():
+    """A photo that cannot be decoded is retried rather than stored as no_face."""
+    print("\n🧩 Testing corrupt photo...")
+    with tempfile.TemporaryDirectory() as directory:
+        photo_path = os.path.join(directory, 'corrupt.jpg')
+        with open(photo_path, 'wb') as f:
+            f.write(b'not an image')
+        conn = create_database('corrupt.jpg')
+        enqueue_enrollment(conn, 1, photo_path, max_attempts=2)
+
+        job = claim_job(conn, 'test')
+        assert not process_job(conn, job)
+        assert queue_stats(conn) == {QUEUED: 1}
+        assert child_status(conn)[0] == 'pending'
+
+        conn.execute('UPDATE enrollment_jobs SET available_at = 0')
+        conn.commit()
+        assert not process_job(conn, claim_job(conn, 'test'))
+        assert queue_stats(conn) == {FAILED: 1}
+        assert child_status(conn) == ('failed', None)
+    print("✅ Corrupt photo retried, then failed")
+
+def test_no_face_photo():
+    """A readable photo without a face completes as no_face."""
+    print("\n🙈 Testing photo without a face...")
+    with tempfile.TemporaryDirectory() as directory:
+        photo_path = os.path.join(directory, 'blank.jpg')
+        cv2.imwrite(photo_path, np.full((200, 200, 3), 128, dtype=np.uint8))
+        conn = create_database('blank.jpg')
+        enqueue_enrollment(conn, 1, photo_path)
+
+        assert process_job(conn, claim_job(conn, 'test'))
+        assert queue_stats(conn) == {DONE: 1}
+        assert child_status(conn) == ('no_face', None)
+    print("✅ Faceless photo marked no_face")
+
+def test_superseded_photo():
+    """Only the newest photo of a child is encoded."""
+    print("\n📸 Testing superseded photo...")
+    conn = create_database('new.jpg')
+    enqueue_enrollment(conn, 1, 'uploads/old.jpg')
+    enqueue_enrollment(conn, 1, 'uploads/new.jpg')
+
+    job = claim_job(conn, 'test')
+    assert job.photo_path == 'uploads/new.jpg'
+    assert claim_job(conn, 'test') is None
+    print("✅ Older job superseded")
+
+def test_expired_lease():
+    """Jobs whose worker died are reclaimed until their attempts run out."""
+    print("\n💥 Testing expired leases...")
+    conn = create_database('crash.jpg')
+    enqueue_enrollment(conn, 1, 'uploads/crash.jpg', max_attempts=2)
+
+    job = claim_job(conn, 'test')
+    # The worker dies without finishing: the lease expires and the job is reclaimed
+    conn.execute('UPDATE enrollment_jobs SET claimed_at = 0')
+    conn.commit()
+    job = claim_job(conn, 'other')
+    assert job is not None and job.attempts == 2
+
+    # It crashes again on its last attempt
+    conn.execute('UPDATE enrollment_jobs SET claimed_at = 0')
+    conn.commit()
+    assert claim_job(conn, 'third') is None
+    assert queue_stats(conn) == {FAILED: 1}
+    assert child_status(conn)[0] == 'failed'
+    print("✅ Crashing job reclaimed once, then failed")
+
+if __name__ == "__main__":
+    test_enroll_photo()
+    test_retry_and_fail()
+    test_corrupt_photo()
+    test_no_face_photo()
+    test_superseded_photo()
+    test_expired_lease()
+    print("\n🎉 Enrollment queue tests passed!")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test script for the in-memory face encoding index
+Checks top-k search against a brute-force comparison
+"""
+
+import base64
+import os
+import sqlite3
+import tempfile
+import numpy as np
+import face_index
+from face_index import FaceIndex, create_change_log, current_change_version, prune_change_log
+
+def create_children_table(conn):
+    """Create a minimal children table with encodings."""
+    conn.execute('CREATE TABLE children (id INTEGER PRIMARY KEY, face_encoding TEXT)')
+
+def test_top_k_matches_brute_force():
+    """Top-k results equal a full sort of cosine similarities."""
+    print("🧪 Testing top-k search...")
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 64)).astype(np.float32)
+    ids = np.arange(1000, 1500)
+    index = FaceIndex.from_rows(zip(ids, vectors))
+
+    probe = vectors[42] + rng.normal(scale=0.01, size=64).astype(np.float32)
+    results = index.search(probe, k=5)
+
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(unit @ (probe / np.linalg.norm(probe)))[::-1][:5]
+    assert [child_id for child_id, _ in results] == [int(ids[i]) for i in expected]
+    assert results[0][0] == 1042
+    assert abs(results[0][1] - 1.0) < 1e-3
+    print("✅ Top-k search matches brute force")
+
+def test_from_database():
+    """Encodings are loaded from base64 TEXT and mismatched sizes skipped."""
+    print("\n🗄️  Testing index load from database...")
+    conn = sqlite3.connect(':memory:')
+    create_children_table(conn)
+    rng = np.random.default_rng(1)
+    for child_id in range(1, 4):
+        encoding = rng.random(16).astype(np.float32)
+        conn.execute('INSERT INTO children VALUES (?, ?)',
+                     (child_id, base64.b64encode(encoding.tobytes()).decode('utf-8')))
+    conn.execute('INSERT INTO children VALUES (4, ?)',
+                 (base64.b64encode(np.ones(8, dtype=np.float32).tobytes()).decode('utf-8'),))
+    conn.execute('INSERT INTO children VALUES (5, NULL)')
+
+    index = FaceIndex.from_database(conn)
+    assert len(index) == 3
+    assert index.dimension == 16
+    assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0)
+    print("✅ Index built from database rows")
+
+def test_empty_and_mismatched_probe():
+    """Empty indexes and wrong-sized probes return no results."""
+    assert FaceIndex().search(np.ones(4)) == []
+    index = FaceIndex.from_rows([(1, np.ones(4, dtype=np.float32))])
+    assert index.search(np.ones(3)) == []
+    assert index.search(np.ones(4), k=10) == [(1, 1.0)]
+
+def test_append_replace_remove():
+    """Incremental updates are visible to search without a rebuild."""
+    print("\n✏️  Testing incremental updates...")
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(40, 8)).astype(np.float32)
+    index = FaceIndex()
+    for child_id, vec in enumerate(vectors[:20]):
+        assert index.append(child_id, vec)
+    assert len(index) == 20 and index.dimension == 8
+
+    index.replace(3, vectors[30])
+    assert index.search(vectors[30], k=1)[0][0] == 3
+
+    index.remove(3)
+    assert 3 not in index
+    assert all(child_id != 3 for child_id, _ in index.search(vectors[30], k=20))
+    assert index.tombstones == 1
+
+    index.compact()
+    assert index.tombstones == 0 and len(index) == 19
+    assert index.search(vectors[5], k=1)[0][0] == 5
+
+    assert not index.append(99, np.ones(3, dtype=np.float32))
+    print("✅ Append, replace and remove work in place")
+
+def test_sync_applies_delta():
+    """A second index catches up from the change log only."""
+    print("\n🔄 Testing change-log sync...")
+    conn = sqlite3.connect(':memory:')
+    create_children_table(conn)
+    create_change_log(conn)
+
+    def store(child_id, vec):
+        conn.execute('UPDATE children SET face_encoding = ? WHERE id = ?',
+                     (base64.b64encode(vec.tobytes()).decode('utf-8'), child_id))
+
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(5, 8)).astype(np.float32)
+    for child_id in range(1, 4):
+        conn.execute('INSERT INTO children (id) VALUES (?)', (child_id,))
+        store(child_id, vectors[child_id])
+    conn.commit()
+
+    index = FaceIndex.from_database(conn)
+    assert len(index) == 3
+    assert index.version == current_change_version(conn)
+
+    conn.execute('INSERT INTO children (id) VALUES (4)')
+    store(4, vectors[4])
+    store(1, vectors[0])
+    conn.execute('DELETE FROM children WHERE id = 2')
+    conn.commit()
+
+    assert index.sync(conn)
+    assert sorted(child_id for child_id, _ in index.search(vectors[0], k=10)) == [1, 3, 4]
+    assert index.search(vectors[0], k=1)[0][0] == 1
+    assert index.version == current_change_version(conn)
+    print("✅ Only the delta was applied")
+
+def test_memmap_removals_do_not_recompact():
+    """Removing base rows of a memory-mapped index does not compact on every call."""
+    print("\n🗺️ Testing removals from a memory-mapped base...")
+    rng = np.random.default_rng(4)
+    count = face_index.COMPACT_MIN_TOMBSTONES * 4
+    vectors = rng.normal(size=(count, 8)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'matrix.f32')
+        mapped = np.memmap(path, dtype=np.float32, mode='w+', shape=vectors.shape)
+        mapped[:] = vectors
+        mapped.flush()
+        index = FaceIndex(np.arange(count), np.memmap(path, dtype=np.float32, mode='r', shape=vectors.shape))
+
+        compactions = []
+        original_compact = index.compact
+        index.compact = lambda: (compactions.append(1), original_compact())
+        for child_id in range(count // 2):
+            assert index.remove(child_id)
+        assert not compactions
+        assert len(index) == count // 2
+        assert index.search(vectors[-1], k=1)[0][0] == count - 1
+
+        # Delta tombstones are still compacted
+        for child_id in range(count, count + 2 * face_index.COMPACT_MIN_TOMBSTONES):
+            index.append(child_id, vectors[child_id % count])
+        for child_id in range(count, count + 2 * face_index.COMPACT_MIN_TOMBSTONES):
+            index.remove(child_id)
+        assert compactions
+        del index, mapped
+    print("✅ Only delta tombstones trigger compaction")
+
+def test_prune_change_log():
+    """Old change-log entries are deleted, keeping the newest version."""
+    print("\n✂️ Testing change-log pruning...")
+    conn = sqlite3.connect(':memory:')
+    create_children_table(conn)
+    create_change_log(conn)
+    for child_id in range(1, 6):
+        conn.execute('INSERT INTO children (id, face_encoding) VALUES (?, ?)', (child_id, 'x'))
+    conn.execute("UPDATE face_index_changes SET changed_at = datetime('now', '-2 days')")
+    conn.execute('INSERT INTO children (id, face_encoding) VALUES (6, ?)', ('x',))
+    conn.commit()
+    latest = current_change_version(conn)
+
+    prune_change_log(conn)
+    assert conn.execute('SELECT COUNT(*) FROM face_index_changes').fetchone()[0] == 1
+    assert current_change_version(conn) == latest
+
+    conn.execute("UPDATE face_index_changes SET changed_at = datetime('now', '-2 days')")
+    prune_change_log(conn)
+    assert current_change_version(conn) == latest
+    print("✅ Old entries pruned, version kept")
+
+if __name__ == "__main__":
+    test_top_k_matches_brute_force()
+    test_from_database()
+    test_empty_and_mismatched_probe()
+    test_append_replace_remove()
+    test_sync_applies_delta()
+    test_memmap_removals_do_not_recompact()
+    test_prune_change_log()
+    print("\n🎉 Face index tests passed!")
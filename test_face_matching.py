@@ -6,7 +6,7 @@ Tests if the same photo can match itself with high confidence
 
 import cv2
 import numpy as np
-from opencv_face_recognition import extract_face_features_opencv, compare_faces_opencv
+from opencv_face_recognition import extract_face_features_opencv, compare_faces_opencv, compare_faces_opencv_batch
 import os
 
 def create_test_face_image():
@@ -128,6 +128,36 @@ def test_with_real_photo():
         print("No uploads folder found")
         return True
 
+def test_batch_matches_scalar():
+    """Batched scores must match compare_faces_opencv row by row."""
+    print("\n📦 Testing batched comparison...")
+    
+    rng = np.random.default_rng(0)
+    probe = rng.random(512).astype(np.float32)
+    probe /= np.linalg.norm(probe)
+    candidates = rng.random((64, 512)).astype(np.float32)
+    candidates /= np.linalg.norm(candidates, axis=1, keepdims=True)
+    
+    # Edge cases: identical, all-zero (no cosine) and constant (no correlation) rows
+    candidates[0] = probe
+    candidates[1] = 0
+    candidates[2] = 0.05
+    
+    batch_scores = compare_faces_opencv_batch(probe, candidates)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scalar_scores = np.array([compare_faces_opencv(probe, c) for c in candidates])
+    
+    max_error = np.abs(batch_scores - scalar_scores).max()
+    print(f"Max difference from scalar scores: {max_error:.2e}")
+    assert max_error < 1e-3
+    
+    # Candidates longer than the probe are truncated like the scalar version
+    longer = np.hstack([candidates[:4], np.ones((4, 8), dtype=np.float32)])
+    assert np.allclose(compare_faces_opencv_batch(probe, longer), scalar_scores[:4], atol=1e-3)
+    
+    print("✅ Batched comparison matches the scalar function")
+    return True
+
 def main():
     """Run all face matching tests."""
     print("🎯 Face Recognition Accuracy Test")
@@ -139,20 +169,24 @@ def main():
     # Test 2: Real photo matching
     test2_passed = test_with_real_photo()
     
+    # Test 3: Batched comparison
+    test3_passed = test_batch_matches_scalar()
+    
     # Summary
     print("\n" + "=" * 40)
     print("📊 Test Results:")
     print(f"Same image matching: {'✅ PASS' if test1_passed else '❌ FAIL'}")
     print(f"Real photo matching: {'✅ PASS' if test2_passed else '❌ FAIL'}")
+    print(f"Batched comparison: {'✅ PASS' if test3_passed else '❌ FAIL'}")
     
-    if test1_passed and test2_passed:
+    if test1_passed and test2_passed and test3_passed:
         print("\n🎉 Face recognition is working accurately!")
         print("The system should now be able to match the same person reliably.")
     else:
         print("\n⚠️ Face recognition needs further improvement.")
         print("Consider using the original face_recognition library for better accuracy.")
     
-    return test1_passed and test2_passed
+    return test1_passed and test2_passed and test3_passed
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for image decoding
+Checks the reduced-resolution decode flags and full-resolution decoding
+"""
+
+import os
+import tempfile
+import cv2
+import numpy as np
+from image_io import load_image, reduced_decode_flag
+
+def make_image(width, height):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+def encode(image, ext):
+    ok, data = cv2.imencode(ext, image)
+    assert ok
+    return data.tobytes()
+
+def test_flag_choice():
+    """JPEGs pick the largest reduction that keeps the long side >= target."""
+    print("\n🎚️ Testing reduced decode flags...")
+    assert reduced_decode_flag('JPEG', (6400, 4800), 800) == cv2.IMREAD_REDUCED_COLOR_8
+    assert reduced_decode_flag('JPEG', (6399, 4800), 800) == cv2.IMREAD_REDUCED_COLOR_4
+    assert reduced_decode_flag('JPEG', (3200, 2400), 800) == cv2.IMREAD_REDUCED_COLOR_4
+    assert reduced_decode_flag('JPEG', (1600, 1200), 800) == cv2.IMREAD_REDUCED_COLOR_2
+    assert reduced_decode_flag('JPEG', (1200, 1599), 800) == cv2.IMREAD_COLOR
+    assert reduced_decode_flag('JPEG', (800, 600), 800) == cv2.IMREAD_COLOR
+    # Only JPEG can be reduced while decoding
+    assert reduced_decode_flag('PNG', (6400, 4800), 800) == cv2.IMREAD_COLOR
+    assert reduced_decode_flag(None, None, 800) == cv2.IMREAD_COLOR
+    assert reduced_decode_flag('JPEG', (6400, 4800), None) == cv2.IMREAD_COLOR
+    print("✅ 1/8, 1/4, 1/2 and full decodes chosen by size and format")
+
+def test_reduced_and_full_decode():
+    """Large JPEGs decode at reduced size unless target_size is None."""
+    print("\n🖼️ Testing reduced and full-resolution decoding...")
+    image = make_image(1700, 1000)
+    jpeg = encode(image, '.jpg')
+
+    reduced = load_image(jpeg, target_size=800)
+    assert reduced.shape == (500, 850, 3)
+    full = load_image(jpeg, target_size=None)
+    assert full.shape == image.shape
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'photo.jpg')
+        with open(path, 'wb') as f:
+            f.write(jpeg)
+        assert load_image(path, target_size=800).shape == reduced.shape
+        assert load_image(path, target_size=None).shape == image.shape
+
+    png = encode(image, '.png')
+    assert np.array_equal(load_image(png, target_size=800), image)
+    print("✅ JPEG reduced by 1/2, PNG and target_size=None decoded in full")
+
+def test_ndarray_and_bad_input():
+    """Decoded arrays pass through unchanged; undecodable data returns None."""
+    print("\n📦 Testing ndarray and invalid input...")
+    image = make_image(64, 48)
+    assert load_image(image) is image
+    assert load_image(b'not an image') is None
+    print("✅ ndarray returned as is, invalid bytes give None")
+
+if __name__ == "__main__":
+    test_flag_choice()
+    test_reduced_and_full_decode()
+    test_ndarray_and_bad_input()
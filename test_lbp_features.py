@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script for the vectorized LBP implementation
+Checks that codes are bit-identical to the original per-pixel loop
+"""
+
+import numpy as np
+from lbp_features import (local_binary_pattern, uniform_lbp_histogram,
+                          lbp_histogram, multiscale_lbp_histogram)
+
+def reference_local_binary_pattern(image, radius=1, n_points=8):
+    """Original per-pixel LBP loop from extract_face_features_opencv."""
+    h, w = image.shape
+    lbp_image = np.zeros((h, w), dtype=np.int64)
+
+    for i in range(radius, h - radius):
+        for j in range(radius, w - radius):
+            center = image[i, j]
+            binary_string = ''
+
+            for k in range(n_points):
+                angle = 2 * np.pi * k / n_points
+                x = int(i + radius * np.cos(angle))
+                y = int(j + radius * np.sin(angle))
+
+                if 0 <= x < h and 0 <= y < w:
+                    binary_string += '1' if image[x, y] >= center else '0'
+                else:
+                    binary_string += '0'
+
+            lbp_image[i, j] = int(binary_string, 2)
+
+    return lbp_image
+
+def test_matches_reference():
+    """Vectorized codes must equal the original loop for every pixel."""
+    print("🧪 Testing LBP codes against the reference loop...")
+    rng = np.random.default_rng(0)
+
+    for radius, n_points in [(1, 8), (2, 8), (2, 16), (3, 12)]:
+        image = rng.integers(0, 256, size=(40, 37), dtype=np.uint8)
+        expected = reference_local_binary_pattern(image, radius, n_points)
+        actual = local_binary_pattern(image, radius, n_points)
+        assert np.array_equal(actual.astype(np.int64), expected), (radius, n_points)
+        print(f"✅ radius={radius}, n_points={n_points} is bit-identical")
+
+    # Flat regions exercise the ">=" tie handling
+    flat = np.full((16, 16), 128, dtype=np.uint8)
+    assert np.array_equal(local_binary_pattern(flat).astype(np.int64),
+                          reference_local_binary_pattern(flat))
+
+def test_default_output_dtype():
+    """Default 8-point codes stay uint8 so cv2.calcHist keeps working."""
+    image = np.zeros((128, 128), dtype=np.uint8)
+    assert local_binary_pattern(image).dtype == np.uint8
+    assert local_binary_pattern(image, 2, 16).dtype == np.uint16
+
+def test_histograms():
+    """Histogram helpers count every pixel exactly once."""
+    print("\n📊 Testing LBP histograms...")
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, size=(64, 64), dtype=np.uint8)
+    codes = local_binary_pattern(image)
+
+    full = lbp_histogram(codes)
+    uniform = uniform_lbp_histogram(codes)
+    assert full.shape == (256,)
+    assert uniform.shape == (59,)
+    assert full.sum() == uniform.sum() == image.size
+
+    multi = multiscale_lbp_histogram(image, scales=((1, 8), (2, 16)))
+    assert multi.shape == (59 + 243,)
+    print("✅ Uniform and multi-scale histograms have the expected bins")
+
+if __name__ == "__main__":
+    test_matches_reference()
+    test_default_output_dtype()
+    test_histograms()
+    print("\n🎉 LBP tests passed!")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for pipeline instrumentation
+Checks stage histograms, the Prometheus output and per-request traces
+"""
+
+import json
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from flask import Flask
+import metrics
+from metrics import Histogram, stage_timer, timed, count_event
+
+def test_histogram():
+    """Observations land in cumulative buckets."""
+    print("🧪 Testing histogram buckets...")
+    histogram = Histogram(buckets=(0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 3.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(0.01, 2), (0.1, 3), (float('inf'), 4)]
+    assert histogram.count == 4 and abs(histogram.sum - 3.065) < 1e-9
+    print("✅ Buckets are cumulative")
+
+def test_timers_and_render():
+    """Context manager, decorator and counters show up in /metrics text."""
+    print("\n⏱️ Testing timers and Prometheus output...")
+    metrics.metrics.reset()
+
+    @timed('unit_decorated')
+    def work():
+        time.sleep(0.002)
+        return 42
+
+    with stage_timer('unit_block'):
+        assert work() == 42
+    count_event('unit_event', 2)
+    metrics.metrics.register_collector('unit', lambda: {'hits': 3, 'name': 'ignored'})
+
+    text = metrics.metrics.render()
+    assert 'childsafe_stage_duration_seconds_count{stage="unit_decorated"} 1' in text
+    assert 'childsafe_stage_duration_seconds_bucket{stage="unit_block",le="+Inf"} 1' in text
+    assert 'childsafe_events_total{event="unit_event"} 2' in text
+    assert 'childsafe_unit_hits 3' in text and 'ignored' not in text
+    del metrics.metrics.collectors['unit']
+    print("✅ Stages, events and gauges exported")
+
+def test_disabled_timer_is_shared_noop():
+    """Disabled instrumentation records nothing."""
+    print("\n🔇 Testing disabled instrumentation...")
+    metrics.metrics.reset()
+    metrics.ENABLED = False
+    try:
+        assert stage_timer('a') is stage_timer('b')
+        with stage_timer('a'):
+            pass
+    finally:
+        metrics.ENABLED = True
+    assert 'stage="a"' not in metrics.metrics.render()
+    print("✅ No-op timer used")
+
+def test_request_trace():
+    """Each request is logged as JSON with its stage timings."""
+    print("\n📝 Testing per-request log line...")
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    metrics.init_app(app)
+
+    @app.route('/work')
+    def work():
+        with stage_timer('unit_request_stage'):
+            pass
+        return 'ok'
+
+    output = StringIO()
+    with redirect_stdout(output):
+        assert app.test_client().get('/work').status_code == 200
+    record = json.loads(output.getvalue().strip().splitlines()[-1])
+    assert record['endpoint'] == 'work' and record['status'] == 200
+    assert 'unit_request_stage' in record['stages_ms']
+
+    response = app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert 'childsafe_request_duration_seconds_count{endpoint="work",status="200"}' in response.get_data(as_text=True)
+    print("✅ Request logged and exported")
+
+if __name__ == "__main__":
+    test_histogram()
+    test_timers_and_render()
+    test_disabled_timer_is_shared_noop()
+    test_request_trace()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test script for the schema migration runner
+Checks fresh databases, legacy upgrades and the recorded schema version
+"""
+
+import sqlite3
+from migrations import SCHEMA_VERSION, ensure_schema, migrate, schema_version
+
+def insert_child(conn, picture, huduma_number='H1', first_name='A'):
+    """Insert a child with placeholder details; shared by the queue and bulk enrollment tests."""
+    conn.execute("INSERT INTO children (first_name, huduma_number, dob, mother_first_name, mother_last_name, "
+                 "father_first_name, father_last_name, mother_contact, father_contact, county, sub_county, "
+                 "ward, picture) VALUES (?, ?, '2015-01-01', 'M', 'N', 'F', 'G', '1', '2', 'c', 's', 'w', ?)",
+                 (first_name, huduma_number, picture))
+
+def index_names(conn):
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")
+    return {row[0] for row in cursor.fetchall()}
+
+def test_fresh_database():
+    """A new database is migrated to the latest version with its indexes."""
+    print("🧪 Testing fresh database migration...")
+    conn = sqlite3.connect(':memory:')
+    assert schema_version(conn) == 0
+
+    applied = migrate(conn)
+    assert applied == list(range(1, SCHEMA_VERSION + 1))
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert {'idx_children_location', 'idx_children_dob', 'idx_children_last_name',
+            'idx_users_is_admin', 'idx_children_with_encoding'} <= index_names(conn)
+
+    # Current schema: nothing to do
+    assert not ensure_schema(conn)
+    assert migrate(conn) == []
+    print("✅ Fresh database migrated")
+
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id, face_encoding FROM children "
+                        "WHERE face_encoding IS NOT NULL").fetchall()
+    assert any('idx_children_with_encoding' in row[-1] for row in plan)
+    print("✅ Encoded rows use the partial index")
+
+def test_legacy_database():
+    """A database from the old create_database.py keeps its data."""
+    print("\n🔁 Testing legacy database upgrade...")
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE children (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, first_name TEXT, last_name TEXT,
+            huduma_number TEXT UNIQUE NOT NULL, dob DATE NOT NULL,
+            mother_first_name TEXT NOT NULL, mother_last_name TEXT NOT NULL,
+            father_first_name TEXT NOT NULL, father_last_name TEXT NOT NULL,
+            mother_contact TEXT NOT NULL, father_contact TEXT NOT NULL,
+            county TEXT NOT NULL, sub_county TEXT NOT NULL, ward TEXT NOT NULL,
+            picture TEXT NOT NULL
+        )
+    ''')
+    insert_child(conn, 'p.jpg')
+    conn.commit()
+
+    assert ensure_schema(conn)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(children)')}
+    assert {'gender', 'face_encoding'} <= columns
+    assert conn.execute('SELECT first_name FROM children').fetchone()[0] == 'A'
+    assert schema_version(conn) == SCHEMA_VERSION
+    print("✅ Legacy database upgraded in place")
+
+if __name__ == "__main__":
+    test_fresh_database()
+    test_legacy_database()
+    print("\n🎉 Migration tests passed!")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test script for the process-wide model registry
+Checks that models load once and are reused afterwards
+"""
+
+import threading
+from model_registry import ModelRegistry, registry, HAAR
+
+def test_loads_once():
+    """A shared model is loaded on first use and reused afterwards."""
+    print("🧪 Testing shared model reuse...")
+    calls = []
+    models = ModelRegistry()
+    models.register('dummy', lambda: calls.append(1) or object())
+
+    first = models.get('dummy')
+    assert models.get('dummy') is first
+    assert len(calls) == 1
+
+    stats = models.stats()['dummy']
+    assert stats['loads'] == 1 and stats['reuses'] == 1
+    print("✅ Shared model loaded once")
+
+def test_per_thread_instances():
+    """Per-thread models get one instance per thread."""
+    print("\n🧵 Testing per-thread instances...")
+    models = ModelRegistry()
+    models.register('net', object, per_thread=True)
+
+    main_instance = models.get('net')
+    seen = []
+    worker = threading.Thread(target=lambda: seen.append(models.get('net')))
+    worker.start()
+    worker.join()
+
+    assert seen[0] is not main_instance
+    assert models.get('net') is main_instance
+    assert models.stats()['net']['loads'] == 2
+    print("✅ Each thread has its own instance")
+
+def test_failures_are_cached():
+    """A loader that fails is not retried on every call."""
+    calls = []
+    models = ModelRegistry()
+    models.register('missing', lambda: calls.append(1))
+
+    assert models.get('missing') is None
+    assert models.get('missing') is None
+    assert len(calls) == 1
+    assert models.stats()['missing']['failures'] == 1
+
+    models.reset('missing')
+    models.get('missing')
+    assert len(calls) == 2
+
+def test_haar_cascade_shared():
+    """The global registry hands out a single Haar cascade."""
+    assert registry.get(HAAR) is registry.get(HAAR)
+
+if __name__ == "__main__":
+    test_loads_once()
+    test_per_thread_instances()
+    test_failures_are_cached()
+    test_haar_cascade_shared()
+    print("\n🎉 Model registry tests passed!")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test script for pooled password hashing
+Checks hashing in the process pool, rehash-on-login and queue back-pressure
+"""
+
+from werkzeug.security import generate_password_hash
+from password_hashing import PasswordHasher, HashingBusy, needs_rehash
+
+def test_pool_hash_and_verify():
+    """Hashes made in the pool verify, and wrong passwords don't."""
+    print("🧪 Testing hashing in the process pool...")
+    hasher = PasswordHasher(rounds=4, workers=1)
+    try:
+        password_hash = hasher.hash('correct horse')
+        assert password_hash.startswith('$2b$04$')
+        assert hasher.verify(password_hash, 'correct horse')
+        assert not hasher.verify(password_hash, 'wrong horse')
+
+        long_password = 'x' * 100
+        long_hash = hasher.hash(long_password)
+        assert hasher.verify(long_hash, long_password)
+        assert not hasher.verify(long_hash, 'x' * 99)
+    finally:
+        hasher.shutdown()
+    stats = hasher.stats()
+    assert stats['hashes'] == 2 and stats['verifies'] == 4
+    assert stats['max_seconds'] >= stats['mean_seconds'] > 0
+    print(f"✅ Mean {stats['mean_seconds'] * 1000:.1f} ms per operation")
+
+def test_rehash_on_login():
+    """Old werkzeug hashes and hashes with another cost are replaced."""
+    print("\n🔁 Testing rehash-on-login...")
+    hasher = PasswordHasher(rounds=5, workers=0)
+
+    legacy = generate_password_hash('secret')
+    matched, new_hash = hasher.verify_and_update(legacy, 'secret')
+    assert matched and new_hash.startswith('$2b$05$')
+
+    matched, again = hasher.verify_and_update(new_hash, 'secret')
+    assert matched and again is None
+    assert hasher.verify_and_update(legacy, 'wrong') == (False, None)
+
+    assert needs_rehash(new_hash, rounds=6)
+    assert hasher.stats()['rehashes'] == 1
+    print("✅ Outdated hashes upgraded")
+
+def test_back_pressure():
+    """A full queue turns new requests away after the timeout."""
+    print("\n🚦 Testing queue back-pressure...")
+    hasher = PasswordHasher(rounds=4, workers=0, queue_depth=1, queue_timeout=0.01)
+    hasher._slots.acquire()
+    try:
+        hasher.hash('secret')
+        assert False, "Expected HashingBusy"
+    except HashingBusy:
+        pass
+    finally:
+        hasher._slots.release()
+    assert hasher.stats()['rejected'] == 1
+    assert hasher.verify(hasher.hash('secret'), 'secret')
+    print("✅ Requests rejected while the queue was full")
+
+if __name__ == "__main__":
+    test_pool_hash_and_verify()
+    test_rehash_on_login()
+    test_back_pressure()
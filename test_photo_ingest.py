@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for photo normalisation
+Checks EXIF orientation, downscaling and renditions of uploaded photos
+"""
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from photo_ingest import (normalize_photo, canonical_path, pipeline_photo_path, remove_derivatives,
+                          resize_photo, resized_path)
+
+def save_rotated_jpeg(path, width, height, orientation):
+    """Landscape JPEG whose EXIF tag says to display it rotated."""
+    image = Image.new('RGB', (width, height), (200, 30, 30))
+    # Mark the left edge so the rotation direction can be checked
+    image.paste((20, 20, 220), (0, 0, width // 10, height))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    image.save(path, 'JPEG', quality=90, exif=exif)
+
+def test_canonical_image():
+    """Large rotated JPEGs are turned upright and downscaled."""
+    print("\n🖼️ Testing canonical image...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        save_rotated_jpeg(os.path.join(upload_folder, 'child.jpeg'), 3000, 2000, orientation=6)
+        path = normalize_photo(upload_folder, 'child.jpeg', canonical_size=800)
+        assert path == canonical_path(upload_folder, 'child.jpeg')
+        assert path.endswith(os.path.join('canonical', 'child.jpg'))
+
+        with Image.open(path) as canonical:
+            # Orientation 6 rotates 90° clockwise, so the photo becomes portrait
+            assert canonical.size == (533, 800), canonical.size
+            assert canonical.format == 'JPEG'
+            assert 0x0112 not in canonical.getexif()
+            # The blue left edge is now at the top
+            r, g, b = canonical.convert('RGB').getpixel((canonical.width // 2, 5))
+            assert b > 150 and r < 100
+        print("✅ Rotated upright, 800px canonical")
+
+def test_renditions_from_canonical():
+    """Small renditions are made from the canonical image, which serves widths it already fits."""
+    print("\n📐 Testing renditions of the canonical image...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        save_rotated_jpeg(os.path.join(upload_folder, 'child.jpeg'), 3000, 2000, orientation=6)
+        canonical = normalize_photo(upload_folder, 'child.jpeg')
+
+        small = resize_photo(upload_folder, 'child.jpeg', 200)
+        assert small == resized_path(upload_folder, 'child.jpeg', 200)
+        with Image.open(small) as image:
+            # Made from the upright canonical image, not the landscape original
+            assert image.size == (200, 300), image.size
+
+        # The 533px-wide canonical image is already narrow enough for 800
+        assert resize_photo(upload_folder, 'child.jpeg', 800) == canonical
+        assert not os.path.exists(resized_path(upload_folder, 'child.jpeg', 800))
+        print("✅ 200px rendition made from the canonical image, which is reused at 800px")
+
+def test_concurrent_renditions():
+    """Threads making the same new rendition each get a complete file."""
+    print("\n🧵 Testing concurrent renditions...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        save_rotated_jpeg(os.path.join(upload_folder, 'child.jpeg'), 3000, 2000, orientation=1)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            paths = list(pool.map(lambda _: resize_photo(upload_folder, 'child.jpeg', 400), range(16)))
+
+        assert paths == [resized_path(upload_folder, 'child.jpeg', 400)] * 16
+        with Image.open(paths[0]) as image:
+            assert image.width == 400
+        # No temp files left behind
+        assert os.listdir(os.path.dirname(paths[0])) == ['child.jpg']
+        print("✅ Every thread got the rendition")
+
+def test_pipeline_photo_path():
+    """The face pipeline reads the canonical image when it exists."""
+    print("\n📂 Testing pipeline photo path...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        original = os.path.join(upload_folder, 'child.png')
+        Image.new('RGB', (100, 100)).save(original)
+        assert pipeline_photo_path(original) == original
+        normalize_photo(upload_folder, 'child.png')
+        assert pipeline_photo_path(original) == canonical_path(upload_folder, 'child.png')
+        remove_derivatives(upload_folder, 'child.png')
+        assert pipeline_photo_path(original) == original
+        assert os.path.exists(original)
+        print("✅ Canonical image used when present, original otherwise")
+
+def test_transparent_and_small_images():
+    """Transparent PNGs are flattened onto white and small images are not enlarged."""
+    print("\n🎨 Testing transparent PNG...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        Image.new('RGBA', (120, 90), (0, 0, 0, 0)).save(os.path.join(upload_folder, 'clear.png'))
+        path = normalize_photo(upload_folder, 'clear.png')
+        with Image.open(path) as canonical:
+            assert canonical.size == (120, 90)
+            r, g, b = canonical.getpixel((60, 45))
+            assert min(r, g, b) > 240
+        print("✅ Flattened onto white at original size")
+
+def test_unreadable_photo():
+    """Files that are not images return None and leave no derivatives."""
+    print("\n🚫 Testing unreadable photo...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        with open(os.path.join(upload_folder, 'notes.jpg'), 'wb') as f:
+            f.write(b'not an image')
+        assert normalize_photo(upload_folder, 'notes.jpg') is None
+        assert not os.path.exists(canonical_path(upload_folder, 'notes.jpg'))
+        print("✅ Unreadable photo skipped")
+
+if __name__ == "__main__":
+    test_canonical_image()
+    test_renditions_from_canonical()
+    test_concurrent_renditions()
+    test_pipeline_photo_path()
+    test_transparent_and_small_images()
+    test_unreadable_photo()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for the probe feature cache
+Checks LRU eviction by size, SQLite persistence and cached extraction
+"""
+
+import os
+import tempfile
+import cv2
+import numpy as np
+import probe_cache
+from probe_cache import ProbeCache, probe_key
+from opencv_face_recognition import extract_face_features_opencv
+from test_face_matching import create_test_face_image
+
+def test_lru_eviction():
+    """Entries are evicted oldest-first once the byte budget is exceeded."""
+    print("🧪 Testing byte-bounded LRU...")
+    vector = np.ones(1000, dtype=np.float32)  # ~4 KB per entry
+    cache = ProbeCache(max_bytes=3 * (vector.nbytes + 400))
+
+    for name in ('a', 'b', 'c'):
+        cache.put(name, vector, (1, 2, 3, 4))
+    assert cache.get('a') is not None  # 'a' is now most recent
+    cache.put('d', vector)
+
+    assert cache.get('b') is None
+    assert cache.get('a').box == (1, 2, 3, 4)
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 3
+    assert stats['bytes'] <= stats['max_bytes']
+    assert stats['hit_rate'] == 2 / 3
+    print("✅ Least recently used entry evicted")
+
+def test_persistence():
+    """A second cache over the same database finds persisted probes."""
+    print("\n💾 Testing SQLite persistence...")
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'probes.db')
+        key = probe_key(b'photo bytes', 'test:1')
+        ProbeCache(database=database).put(key, np.arange(8, dtype=np.float32), (5, 6, 7, 8))
+        ProbeCache(database=database).put(probe_key(b'no face', 'test:1'), None)
+
+        other = ProbeCache(database=database)
+        entry = other.get(key)
+        assert np.array_equal(entry.features, np.arange(8)) and entry.box == (5, 6, 7, 8)
+        assert other.get(probe_key(b'no face', 'test:1')).features is None
+        assert other.get(probe_key(b'photo bytes', 'test:2')) is None
+        assert other.stats()['persisted_hits'] == 2
+        print("✅ Persisted probes shared across caches")
+
+def test_cached_extraction():
+    """Uploading the same bytes twice extracts features once."""
+    print("\n🔁 Testing cached feature extraction...")
+    ok, buffer = cv2.imencode('.jpg', create_test_face_image())
+    data = buffer.tobytes()
+
+    probe_cache._cache = ProbeCache()
+    try:
+        first = extract_face_features_opencv(data)
+        second = extract_face_features_opencv(data)
+        assert first is not None and np.array_equal(first, second)
+        stats = probe_cache.probe_cache_stats()
+        assert stats['misses'] == 1 and stats['hits'] == 1
+        print("✅ Second upload served from the cache")
+    finally:
+        probe_cache._cache = None
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_persistence()
+    test_cached_extraction()
+    print("\n🎉 Probe cache tests passed!")
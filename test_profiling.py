@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test script for request profiling
+Checks slow-request capture, dump rotation and stack sampling
+"""
+
+import os
+import pstats
+import tempfile
+import threading
+import time
+from flask import Flask
+from profiling import ProfileStore, StackSampler, init_app
+
+def test_slow_request_capture():
+    """Only requests over the threshold leave a cProfile dump."""
+    print("🧪 Testing slow-request capture...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = ProfileStore(directory)
+        app = Flask(__name__)
+        app.config.update(PROFILING=True, SLOW_REQUEST_SECONDS=0.05)
+        init_app(app, store)
+
+        @app.route('/fast')
+        def fast():
+            return 'ok'
+
+        @app.route('/slow')
+        def slow():
+            time.sleep(0.06)
+            return 'ok'
+
+        client = app.test_client()
+        client.get('/fast')
+        assert store.list() == []
+        client.get('/slow')
+        profiles = store.list()
+        assert len(profiles) == 1 and '_slow_' in profiles[0]['name']
+        stats = pstats.Stats(os.path.join(directory, profiles[0]['name']))
+        assert any(function[2] == 'slow' for function in stats.stats)
+    print("✅ Slow request profiled")
+
+def test_rotation():
+    """The store keeps the newest files within its limits."""
+    print("\n🔄 Testing rotation...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = ProfileStore(directory, max_files=3)
+        for i in range(5):
+            def write(path, i=i):
+                with open(path, 'w') as f:
+                    f.write(str(i))
+            store.save(store.new_name(f"dump{i}", 'prof'), write)
+            time.sleep(0.01)
+        names = [profile['name'] for profile in store.list()]
+        assert len(names) == 3 and 'dump4' in names[0]
+        assert store.contains(names[0]) and not store.contains('../' + names[0])
+    print("✅ Oldest dumps removed")
+
+def test_stack_sampler():
+    """Samples see what other threads are running."""
+    print("\n📸 Testing stack sampling...")
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=busy_worker)
+    thread.start()
+    try:
+        sampler = StackSampler(interval=0.001)
+        sampler.run(0.05)
+    finally:
+        stop.set()
+        thread.join()
+    assert sampler.samples > 0
+    assert 'busy_worker' in sampler.folded()
+    print(f"✅ {sampler.samples} samples taken")
+
+if __name__ == "__main__":
+    test_slow_request_capture()
+    test_rotation()
+    test_stack_sampler()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test script for the user role cache
+Checks TTL expiry and role_version checks on role changes
+"""
+
+import sqlite3
+import time
+from migrations import migrate
+from role_cache import RoleCache
+
+def test_ttl():
+    """Cached roles are served until they expire."""
+    print("🧪 Testing role cache TTL...")
+    cache = RoleCache(ttl=0.05)
+    assert cache.get('alice', 0) is None
+    cache.put('alice', True, 0)
+    assert cache.get('alice', 0) is True
+    time.sleep(0.06)
+    assert cache.get('alice', 0) is None
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 2
+    print("✅ Role expired after the TTL")
+
+def test_role_version():
+    """A role change only drops the changed user's entry, in every process."""
+    print("\n🔁 Testing role versions...")
+    # Two workers, each with its own cache
+    worker_a, worker_b = RoleCache(ttl=60), RoleCache(ttl=60)
+    for cache in (worker_a, worker_b):
+        cache.put('alice', True, 3)
+        cache.put('bob', False, 0)
+
+    # Alice is demoted: the database now holds role_version 4 for her
+    assert worker_a.get('alice', 4) is None and worker_b.get('alice', 4) is None
+    assert worker_a.get('bob', 0) is False and worker_b.get('bob', 0) is False
+    worker_b.put('alice', False, 4)
+    assert worker_b.get('alice', 4) is False
+
+    worker_a.invalidate()
+    assert worker_a.get('bob', 0) is None
+    print("✅ Stale version rejected, other users still cached")
+
+def test_role_version_migration():
+    """Existing users start at role_version 0."""
+    print("\n🗄️ Testing role_version migration...")
+    conn = sqlite3.connect(':memory:')
+    migrate(conn, target=5)
+    conn.execute("INSERT INTO users (username, password_hash, is_admin) VALUES ('alice', 'x', 1)")
+    migrate(conn)
+    assert conn.execute('SELECT is_admin, role_version FROM users').fetchone() == (1, 0)
+    print("✅ role_version added")
+
+if __name__ == "__main__":
+    test_ttl()
+    test_role_version()
+    test_role_version_migration()
+    print("\n🎉 Role cache tests passed!")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script for the SQLite session backend
+Checks round-trips, write avoidance, logout and the expiry sweep
+"""
+
+import os
+import tempfile
+import time
+from flask import Flask, session, flash, get_flashed_messages
+from sessions import SqliteSessionInterface
+
+def create_app(database):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = SqliteSessionInterface(database, sweep_interval=3600)
+
+    @app.route('/login')
+    def login():
+        session['username'] = 'alice'
+        flash('Welcome', 'success')
+        return 'ok'
+
+    @app.route('/whoami')
+    def whoami():
+        return session.get('username', '')
+
+    @app.route('/flashes')
+    def flashes():
+        return ','.join(f"{category}:{message}" for category, message in get_flashed_messages(with_categories=True))
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        return 'ok'
+
+    return app
+
+def row_count(interface):
+    with interface.pool.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+def test_session_round_trip():
+    """Sessions are stored server-side and only rewritten when they change."""
+    print("🧪 Testing SQLite sessions...")
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(os.path.join(directory, 'sessions.db'))
+        interface = app.session_interface
+        client = app.test_client()
+
+        assert client.get('/whoami').data == b''
+        assert row_count(interface) == 0  # Empty sessions are not stored
+
+        client.get('/login')
+        assert client.get('/whoami').data == b'alice'
+        assert client.get('/flashes').data == b'success:Welcome'
+        print("✅ Session data round-trips")
+
+        with interface.pool.connection() as conn:
+            before = conn.execute('SELECT expiry FROM sessions').fetchone()[0]
+        client.get('/whoami')
+        with interface.pool.connection() as conn:
+            after = conn.execute('SELECT expiry FROM sessions').fetchone()[0]
+        assert before == after
+        print("✅ Unchanged session not rewritten")
+
+        client.get('/logout')
+        assert row_count(interface) == 0
+        assert client.get('/whoami').data == b''
+        print("✅ Logout removes the session")
+
+def test_sweep():
+    """Expired sessions are ignored and swept."""
+    print("\n🧹 Testing expiry sweep...")
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(os.path.join(directory, 'sessions.db'))
+        interface = app.session_interface
+        client = app.test_client()
+        client.get('/login')
+
+        with interface.pool.connection() as conn:
+            conn.execute('UPDATE sessions SET expiry = ?', (time.time() - 1,))
+            conn.commit()
+        assert client.get('/whoami').data == b''
+        assert interface.sweep() == 1
+        assert row_count(interface) == 0
+        print("✅ Expired session swept")
+
+if __name__ == "__main__":
+    test_session_round_trip()
+    test_sweep()
+    print("\n🎉 Session backend tests passed!")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for upload serving
+Checks ETags, 304 responses, ranges, ?w= renditions and sendfile hand-off
+"""
+
+import os
+import tempfile
+from io import BytesIO
+from flask import Flask, request
+from PIL import Image
+import upload_serving
+from photo_ingest import resize_photo, resized_path, remove_derivatives
+
+def create_app(upload_folder, sendfile=''):
+    app = Flask(__name__)
+    app.config['UPLOAD_SENDFILE'] = sendfile
+    upload_serving.init_app(app)
+
+    @app.route('/uploads/<filename>')
+    def uploaded_file(filename):
+        path = os.path.join(upload_folder, filename)
+        width = upload_serving.pick_width(request.args.get('w', type=int))
+        if width:
+            path = resize_photo(upload_folder, filename, width)
+        return upload_serving.send_upload(path, upload_folder)
+
+    return app
+
+def make_photo(upload_folder, name='child.jpg', size=(1200, 900)):
+    Image.new('RGB', size, (120, 160, 200)).save(os.path.join(upload_folder, name), 'JPEG')
+    return name
+
+def test_etag_and_not_modified():
+    """Photos carry a strong ETag and private caching; revalidation gets a 304."""
+    print("\n🏷️ Testing ETag and 304...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        name = make_photo(upload_folder)
+        client = create_app(upload_folder).test_client()
+
+        response = client.get(f'/uploads/{name}')
+        assert response.status_code == 200
+        etag, weak = response.get_etag()
+        assert etag and not weak
+        assert response.cache_control.private and not response.cache_control.public
+        assert response.cache_control.max_age == upload_serving.UPLOAD_MAX_AGE
+        assert response.mimetype == 'image/jpeg'
+        body = response.get_data()
+        response.close()
+
+        response = client.get(f'/uploads/{name}', headers={'If-None-Match': f'"{etag}"'})
+        assert response.status_code == 304 and response.get_data() == b''
+        response.close()
+
+        response = client.get(f'/uploads/{name}', headers={'Range': 'bytes=0-99'})
+        assert response.status_code == 206 and response.get_data() == body[:100]
+        response.close()
+        print("✅ Strong ETag, 304 on revalidation, 206 on ranges")
+
+def test_resized_renditions():
+    """?w= snaps to an allowed width and the rendition is cached on disk."""
+    print("\n📐 Testing ?w= renditions...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        name = make_photo(upload_folder)
+        client = create_app(upload_folder).test_client()
+        width = upload_serving.pick_width(150)
+        assert width == upload_serving.UPLOAD_WIDTHS[0]
+        assert upload_serving.pick_width(10 ** 6) == upload_serving.UPLOAD_WIDTHS[-1]
+        assert upload_serving.pick_width(0) is None
+
+        response = client.get(f'/uploads/{name}?w=150')
+        assert response.status_code == 200
+        assert Image.open(BytesIO(response.get_data())).width == width
+        etag = response.get_etag()[0]
+        response.close()
+
+        path = resized_path(upload_folder, name, width)
+        mtime = os.path.getmtime(path)
+        response = client.get(f'/uploads/{name}?w=150', headers={'If-None-Match': f'"{etag}"'})
+        assert response.status_code == 304
+        response.close()
+        assert os.path.getmtime(path) == mtime
+
+        remove_derivatives(upload_folder, name)
+        assert not os.path.exists(path)
+        print(f"✅ {width}px rendition cached and reused")
+
+def test_sendfile_handoff():
+    """X-Sendfile and X-Accel-Redirect leave the bytes to the front-end server."""
+    print("\n📤 Testing sendfile hand-off...")
+    with tempfile.TemporaryDirectory() as upload_folder:
+        name = make_photo(upload_folder)
+
+        response = create_app(upload_folder, 'x-accel-redirect').test_client().get(f'/uploads/{name}')
+        assert response.headers['X-Accel-Redirect'] == f"/protected-uploads/{name}"
+        assert response.get_data() == b''
+        etag = response.get_etag()[0]
+        assert response.cache_control.private
+
+        response = create_app(upload_folder, 'x-accel-redirect').test_client().get(
+            f'/uploads/{name}', headers={'If-None-Match': f'"{etag}"'})
+        assert response.status_code == 304
+        assert 'X-Accel-Redirect' not in response.headers
+
+        response = create_app(upload_folder, 'x-sendfile').test_client().get(f'/uploads/{name}')
+        assert response.headers['X-Sendfile'] == os.path.abspath(os.path.join(upload_folder, name))
+        assert response.get_etag()[0] == etag
+
+        try:
+            create_app(upload_folder, 'bogus')
+            assert False, "invalid sendfile mode accepted"
+        except ValueError:
+            pass
+        print("✅ X-Accel-Redirect and X-Sendfile set, conditional requests still answered")
+
+if __name__ == "__main__":
+    test_etag_and_not_modified()
+    test_resized_renditions()
+    test_sendfile_handoff()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script for streamed uploads
+Checks hashing while streaming, spooling to disk and in-place decoding
+"""
+
+import hashlib
+import mmap
+import os
+import tempfile
+from io import BytesIO
+import cv2
+import numpy as np
+from flask import Flask, request
+from image_io import load_image
+from upload_stream import StreamingRequest, HashingSpooledFile, upload_buffer, upload_digest, save_upload
+
+def make_jpeg(size):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+    ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return jpeg.tobytes()
+
+def create_app(results, spool_bytes):
+    app = Flask(__name__)
+
+    class SmallSpoolRequest(StreamingRequest):
+        spool_max_memory = spool_bytes
+    app.request_class = SmallSpoolRequest
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        photo = request.files['photo']
+        results['stream'] = photo.stream
+        results['digest'] = upload_digest(photo)
+        with upload_buffer(photo) as data:
+            results['buffer_type'] = type(data)
+            results['bytes'] = bytes(data)
+            results['image'] = load_image(data, target_size=None)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'copy.jpg')
+            save_upload(photo, path)
+            with open(path, 'rb') as f:
+                results['saved'] = f.read()
+        return 'ok'
+
+    return app
+
+def upload(data, spool_bytes=512 * 1024):
+    results = {}
+    client = create_app(results, spool_bytes).test_client()
+    response = client.post('/upload', data={'photo': (BytesIO(data), 'child.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    return results
+
+def test_small_upload_in_memory():
+    """Small uploads stay in memory and are exposed as a memoryview."""
+    print("🧪 Testing in-memory upload...")
+    data = make_jpeg(64)
+    results = upload(data)
+    assert isinstance(results['stream'], HashingSpooledFile)
+    assert not results['stream'].on_disk
+    assert results['buffer_type'] is memoryview
+    assert results['digest'] == hashlib.sha256(data).hexdigest()
+    assert results['bytes'] == data and results['saved'] == data
+    print("✅ Hashed and decoded from memory")
+
+def test_large_upload_spooled_to_disk():
+    """Large uploads roll over to disk and are decoded from an mmap."""
+    print("\n💾 Testing spooled upload...")
+    data = make_jpeg(600)
+    assert len(data) > 64 * 1024
+    results = upload(data, spool_bytes=64 * 1024)
+    assert results['stream'].on_disk
+    assert results['buffer_type'] is mmap.mmap
+    assert results['digest'] == hashlib.sha256(data).hexdigest()
+    assert results['saved'] == data
+    expected = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    assert np.array_equal(results['image'], expected)
+    print(f"✅ {len(data) // 1024} KB upload decoded in place")
+
+def test_spooled_file_rollover():
+    """Data written across the rollover threshold is kept and hashed whole."""
+    print("\n🔄 Testing spooled file rollover...")
+    chunks = [bytes([i]) * 300 for i in range(4)]
+    with HashingSpooledFile(max_size=1000) as spooled:
+        for chunk in chunks[:3]:
+            spooled.write(chunk)
+        assert not spooled.on_disk and spooled.getbuffer().nbytes == 900
+        spooled.write(chunks[3])
+        assert spooled.on_disk and spooled.tell() == 1200
+        try:
+            spooled.getbuffer()
+            assert False, "getbuffer worked after rollover"
+        except ValueError:
+            pass
+        spooled.seek(0)
+        assert spooled.read() == b''.join(chunks)
+        assert spooled.hexdigest() == hashlib.sha256(b''.join(chunks)).hexdigest()
+
+    with HashingSpooledFile(max_size=1000) as spooled:
+        spooled.write(b'small')
+        # Asking for a file descriptor moves the data to disk, as with SpooledTemporaryFile
+        assert os.read(spooled.fileno(), 0) == b'' and spooled.on_disk
+    print("✅ Rolled over at the threshold without losing data")
+
+if __name__ == "__main__":
+    test_small_upload_in_memory()
+    test_large_upload_spooled_to_disk()
+    test_spooled_file_rollover()
@@ -0,0 +1,134 @@
+"""
+Upload serving for ChildSafe
+Sends uploaded photos and their renditions with strong ETags, Cache-Control
+and conditional/range handling, optionally handing the bytes off to the
+front-end server with X-Sendfile or X-Accel-Redirect
+"""
+
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, current_app, request, send_file
+
+# How long browsers may reuse a photo before revalidating it with its ETag
+UPLOAD_MAX_AGE = int(os.environ.get('CHILDSAFE_UPLOAD_MAX_AGE', 86400))
+# Widths accepted by ?w=; other values snap to the next allowed width
+UPLOAD_WIDTHS = sorted(int(w) for w in os.environ.get('CHILDSAFE_UPLOAD_WIDTHS', '200,400,800').split(',') if w)
+# '' streams from the worker, 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect' (nginx) hand off
+SENDFILE_MODE = os.environ.get('CHILDSAFE_SENDFILE', '').lower()
+# nginx internal location aliased to the upload folder
+ACCEL_REDIRECT_PREFIX = os.environ.get('CHILDSAFE_ACCEL_REDIRECT_PREFIX', '/protected-uploads/')
+
+SENDFILE_MODES = ('', 'x-sendfile', 'x-accel-redirect')
+
+
+def file_etag(path, stat=None):
+    """
+    Strong ETag of a file in the upload folder.
+
+    Uploads and renditions are written to a temporary name and renamed,
+    never modified in place, so a file's inode, size and modification time
+    identify its bytes without reading them.
+
+    Args:
+    - path: File path
+    - stat: os.stat result if already known
+
+    Returns:
+    - ETag value (without quotes)
+    """
+    stat = stat or os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def pick_width(requested):
+    """
+    Allowed rendition width for a ?w= value.
+
+    Only a fixed set of widths is rendered, so arbitrary values cannot fill
+    the disk with renditions.
+
+    Args:
+    - requested: Width asked for by the client
+
+    Returns:
+    - Smallest allowed width >= requested (the largest one if none is), or
+      None if requested is not a positive number
+    """
+    if requested is None or requested <= 0 or not UPLOAD_WIDTHS:
+        return None
+    for width in UPLOAD_WIDTHS:
+        if width >= requested:
+            return width
+    return UPLOAD_WIDTHS[-1]
+
+
+def _apply_cache_headers(response, max_age):
+    # Child photos must not be kept by shared proxies
+    response.cache_control.public = None
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.expires = None
+
+
+def init_app(app):
+    """
+    Configure how uploads are handed to the front-end server.
+
+    Args:
+    - app: Flask application; UPLOAD_SENDFILE in its config overrides CHILDSAFE_SENDFILE
+    """
+    mode = app.config.setdefault('UPLOAD_SENDFILE', SENDFILE_MODE)
+    if mode not in SENDFILE_MODES:
+        raise ValueError(f"CHILDSAFE_SENDFILE must be one of {', '.join(m for m in SENDFILE_MODES if m)} or empty")
+    # Flask's send_file adds X-Sendfile itself when this is set
+    app.config['USE_X_SENDFILE'] = mode == 'x-sendfile'
+
+
+def send_upload(path, upload_folder, max_age=None):
+    """
+    Response for a file under the upload folder.
+
+    If-None-Match/If-Modified-Since get a 304 from the worker in every mode.
+    Otherwise the file is either streamed with Range support or left to the
+    front-end server via X-Sendfile/X-Accel-Redirect.
+
+    Args:
+    - path: File to send; must be inside upload_folder
+    - upload_folder: Root of the uploads (used for X-Accel-Redirect URIs)
+    - max_age: Cache-Control max-age in seconds (default UPLOAD_MAX_AGE)
+
+    Returns:
+    - Flask response
+    """
+    max_age = UPLOAD_MAX_AGE if max_age is None else max_age
+    stat = os.stat(path)
+    etag = file_etag(path, stat)
+
+    if current_app.config.get('UPLOAD_SENDFILE') == 'x-accel-redirect':
+        relative = os.path.relpath(path, upload_folder).replace(os.sep, '/')
+        response = Response(mimetype=_guess_mimetype(path))
+        response.headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        _apply_cache_headers(response, max_age)
+        response = response.make_conditional(request)
+        if response.status_code != 200:
+            # nginx would follow the redirect and turn a 304 back into a 200
+            del response.headers['X-Accel-Redirect']
+        # nginx fills in the body and its length
+        response.headers.pop('Content-Length', None)
+        return response
+
+    response = send_file(path, mimetype=_guess_mimetype(path), conditional=True, etag=etag,
+                         last_modified=stat.st_mtime, max_age=max_age)
+    if response.status_code == 304:
+        response.headers.pop('X-Sendfile', None)
+    _apply_cache_headers(response, max_age)
+    return response
+
+
+def _guess_mimetype(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
@@ -0,0 +1,179 @@
+"""
+Streamed upload handling for ChildSafe
+Spools uploaded files to disk in chunks while hashing them, and hands the
+decoder a memory view or mmap of the spooled data instead of a bytes copy
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+
+from flask import Request
+
+# Uploads up to this size stay in memory; larger ones roll over to a temp file
+SPOOL_MAX_MEMORY = int(os.environ.get('CHILDSAFE_UPLOAD_SPOOL_BYTES', 512 * 1024))
+# Directory for spooled uploads (default: the system temp directory)
+SPOOL_DIR = os.environ.get('CHILDSAFE_UPLOAD_SPOOL_DIR') or None
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class HashingSpooledFile:
+    """
+    Spooled temporary file that hashes the data written to it.
+
+    Werkzeug's multipart parser writes each upload front to back in
+    chunks, so the SHA-256 of the file is known as soon as parsing ends.
+    Data stays in a BytesIO until it grows past max_size and then moves to
+    a temporary file, like tempfile.SpooledTemporaryFile; the class keeps
+    that state itself so upload_buffer can see where the bytes are.
+    """
+
+    def __init__(self, max_size=SPOOL_MAX_MEMORY, dir=SPOOL_DIR):
+        self.max_size = max_size
+        self.dir = dir
+        self.on_disk = False
+        self.size = 0
+        self._file = io.BytesIO()
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        written = self._file.write(data)
+        if self.max_size and not self.on_disk and self._file.tell() > self.max_size:
+            self.rollover()
+        return written
+
+    def rollover(self):
+        """Move the data to a temporary file (once)."""
+        if self.on_disk:
+            return
+        file = tempfile.TemporaryFile(mode='w+b', dir=self.dir)
+        file.write(self._file.getbuffer())
+        file.seek(self._file.tell())
+        self._file.close()
+        self._file = file
+        self.on_disk = True
+
+    def fileno(self):
+        # A file descriptor needs a real file, as with SpooledTemporaryFile
+        self.rollover()
+        return self._file.fileno()
+
+    def getbuffer(self):
+        """Memoryview of the data while it is still in memory."""
+        if self.on_disk:
+            raise ValueError("upload has rolled over to a temporary file")
+        return self._file.getbuffer()
+
+    def hexdigest(self):
+        """SHA-256 of everything written so far."""
+        return self._sha256.hexdigest()
+
+    def __getattr__(self, name):
+        # read, seek, tell, flush, close, ... go to the current file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+
+
+class StreamingRequest(Request):
+    """Request whose file uploads are parsed into HashingSpooledFile objects."""
+
+    spool_max_memory = SPOOL_MAX_MEMORY
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpooledFile(self.spool_max_memory)
+
+
+def upload_digest(file_storage):
+    """
+    SHA-256 of an uploaded file.
+
+    Args:
+    - file_storage: werkzeug FileStorage
+
+    Returns:
+    - Hex digest (computed while the upload streamed in when possible)
+    """
+    stream = file_storage.stream
+    if isinstance(stream, HashingSpooledFile):
+        return stream.hexdigest()
+
+    # Uploads parsed without StreamingRequest: hash in chunks
+    sha256 = hashlib.sha256()
+    position = stream.tell()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(COPY_BUFFER_SIZE), b''):
+        sha256.update(chunk)
+    stream.seek(position)
+    return sha256.hexdigest()
+
+
+@contextmanager
+def upload_buffer(file_storage):
+    """
+    Zero-copy view of an uploaded file's bytes.
+
+    Spooled-to-disk uploads are memory-mapped read-only, so the decoder
+    pages data in from the temp file instead of holding a copy; small
+    in-memory uploads are exposed through a memoryview.
+
+    Args:
+    - file_storage: werkzeug FileStorage
+
+    Yields:
+    - mmap, memoryview or bytes; only valid inside the with block
+    """
+    stream = file_storage.stream
+    if isinstance(stream, HashingSpooledFile):
+        if stream.size == 0:
+            yield b''
+            return
+        if stream.on_disk:
+            stream.flush()
+            buffer = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            release = buffer.close
+        else:
+            buffer = stream.getbuffer()
+            release = buffer.release
+        try:
+            yield buffer
+        finally:
+            try:
+                release()
+            except BufferError:
+                # An array made from the buffer is still alive; the
+                # mapping is released when it is garbage collected
+                pass
+        return
+
+    # Uploads parsed without StreamingRequest
+    position = stream.tell()
+    stream.seek(0)
+    try:
+        yield stream.read()
+    finally:
+        stream.seek(position)
+
+
+def save_upload(file_storage, path):
+    """
+    Copy an upload to its final location in large chunks.
+
+    Args:
+    - file_storage: werkzeug FileStorage
+    - path: Destination file path
+    """
+    file_storage.stream.seek(0)
+    file_storage.save(path, buffer_size=COPY_BUFFER_SIZE)